@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Measures batch serialization and parsing throughput.
+
+Serializes and parses a batch of small messages two ways: one call per message,
+and one batch.SerializeMany() / batch.ParseMany() call.
+
+Usage:
+  $ PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python \
+        python batch_benchmark.py [--count=N] [--repeat=N]
+"""
+
+import optparse
+import timeit
+
+from google.protobuf import batch
+from google.protobuf import unittest_pb2
+
+
+def BuildMessages(count):
+  """Returns count small messages with a few scalar and string fields."""
+  messages = []
+  for i in range(count):
+    message = unittest_pb2.TestAllTypes()
+    message.optional_int32 = i
+    message.optional_int64 = i << 20
+    message.optional_double = i / 3.0
+    message.optional_string = u'message %d' % i
+    message.optional_nested_message.bb = i
+    message.repeated_int32.extend(range(i % 8))
+    messages.append(message)
+  return messages
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--count', type='int', default=20000,
+                    help='Number of messages per batch.')
+  parser.add_option('--repeat', type='int', default=7,
+                    help='Number of timings to take the best of.')
+  options, _ = parser.parse_args()
+
+  messages = BuildMessages(options.count)
+  payloads = [message.SerializeToString() for message in messages]
+  if batch.SerializeMany(messages) != payloads:
+    parser.error('SerializeMany() does not match SerializeToString().')
+
+  def Report(name, function):
+    seconds = min(timeit.repeat(function, number=1, repeat=options.repeat))
+    print('%-28s %10.0f messages/s' % (name, options.count / seconds))
+
+  Report('serialize, loop',
+         lambda: [message.SerializeToString() for message in messages])
+  Report('serialize, SerializeMany', lambda: batch.SerializeMany(messages))
+  Report('parse, loop',
+         lambda: [unittest_pb2.TestAllTypes.FromString(payload)
+                  for payload in payloads])
+  Report('parse, ParseMany',
+         lambda: batch.ParseMany(unittest_pb2.TestAllTypes, payloads))
+
+
+if __name__ == '__main__':
+  main()
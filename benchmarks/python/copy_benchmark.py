@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Times copying a large parsed template with copy.deepcopy() and CopyFrom().
+
+Copies of a message that is clean (parsed, or serialized since it was last
+changed) share its sub-messages and repeated fields until either side changes
+them, so they cost time in the number of fields set at the top level.  Copies
+of a modified template copy every value, which is what any copy cost before.
+Writing to a copy, or to the template while it has copies, pays for the
+values involved at that point.
+
+Usage:
+  $ PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python \
+        python copy_benchmark.py [--number=N] [--elements=N]
+"""
+
+import copy
+import optparse
+import timeit
+
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import test_util
+
+
+def BuildTemplate(elements):
+  """Returns a message holding elements sub-messages with all fields set."""
+  template = unittest_pb2.TestParsingMerge()
+  template.required_all_types.optional_int32 = 1
+  for _ in range(elements):
+    test_util.SetAllFields(template.repeated_all_types.add())
+  return template
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--number', type='int', default=100,
+                    help='Number of copies to time.')
+  parser.add_option('--elements', type='int', default=200,
+                    help='Number of sub-messages in the template.')
+  options, _ = parser.parse_args()
+
+  serialized = BuildTemplate(options.elements).SerializeToString()
+  parsed = unittest_pb2.TestParsingMerge.FromString(serialized)
+  modified = unittest_pb2.TestParsingMerge.FromString(serialized)
+  modified.required_all_types.optional_int32 = 1
+
+  def CopyFrom(template):
+    result = unittest_pb2.TestParsingMerge()
+    result.CopyFrom(template)
+    return result
+
+  def CopyAndChange(template):
+    result = copy.deepcopy(template)
+    result.repeated_all_types[0].optional_int32 = 2
+    return result.SerializeToString()
+
+  def ChangeTemplate():
+    copies = [copy.deepcopy(parsed) for _ in range(10)]
+    parsed.repeated_all_types[0].optional_int32 += 1
+    parsed.SerializeToString()
+    return copies
+
+  variants = [
+      ('deepcopy(parsed)', lambda: copy.deepcopy(parsed)),
+      ('deepcopy(modified)', lambda: copy.deepcopy(modified)),
+      ('CopyFrom(parsed)', lambda: CopyFrom(parsed)),
+      ('CopyFrom(modified)', lambda: CopyFrom(modified)),
+      ('FromString(bytes)',
+       lambda: unittest_pb2.TestParsingMerge.FromString(serialized)),
+      ('deepcopy(parsed), change, serialize', lambda: CopyAndChange(parsed)),
+      ('deepcopy(modified), change, serialize',
+       lambda: CopyAndChange(modified)),
+      ('10 deepcopies, change template', ChangeTemplate),
+  ]
+
+  for name, function in variants:
+    # The copies must hold what the template holds.
+    result = function()
+    if isinstance(result, unittest_pb2.TestParsingMerge):
+      assert result == modified
+    seconds = min(timeit.repeat(function, number=options.number, repeat=3))
+    print('%-40s %10.1f us' % (name, seconds * 1e6 / options.number))
+
+
+if __name__ == '__main__':
+  main()
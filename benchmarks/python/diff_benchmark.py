@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Measures message_diff patches against whole messages for replicating a
+message that changes a little at a time.
+
+Each step changes a few fields of a large message, sends the patch from the
+previous state, and applies it to a replica.  The bytes of the patches and of
+the whole messages are added up over all steps.
+
+Usage:
+  $ PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python \
+        python diff_benchmark.py [--steps=N] [--changes=N]
+"""
+
+import copy
+import optparse
+import random
+import timeit
+
+from google.protobuf import message_diff
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import test_util
+
+
+def BuildState():
+  """Returns a message of about 100 KB holding 200 sub-messages."""
+  state = unittest_pb2.TestParsingMerge()
+  state.required_all_types.optional_int32 = 1
+  for _ in range(200):
+    test_util.SetAllFields(state.repeated_all_types.add())
+  return state
+
+
+def Change(state, rng):
+  """Makes one small change somewhere in state."""
+  element = state.repeated_all_types[rng.randrange(200)]
+  kind = rng.randrange(4)
+  if kind == 0:
+    element.optional_int32 = rng.randrange(1000)
+  elif kind == 1:
+    element.optional_nested_message.bb = rng.randrange(1000)
+  elif kind == 2:
+    element.repeated_string.append('x' * rng.randrange(20))
+  else:
+    element.ClearField('optional_string')
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--steps', type='int', default=100,
+                    help='Number of updates to replicate.')
+  parser.add_option('--changes', type='int', default=3,
+                    help='Number of changes per update.')
+  options, _ = parser.parse_args()
+
+  rng = random.Random(0)
+  state = BuildState()
+  replica = copy.deepcopy(state)
+  sent = copy.deepcopy(state)
+  whole_bytes = patch_bytes = 0
+  diff_time = apply_time = serialize_time = 0.0
+  for _ in range(options.steps):
+    for _ in range(options.changes):
+      Change(state, rng)
+
+    start = timeit.default_timer()
+    whole = state.SerializeToString()
+    serialize_time += timeit.default_timer() - start
+    whole_bytes += len(whole)
+
+    start = timeit.default_timer()
+    patch = message_diff.Diff(sent, state).SerializeToString()
+    diff_time += timeit.default_timer() - start
+    patch_bytes += len(patch)
+
+    start = timeit.default_timer()
+    message_diff.ApplyPatch(replica,
+                            message_diff.MessagePatch.FromString(patch))
+    apply_time += timeit.default_timer() - start
+    assert replica == state
+
+    # The sender keeps what it sent to diff the next update against.
+    sent = copy.deepcopy(state)
+
+  steps = options.steps
+  print('%d updates of %d changes each:' % (steps, options.changes))
+  print('  whole messages  %10d bytes  %8.2f ms to serialize' %
+        (whole_bytes, serialize_time * 1e3 / steps))
+  print('  patches         %10d bytes  %8.2f ms to diff, %.2f ms to apply' %
+        (patch_bytes, diff_time * 1e3 / steps, apply_time * 1e3 / steps))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,161 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Micro-benchmarks for the field encoders in internal/encoder.py.
+
+Times the singular, repeated and packed encoder of every scalar field type,
+writing into a BytesIO as the generic serializer does.  Given an older copy of
+encoder.py with --baseline, both are timed side by side, e.g.:
+
+  $ git show <revision>:python/google/protobuf/internal/encoder.py \
+        > /tmp/baseline_encoder.py
+  $ PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python \
+        python encoder_benchmark.py --baseline=/tmp/baseline_encoder.py
+"""
+
+from io import BytesIO
+import optparse
+import timeit
+
+from google.protobuf.internal import encoder
+
+
+_DEFAULT_REPEATED_COUNT = 100
+
+# (name, encoder constructor name, sample values).  The samples cover the
+# different encoded lengths of each type.
+_CASES = [
+    ('int32', 'Int32Encoder', [0, 1, 127, 300, 70000, -1]),
+    ('int64', 'Int64Encoder', [0, 1, 300, 1 << 40, -(1 << 62)]),
+    ('uint32', 'UInt32Encoder', [0, 1, 127, 300, 1 << 31]),
+    ('uint64', 'UInt64Encoder', [0, 300, 1 << 40, (1 << 64) - 1]),
+    ('sint32', 'SInt32Encoder', [0, -1, 150, -70000]),
+    ('sint64', 'SInt64Encoder', [0, -1, 150, -(1 << 40)]),
+    ('fixed32', 'Fixed32Encoder', [0, 1, 1 << 31]),
+    ('fixed64', 'Fixed64Encoder', [0, 1, 1 << 63]),
+    ('sfixed32', 'SFixed32Encoder', [0, -1, 1 << 30]),
+    ('sfixed64', 'SFixed64Encoder', [0, -1, 1 << 62]),
+    ('float', 'FloatEncoder', [0.0, 1.5, -2.25]),
+    ('double', 'DoubleEncoder', [0.0, 1.5, -1e100]),
+    ('bool', 'BoolEncoder', [True, False]),
+    ('string', 'StringEncoder', [u'', u'hello', u'\xe9t\xe9' * 20]),
+    ('bytes', 'BytesEncoder', [b'', b'hello', b'x' * 200]),
+]
+
+_PACKABLE = frozenset(['int32', 'int64', 'uint32', 'uint64', 'sint32',
+                       'sint64', 'fixed32', 'fixed64', 'sfixed32', 'sfixed64',
+                       'float', 'double', 'bool'])
+
+
+def LoadModule(path):
+  """Loads the Python source file at path as a module."""
+  try:
+    import importlib.util
+  except ImportError:
+    import imp
+    return imp.load_source('baseline_encoder', path)
+  spec = importlib.util.spec_from_file_location('baseline_encoder', path)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+
+def TimeEncoder(field_encoder, values, number):
+  """Returns the time in microseconds to encode each of values once."""
+
+  def Run():
+    write = BytesIO().write
+    for value in values:
+      field_encoder(write, value)
+
+  return min(timeit.repeat(Run, number=number, repeat=5)) * 1e6 / number
+
+
+def TimeCase(module, constructor_name, samples, number, packable,
+             repeated_count):
+  """Returns (singular, repeated, packed) timings of one field type."""
+  constructor = getattr(module, constructor_name)
+  repeated_value = (samples * repeated_count)[:repeated_count]
+  singular = TimeEncoder(constructor(1, False, False), samples,
+                         number) / len(samples)
+  repeated = TimeEncoder(constructor(1, True, False), [repeated_value], number)
+  packed = None
+  if packable:
+    packed = TimeEncoder(constructor(1, True, True), [repeated_value], number)
+  return singular, repeated, packed
+
+
+def FormatTime(time, baseline_time):
+  if time is None:
+    return '%16s' % '-'
+  if baseline_time is None:
+    return '%16.3f' % time
+  return '%9.3f (%3.1fx)' % (time, baseline_time / time)
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--number', type='int', default=2000,
+                    help='Number of timed runs per encoder.')
+  parser.add_option('--repeated_count', type='int',
+                    default=_DEFAULT_REPEATED_COUNT,
+                    help='Number of values in repeated and packed fields.')
+  parser.add_option('--baseline', metavar='FILE',
+                    help='An older encoder.py to compare against.')
+  options, _ = parser.parse_args()
+
+  baseline = None
+  if options.baseline:
+    baseline = LoadModule(options.baseline)
+
+  print('Microseconds per value (singular) or per field of %d values '
+        '(repeated, packed).' % options.repeated_count)
+  if baseline:
+    print('Speedups over %s in parentheses.' % options.baseline)
+  print('%-9s %16s %16s %16s' % ('type', 'singular', 'repeated', 'packed'))
+  for name, constructor_name, samples in _CASES:
+    packable = name in _PACKABLE
+    times = TimeCase(encoder, constructor_name, samples, options.number,
+                     packable, options.repeated_count)
+    baseline_times = (None, None, None)
+    if baseline:
+      baseline_times = TimeCase(baseline, constructor_name, samples,
+                                options.number, packable,
+                                options.repeated_count)
+    print('%-9s %s' % (name, ' '.join(
+        FormatTime(time, baseline_time)
+        for time, baseline_time in zip(times, baseline_times))))
+
+
+if __name__ == '__main__':
+  main()
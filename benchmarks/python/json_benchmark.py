@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Compares json_format with the json module on equivalent data.
+
+For each message, the dict json.dumps() is given holds the same data as the
+message, the way a service would build it by hand.  It is made by loading the
+output of MessageToJson(), so both sides print exactly the same text.
+
+Usage:
+  $ PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python \
+        python json_benchmark.py [--number=N]
+"""
+
+import json
+import optparse
+import timeit
+
+from google.protobuf import json_format
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import test_util
+
+
+def AllFields():
+  message = unittest_pb2.TestAllTypes()
+  test_util.SetAllFields(message)
+  return message
+
+
+def RepeatedScalars():
+  message = unittest_pb2.TestAllTypes()
+  message.repeated_int32.extend(range(1000))
+  message.repeated_int64.extend(range(1000))
+  message.repeated_double.extend(i / 3.0 for i in range(1000))
+  return message
+
+
+def NestedMessages():
+  message = unittest_pb2.TestAllTypes()
+  for i in range(100):
+    message.repeated_nested_message.add(bb=i)
+    message.repeated_foreign_message.add(c=i)
+  return message
+
+
+_MESSAGES = [
+    ('all fields', AllFields),
+    ('3000 repeated scalars', RepeatedScalars),
+    ('200 sub-messages', NestedMessages),
+]
+
+
+def Time(function, number):
+  return min(timeit.repeat(function, number=number, repeat=3)) / number
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--number', type='int', default=200,
+                    help='Number of calls per timing.')
+  options, _ = parser.parse_args()
+
+  for name, build in _MESSAGES:
+    message = build()
+    message_class = message.__class__
+    text = json_format.MessageToJson(message, indent=None)
+    data = json.loads(text)
+    assert json.dumps(data, separators=(',', ':')) == text
+    assert json_format.Parse(text, message_class()) == message
+
+    print('%s:' % name)
+    for label, function in [
+        ('MessageToJson()',
+         lambda: json_format.MessageToJson(message, indent=None)),
+        ('json.dumps()',
+         lambda: json.dumps(data, separators=(',', ':'))),
+        ('Parse()', lambda: json_format.Parse(text, message_class())),
+        ('json.loads()', lambda: json.loads(text))]:
+      print('  %-16s %10.2f us' % (label, Time(function, options.number) * 1e6))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,167 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Measures the memory used by each instance of small messages.
+
+Builds --count messages of a few shapes, keeps them all alive, and reports the
+bytes allocated per message as seen by tracemalloc, which needs Python 3.4 or
+later.  Each layout of _fields (see PROTOCOL_BUFFERS_PYTHON_FIELD_LAYOUT in
+python_message.py) is measured in a fresh interpreter, since the layout of a
+message type is fixed once it is used.
+
+Usage:
+  $ PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python \
+        python memory_benchmark.py [--count=N]
+"""
+
+import optparse
+import os
+import subprocess
+import sys
+
+from google.protobuf import descriptor_pb2
+from google.protobuf import unittest_pb2
+from google.protobuf import unittest_proto3_arena_pb2
+
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+_LAYOUTS = ('dict', 'slots')
+
+
+def Empty():
+  return unittest_pb2.TestAllTypes()
+
+
+def ThreeScalars():
+  message = unittest_pb2.TestAllTypes()
+  message.optional_int32 = 1
+  message.optional_double = 1.5
+  message.optional_string = u'x'
+  return message
+
+
+def OneSubMessage():
+  message = unittest_pb2.TestAllTypes()
+  message.optional_nested_message.bb = 1
+  return message
+
+
+def Oneof():
+  message = unittest_proto3_arena_pb2.TestAllTypes()
+  message.oneof_uint32 = 1
+  return message
+
+
+def Parsed():
+  return unittest_pb2.TestAllTypes.FromString(b'\x08\x01\x92\x01\x02\x08\x01')
+
+
+def SmallType():
+  return unittest_pb2.ForeignMessage(c=1)
+
+
+def SmallTypeParsed():
+  return unittest_pb2.TestAllTypes.NestedMessage.FromString(b'\x08\x01')
+
+
+def TenFieldType():
+  field = descriptor_pb2.FieldDescriptorProto
+  return field(name=u'x', number=1, label=field.LABEL_OPTIONAL,
+               type=field.TYPE_INT32)
+
+
+_SHAPES = [
+    ('empty', Empty),
+    ('3 scalar fields', ThreeScalars),
+    ('1 sub-message', OneSubMessage),
+    ('oneof (proto3)', Oneof),
+    ('parsed, 2 fields', Parsed),
+    ('1-field type, set', SmallType),
+    ('1-field type, parsed', SmallTypeParsed),
+    ('10-field type, 4 set', TenFieldType),
+]
+
+
+def BytesPerMessage(build, count):
+  """Returns the bytes allocated per message to build count messages."""
+  tracemalloc.start()
+  try:
+    before = tracemalloc.get_traced_memory()[0]
+    messages = [build() for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+  finally:
+    tracemalloc.stop()
+  # Leave out the list holding the messages.
+  return (after - before) / float(count) - 8
+
+
+def MeasureInChild(layout, count):
+  """Returns the bytes per message of each shape, measured by a fresh
+  interpreter using layout."""
+  environment = dict(os.environ)
+  environment['PROTOCOL_BUFFERS_PYTHON_FIELD_LAYOUT'] = layout
+  command = [sys.executable, __file__, '--child', '--count=%d' % count]
+  output = subprocess.Popen(command, stdout=subprocess.PIPE,
+                            env=environment).communicate()[0]
+  return [float(line) for line in output.split()]
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--count', type='int', default=20000,
+                    help='Number of messages of each shape kept alive.')
+  parser.add_option('--child', action='store_true',
+                    help=optparse.SUPPRESS_HELP)
+  options, _ = parser.parse_args()
+
+  if tracemalloc is None:
+    parser.error('The tracemalloc module needs Python 3.4 or later.')
+
+  if options.child:
+    for _, build in _SHAPES:
+      print(repr(BytesPerMessage(build, options.count)))
+    return
+
+  results = [MeasureInChild(layout, options.count) for layout in _LAYOUTS]
+  print('%-22s' % 'bytes/message' +
+        ''.join('%10s' % layout for layout in _LAYOUTS))
+  for index, (name, _) in enumerate(_SHAPES):
+    print('%-22s' % name +
+          ''.join('%10.0f' % sizes[index] for sizes in results))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,184 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Compares ways of pickling messages.
+
+Variants:
+  state       how messages used to be pickled: a copyreg reducer returning the
+              serialized message in a dict, as __getstate__() does.
+  protocol 4  the __reduce_ex__() of the pure Python implementation.
+  protocol 5  the same with PickleBuffers, pickled in-band.
+  out-of-band protocol 5 with a buffer_callback, so that the serialized
+              message and large bytes fields are kept out of the pickle.
+
+Each variant is timed for dumps()+loads() of a few messages, and for round
+trips through a pair of multiprocessing.Queues to a worker process, which
+always pickle with the default protocol.
+
+Usage:
+  $ PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python \
+        python pickle_benchmark.py [--number=N] [--queue-number=N]
+"""
+
+import copyreg
+import multiprocessing
+import optparse
+import pickle
+import timeit
+
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import test_util
+
+
+def ThreeScalars():
+  return unittest_pb2.TestRequired(a=1, b=2, c=3)
+
+
+def PackedScalars():
+  message = unittest_pb2.TestPackedTypes()
+  test_util.SetAllPackedFields(message)
+  return message
+
+
+def AllFields():
+  message = unittest_pb2.TestAllTypes()
+  test_util.SetAllFields(message)
+  return message
+
+
+def LargeBytes():
+  return unittest_pb2.TestAllTypes(optional_int32=1,
+                                   optional_bytes=b'x' * (1 << 20))
+
+
+_MESSAGES = [
+    ('3 scalars', ThreeScalars),
+    ('packed scalars', PackedScalars),
+    ('all fields', AllFields),
+    ('1 MB bytes', LargeBytes),
+]
+
+
+def _ReduceState(message):
+  return (message.__class__, (), message.__getstate__())
+
+
+class StatePickling(object):
+  """While active, messages of the given classes are pickled as they used to
+  be."""
+
+  def __init__(self, classes):
+    self._classes = classes
+
+  def __enter__(self):
+    for cls in self._classes:
+      copyreg.pickle(cls, _ReduceState)
+
+  def __exit__(self, *unused_exc_info):
+    for cls in self._classes:
+      del copyreg.dispatch_table[cls]
+
+
+def RoundTrip(message, protocol, out_of_band):
+  if out_of_band:
+    buffers = []
+    data = pickle.dumps(message, protocol, buffer_callback=buffers.append)
+    return pickle.loads(data, buffers=buffers)
+  return pickle.loads(pickle.dumps(message, protocol))
+
+
+def _Echo(requests, responses):
+  for message in iter(requests.get, None):
+    responses.put(message)
+
+
+def QueueRoundTrips(message, number):
+  """Returns the seconds taken to send message to a worker process and back
+  number times.  The worker is started here, so that it sees the current
+  copyreg registrations, when processes are forked."""
+  requests = multiprocessing.Queue()
+  responses = multiprocessing.Queue()
+  worker = multiprocessing.Process(target=_Echo, args=(requests, responses))
+  worker.start()
+  try:
+    requests.put(message)
+    assert responses.get() == message
+    start = timeit.default_timer()
+    for _ in range(number):
+      requests.put(message)
+      responses.get()
+    return timeit.default_timer() - start
+  finally:
+    requests.put(None)
+    worker.join()
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--number', type='int', default=200,
+                    help='Number of pickle round trips per timing.')
+  parser.add_option('--queue-number', type='int', default=200,
+                    help='Number of queue round trips per timing.')
+  options, _ = parser.parse_args()
+
+  variants = [('state', 4, False), ('protocol 4', 4, False)]
+  if pickle.HIGHEST_PROTOCOL >= 5:
+    variants += [('protocol 5', 5, False), ('out-of-band', 5, True)]
+  classes = [unittest_pb2.TestRequired, unittest_pb2.TestPackedTypes,
+             unittest_pb2.TestAllTypes]
+
+  for message_name, build in _MESSAGES:
+    message = build()
+    print('%s, pickle.dumps() + pickle.loads():' % message_name)
+    for name, protocol, out_of_band in variants:
+      def Run():
+        return RoundTrip(message, protocol, out_of_band)
+      if name == 'state':
+        with StatePickling(classes):
+          assert Run() == message
+          elapsed = min(timeit.repeat(Run, number=options.number, repeat=3))
+      else:
+        assert Run() == message
+        elapsed = min(timeit.repeat(Run, number=options.number, repeat=3))
+      print('  %-12s %10.2f us' % (name, elapsed / options.number * 1e6))
+
+    print('%s, multiprocessing.Queue round trip:' % message_name)
+    with StatePickling(classes):
+      elapsed = QueueRoundTrips(message, options.queue_number)
+    print('  %-12s %10.2f us' % ('state', elapsed / options.queue_number * 1e6))
+    elapsed = QueueRoundTrips(message, options.queue_number)
+    print('  %-12s %10.2f us' % ('current', elapsed / options.queue_number * 1e6))
+
+
+if __name__ == '__main__':
+  main()
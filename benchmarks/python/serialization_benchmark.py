@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Compares the serialization strategies of the pure Python implementation.
+
+Every round builds a fresh message tree and serializes it, so no byte sizes
+are cached when serialization starts.  This is the case where the 'generic'
+strategy needs a full ByteSize() pass before it can encode sub-messages, and
+which the 'reverse' strategy avoids.
+
+Usage:
+  $ PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python \
+        python serialization_benchmark.py [--rounds=N]
+"""
+
+import optparse
+import timeit
+
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import api_implementation
+from google.protobuf.internal import python_message
+
+
+def BuildMessage():
+  """Returns a message with a few levels of nested and repeated messages."""
+  message = unittest_pb2.NestedTestAllTypes()
+  child = message
+  for depth in range(5):
+    payload = child.payload
+    payload.optional_int32 = depth
+    payload.optional_string = 'depth %d' % depth
+    payload.optional_nested_message.bb = depth
+    for i in range(20):
+      nested = payload.repeated_nested_message.add()
+      nested.bb = i
+      payload.repeated_foreign_message.add().c = i
+      payload.repeated_string.append('element %d' % i)
+    child = child.child
+  return message
+
+
+def BuildAndSerialize():
+  return BuildMessage().SerializeToString()
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--rounds', type='int', default=200,
+                    help='Number of messages built and serialized per run.')
+  options, _ = parser.parse_args()
+
+  if api_implementation.Type() != 'python':
+    parser.error('Set PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python.')
+
+  build_time = min(timeit.repeat(BuildMessage, number=options.rounds,
+                                 repeat=3))
+  print('%-10s %8.2f us/message' % (
+      'build', build_time * 1e6 / options.rounds))
+
+  expected = None
+  for strategy in ('generic', 'compiled', 'reverse'):
+    python_message.SetSerializationStrategy(strategy)
+    serialized = BuildAndSerialize()
+    if expected is None:
+      expected = serialized
+    elif serialized != expected:
+      raise AssertionError('%s produced different bytes.' % strategy)
+    total = min(timeit.repeat(BuildAndSerialize, number=options.rounds,
+                              repeat=3))
+    print('%-10s %8.2f us/message (%d bytes, excluding build time)' % (
+        strategy, (total - build_time) * 1e6 / options.rounds,
+        len(serialized)))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,141 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Measures the time and memory it takes to import a generated module.
+
+Each measurement is made in a fresh interpreter, since a module is only really
+imported once per process.  Two numbers are reported:
+
+  import      importing --module and everything it imports.  Message classes
+              are only completed when their first instance is created, so
+              this no longer pays for encoders, decoders and properties.
+  import+use  importing --module and then creating one instance of each of its
+              message types, which is what every import used to cost.
+
+Times are the best of --repeat runs.  Memory is what tracemalloc sees
+allocated during the import, so it is only reported on Python 3.4 or later.
+
+Usage:
+  $ PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python \
+        python startup_benchmark.py [--module=NAME] [--repeat=N]
+"""
+
+import optparse
+import subprocess
+import sys
+import timeit
+
+
+def _AllMessageTypes(file_descriptor):
+  pending = list(file_descriptor.message_types_by_name.values())
+  while pending:
+    message_descriptor = pending.pop()
+    pending.extend(message_descriptor.nested_types)
+    yield message_descriptor
+
+
+def MeasureImport(module_name, use, trace):
+  """Imports module_name and returns the seconds or, if trace is true, the
+  bytes allocated that took.
+
+  If use is true, an instance of each message type is created as well.
+  """
+  # Import the library itself first, so that only the generated code counts.
+  from google.protobuf import descriptor
+  from google.protobuf import descriptor_pb2
+  from google.protobuf import message
+  from google.protobuf import reflection
+  from google.protobuf import service_reflection
+  from google.protobuf import symbol_database
+
+  if trace:
+    import tracemalloc
+    tracemalloc.start()
+  start = timeit.default_timer()
+  module = __import__(module_name, fromlist=['DESCRIPTOR'])
+  if use:
+    for message_descriptor in _AllMessageTypes(module.DESCRIPTOR):
+      message_descriptor._concrete_class()
+  elapsed = timeit.default_timer() - start
+  if trace:
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return allocated
+  return elapsed
+
+
+def MeasureInChild(module_name, use, trace):
+  """Runs MeasureImport() in a fresh interpreter and returns its result."""
+  command = [sys.executable, __file__, '--child', '--module=' + module_name]
+  if use:
+    command.append('--use')
+  if trace:
+    command.append('--trace')
+  output = subprocess.Popen(command, stdout=subprocess.PIPE).communicate()[0]
+  return float(output)
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--module', default='google.protobuf.unittest_pb2',
+                    help='Generated module to import.')
+  parser.add_option('--repeat', type='int', default=5,
+                    help='Number of fresh interpreters per measurement.')
+  parser.add_option('--use', action='store_true', help=optparse.SUPPRESS_HELP)
+  parser.add_option('--trace', action='store_true',
+                    help=optparse.SUPPRESS_HELP)
+  parser.add_option('--child', action='store_true',
+                    help=optparse.SUPPRESS_HELP)
+  options, _ = parser.parse_args()
+
+  if options.child:
+    print(repr(MeasureImport(options.module, options.use, options.trace)))
+    return
+
+  try:
+    import tracemalloc
+  except ImportError:
+    tracemalloc = None
+
+  for name, use in [('import', False), ('import+use', True)]:
+    elapsed = min(MeasureInChild(options.module, use, False)
+                  for _ in range(options.repeat))
+    line = '%-12s %8.2f ms' % (name, elapsed * 1000)
+    if tracemalloc is not None:
+      allocated = MeasureInChild(options.module, use, True)
+      line += ' %10.0f KiB' % (allocated / 1024)
+    print(line)
+
+
+if __name__ == '__main__':
+  main()
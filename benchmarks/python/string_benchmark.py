@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Measures serialization of text-heavy messages.
+
+String fields have to be encoded to UTF-8 both to compute the size of the
+sub-message they are in and to serialize them.  Every round builds a fresh
+message tree whose string fields hold ASCII or non-ASCII text, and serializes
+it with each serialization strategy.
+
+Usage:
+  $ PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python \
+        python string_benchmark.py [--rounds=N]
+"""
+
+import optparse
+import timeit
+
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import api_implementation
+from google.protobuf.internal import python_message
+
+
+_TEXTS = {
+    'ascii': u'The quick brown fox jumps over the lazy dog. ' * 4,
+    'non-ascii': (u'\xc9t\xe9 \u0436\u0430\u0440\u043a\u043e\u0435, '
+                  u'\u6691\u3044\u590f. ') * 8,
+}
+
+
+def BuildMessage(text):
+  """Returns a message with text in singular and repeated string fields."""
+  message = unittest_pb2.NestedTestAllTypes()
+  child = message
+  for depth in range(3):
+    payload = child.payload
+    payload.optional_string = text
+    payload.repeated_string.extend([text] * 50)
+    for i in range(10):
+      payload.repeated_nested_message.add().bb = i
+    child = child.child
+  return message
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--rounds', type='int', default=200,
+                    help='Number of messages built and serialized per run.')
+  options, _ = parser.parse_args()
+
+  if api_implementation.Type() != 'python':
+    parser.error('Set PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python.')
+
+  for name, text in sorted(_TEXTS.items()):
+    build = lambda: BuildMessage(text)
+    build_time = min(timeit.repeat(build, number=options.rounds, repeat=3))
+    for strategy in ('generic', 'compiled', 'reverse'):
+      python_message.SetSerializationStrategy(strategy)
+      run = lambda: BuildMessage(text).SerializeToString()
+      total = min(timeit.repeat(run, number=options.rounds, repeat=3))
+      print('%-10s %-10s %8.2f us/message (%d bytes, excluding build time)' % (
+          name, strategy, (total - build_time) * 1e6 / options.rounds,
+          len(run())))
+
+
+if __name__ == '__main__':
+  main()
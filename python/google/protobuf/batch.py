@@ -0,0 +1,92 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Serializes and parses batches of independent messages.
+
+Calling SerializeToString() or FromString() in a loop pays the full cost of a
+call for each message.  The functions here take a whole batch at once.  In the
+pure Python implementation, SerializeMany() looks up what depends on the class
+of a message once per class, serializes with the serializer generated for
+each class (see internal/compiled_serializer.py), and writes every message into
+one shared buffer.  ParseMany() only saves the cost of the calls, since most of
+the time goes into decoding each field.  Results are returned in order.
+
+There is no option to use other processes:  a message sent to or from one is
+pickled, which serializes it, so the calling process would do at least as much
+work as serializing or parsing the batch itself.
+"""
+
+from google.protobuf.internal import api_implementation
+
+if api_implementation.Type() == 'cpp':
+  _message_impl = None
+else:
+  from google.protobuf.internal import python_message as _message_impl
+
+__all__ = ['SerializeMany', 'ParseMany']
+
+
+def SerializeMany(messages, partial=False):
+  """Serializes each message of a batch to a binary string.
+
+  Args:
+    messages: An iterable of messages, which need not all have the same type.
+    partial: If true, messages that are missing required fields are
+      serialized anyway, as by SerializePartialToString().
+
+  Returns:
+    A list holding the serialization of each message, in order.
+
+  Raises:
+    message.EncodeError: if partial is false and a message isn't initialized.
+  """
+  if _message_impl is None:
+    if partial:
+      return [message.SerializePartialToString() for message in messages]
+    return [message.SerializeToString() for message in messages]
+  return _message_impl.SerializeMany(messages, partial)
+
+
+def ParseMany(message_class, payloads):
+  """Parses each binary string of a batch into a new message.
+
+  Args:
+    message_class: The class of the messages to parse.
+    payloads: An iterable of binary strings.
+
+  Returns:
+    A list holding a new message_class instance for each payload, in order.
+
+  Raises:
+    message.DecodeError: if a payload can't be parsed.
+  """
+  if _message_impl is None:
+    return [message_class.FromString(serialized) for serialized in payloads]
+  return _message_impl.ParseMany(message_class, payloads)
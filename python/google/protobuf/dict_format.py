@@ -0,0 +1,194 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Converts protocol messages to and from native Python dicts.
+
+MessageToDict() returns a dict holding the fields which are set in a message,
+with lists for repeated fields, dicts for sub-messages and for map fields, and
+the values of scalar fields as they are.  DictToMessage() merges such a dict
+into a message.  Unlike json_format, nothing is converted to or from text:  64
+bit integers stay integers and bytes fields stay bytes.
+
+With the pure Python implementation, the conversion of each message type is
+put together once and then reads and writes the fields of messages directly.
+"""
+
+from google.protobuf.internal import api_implementation
+from google.protobuf.internal import type_checkers
+from google.protobuf import descriptor
+
+if api_implementation.Type() == 'cpp':
+  _dict_converter = None
+else:
+  from google.protobuf.internal import dict_converter as _dict_converter
+
+__all__ = ['MessageToDict', 'DictToMessage']
+
+_FieldDescriptor = descriptor.FieldDescriptor
+
+
+def MessageToDict(message, use_field_numbers=False, use_enum_names=False):
+  """Converts a message to a dict.
+
+  Args:
+    message: The protocol message to convert.
+    use_field_numbers: If true, fields are keyed by their number instead of
+      their name.  Extensions are otherwise keyed by their full name.
+    use_enum_names: If true, enum values are given by name instead of by
+      number.  Values which are not known to the enum type stay numbers.
+
+  Returns:
+    A dict holding each field which is set in message.  Repeated fields are
+    lists and map fields are dicts; sub-messages are converted to dicts in
+    turn.
+  """
+  if _dict_converter is None:
+    return _GenericMessageToDict(message, use_field_numbers, use_enum_names)
+  return _dict_converter.MessageToDict(
+      message, use_field_numbers, use_enum_names)
+
+
+def DictToMessage(values, message):
+  """Merges a dict into a message.
+
+  Fields can be keyed by name or by number, and extensions by full name or by
+  number.  Values are what MessageToDict() returns; enum values can be given by
+  name, and sub-messages can be given as messages as well as dicts.  Fields
+  whose value is None are left alone.
+
+  Args:
+    values: The dict to merge.
+    message: The protocol message to merge it into.
+
+  Returns:
+    The message.
+
+  Raises:
+    ValueError: if a key is not a field of the message, or an enum name is not
+      known.
+    TypeError: if a value has the wrong type for its field.
+  """
+  if _dict_converter is None:
+    return _GenericDictToMessage(values, message)
+  return _dict_converter.DictToMessage(values, message)
+
+
+def _GenericMessageToDict(message, use_field_numbers, use_enum_names):
+  """MessageToDict() through the public message API."""
+
+  def Convert(field, value):
+    if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      return _GenericMessageToDict(value, use_field_numbers, use_enum_names)
+    if field.cpp_type == _FieldDescriptor.CPPTYPE_ENUM and use_enum_names:
+      enum_value = field.enum_type.values_by_number.get(value)
+      if enum_value is not None:
+        return enum_value.name
+    return value
+
+  result = {}
+  for field, value in message.ListFields():
+    if use_field_numbers:
+      key = field.number
+    elif field.is_extension:
+      key = field.full_name
+    else:
+      key = field.name
+    if type_checkers.IsMapEntry(field):
+      value_field = field.message_type.fields_by_name['value']
+      result[key] = dict((entry.key, Convert(value_field, entry.value))
+                         for entry in value)
+    elif field.label == _FieldDescriptor.LABEL_REPEATED:
+      result[key] = [Convert(field, element) for element in value]
+    else:
+      result[key] = Convert(field, value)
+  return result
+
+
+def _GenericDictToMessage(values, message):
+  """DictToMessage() through the public message API."""
+  message_descriptor = message.DESCRIPTOR
+  if not isinstance(values, dict):
+    raise TypeError('Expected a dict for message %s, got %r.' %
+                    (message_descriptor.full_name, values))
+
+  def Convert(field, value):
+    if (field.cpp_type == _FieldDescriptor.CPPTYPE_ENUM and
+        isinstance(value, basestring)):
+      enum_value = field.enum_type.values_by_name.get(value)
+      if enum_value is None:
+        raise ValueError('Enum type "%s" has no value named %s.' %
+                         (field.enum_type.full_name, value))
+      return enum_value.number
+    return value
+
+  def MergeSubMessage(value, sub_message):
+    if isinstance(value, dict):
+      _GenericDictToMessage(value, sub_message)
+    else:
+      sub_message.MergeFrom(value)
+
+  for key, value in values.iteritems():
+    field = (message_descriptor.fields_by_name.get(key) or
+             message_descriptor.fields_by_number.get(key) or
+             message._extensions_by_name.get(key) or
+             message._extensions_by_number.get(key))
+    if field is None:
+      raise ValueError('Protocol message %s has no "%s" field.' %
+                       (message_descriptor.name, key))
+    if value is None:
+      continue
+    if (field.label != _FieldDescriptor.LABEL_REPEATED and
+        field.cpp_type != _FieldDescriptor.CPPTYPE_MESSAGE):
+      if field.is_extension:
+        message.Extensions[field] = Convert(field, value)
+      else:
+        setattr(message, field.name, Convert(field, value))
+      continue
+    if field.is_extension:
+      current = message.Extensions[field]
+    else:
+      current = getattr(message, field.name)
+    if type_checkers.IsMapEntry(field):
+      for map_key, map_value in value.iteritems():
+        _GenericDictToMessage({'key': map_key, 'value': map_value},
+                              current.add())
+    elif field.label == _FieldDescriptor.LABEL_REPEATED:
+      if isinstance(value, (basestring, bytes, dict)):
+        raise TypeError('Expected a sequence of values for repeated field %s, '
+                        'got %r.' % (field.full_name, value))
+      if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+        for element in value:
+          MergeSubMessage(element, current.add())
+      else:
+        current.extend([Convert(field, element) for element in value])
+    else:
+      current.SetInParent()
+      MergeSubMessage(value, current)
+  return message
@@ -0,0 +1,229 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Restricts messages to a set of field paths.
+
+A FieldMask is a set of paths such as 'payload.optional_int32', compiled once
+against a message type into a tree of field descriptors.  Prune() clears the
+fields of a message which are not in a mask, MergeMasked() merges only the
+masked fields of one message into another, and SerializeMasked() serializes
+only the masked fields, without building a pruned copy.
+
+A path going through a repeated message field applies to each of its
+elements.  A path naming a field covers the whole field, including all the
+paths below it.  Unknown fields are kept by Prune() and SerializeMasked(),
+like fields which cannot be named.
+"""
+
+from google.protobuf.internal import api_implementation
+from google.protobuf import descriptor
+
+if api_implementation.Type() == 'cpp':
+  _message_impl = None
+else:
+  from google.protobuf.internal import python_message as _message_impl
+
+__all__ = ['FieldMask', 'Prune', 'MergeMasked', 'SerializeMasked']
+
+_FieldDescriptor = descriptor.FieldDescriptor
+
+
+class FieldMask(object):
+
+  """A set of field paths, compiled against a message type.
+
+  Attributes:
+    descriptor: The Descriptor of the messages the mask applies to.
+    paths: The paths the mask was made of, sorted.
+  """
+
+  __slots__ = ['descriptor', 'paths', '_tree']
+
+  def __init__(self, message_descriptor, paths):
+    """Compiles a mask.
+
+    Args:
+      message_descriptor: The Descriptor of the messages the mask applies to.
+      paths: An iterable of paths, each a dot-separated list of field names.
+
+    Raises:
+      ValueError: if a path does not name a field, or goes through a field
+        which is not a message field.
+    """
+    self.descriptor = message_descriptor
+    self.paths = sorted(paths)
+    # Maps the descriptor of each masked field to the same kind of dict for
+    # its sub-messages, or to None when the whole field is masked.
+    self._tree = {}
+    for path in self.paths:
+      self._AddPath(path)
+
+  def _AddPath(self, path):
+    tree = self._tree
+    message_descriptor = self.descriptor
+    names = path.split('.')
+    for index, name in enumerate(names):
+      field = message_descriptor.fields_by_name.get(name)
+      if field is None:
+        raise ValueError('Field mask path "%s": %s has no field "%s".' %
+                         (path, message_descriptor.full_name, name))
+      if index == len(names) - 1:
+        tree[field] = None
+        return
+      if field.cpp_type != _FieldDescriptor.CPPTYPE_MESSAGE:
+        raise ValueError('Field mask path "%s": %s is not a message field.' %
+                         (path, field.full_name))
+      if field in tree:
+        tree = tree[field]
+        if tree is None:
+          # The whole field is masked already.
+          return
+      else:
+        subtree = {}
+        tree[field] = subtree
+        tree = subtree
+      message_descriptor = field.message_type
+
+  def __repr__(self):
+    return 'FieldMask(%s, %r)' % (self.descriptor.full_name, self.paths)
+
+
+def _CheckMask(message, mask):
+  if message.DESCRIPTOR is not mask.descriptor:
+    raise TypeError('Field mask for %s cannot be applied to a %s message.' %
+                    (mask.descriptor.full_name, message.DESCRIPTOR.full_name))
+
+
+def Prune(message, mask):
+  """Clears the fields of a message which are not in a mask.
+
+  Args:
+    message: The message to prune.
+    mask: A FieldMask for the type of message.
+
+  Returns:
+    The message.
+
+  Raises:
+    TypeError: if the mask is for another message type.
+  """
+  _CheckMask(message, mask)
+  _Prune(message, mask._tree)
+  return message
+
+
+def _Prune(message, tree):
+  for field, value in message.ListFields():
+    if field not in tree:
+      if field.is_extension:
+        message.ClearExtension(field)
+      else:
+        message.ClearField(field.name)
+      continue
+    subtree = tree[field]
+    if subtree is None:
+      continue
+    if field.label == _FieldDescriptor.LABEL_REPEATED:
+      for element in value:
+        _Prune(element, subtree)
+    else:
+      _Prune(value, subtree)
+
+
+def MergeMasked(destination, source, mask):
+  """Merges the fields of a message which are in a mask into another message.
+
+  The masked fields are merged like by MergeFrom():  scalar fields are
+  overwritten, sub-messages are merged and repeated fields are appended to.
+
+  Args:
+    destination: The message to merge into.
+    source: The message to merge from, of the same type.
+    mask: A FieldMask for the type of both messages.
+
+  Returns:
+    The destination message.
+
+  Raises:
+    TypeError: if the mask is for another message type.
+  """
+  _CheckMask(destination, mask)
+  _CheckMask(source, mask)
+  _MergeMasked(destination, source, mask._tree)
+  return destination
+
+
+def _MergeMasked(destination, source, tree):
+  for field, value in source.ListFields():
+    if field not in tree:
+      continue
+    subtree = tree[field]
+    if field.label == _FieldDescriptor.LABEL_REPEATED:
+      destination_value = getattr(destination, field.name)
+      if subtree is None:
+        destination_value.MergeFrom(value)
+      else:
+        for element in value:
+          _MergeMasked(destination_value.add(), element, subtree)
+    elif field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      destination_value = getattr(destination, field.name)
+      destination_value.SetInParent()
+      if subtree is None:
+        destination_value.MergeFrom(value)
+      else:
+        _MergeMasked(destination_value, value, subtree)
+    else:
+      setattr(destination, field.name, value)
+
+
+def SerializeMasked(message, mask):
+  """Serializes only the fields of a message which are in a mask.
+
+  The result is the serialization of the message as pruned by Prune(), but
+  the message is left as it is.  Like SerializePartialToString(), required
+  fields are not checked, since a mask need not name them.
+
+  Args:
+    message: The message to serialize.
+    mask: A FieldMask for the type of message.
+
+  Returns:
+    A binary string.
+
+  Raises:
+    TypeError: if the mask is for another message type.
+  """
+  _CheckMask(message, mask)
+  if _message_impl is None:
+    pruned = message.__class__()
+    pruned.CopyFrom(message)
+    _Prune(pruned, mask._tree)
+    return pruned.SerializePartialToString()
+  return _message_impl.SerializeMasked(message, mask._tree)
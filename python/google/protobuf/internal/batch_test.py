@@ -0,0 +1,120 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for google.protobuf.batch."""
+
+import unittest
+
+from google.protobuf import batch
+from google.protobuf import descriptor
+from google.protobuf import descriptor_pb2
+from google.protobuf import message
+from google.protobuf import reflection
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import api_implementation
+from google.protobuf.internal import test_util
+
+
+def _MakeMessages():
+  all_types = unittest_pb2.TestAllTypes()
+  test_util.SetAllFields(all_types)
+  all_extensions = unittest_pb2.TestAllExtensions()
+  test_util.SetAllExtensions(all_extensions)
+  parsed = unittest_pb2.TestAllTypes.FromString(all_types.SerializeToString())
+  nested = unittest_pb2.NestedTestAllTypes()
+  nested.child.payload.optional_string = u'\xe9t\xe9'
+  return [all_types, unittest_pb2.TestAllTypes(), all_extensions, parsed,
+          nested, all_types]
+
+
+class BatchTest(unittest.TestCase):
+
+  def _Strategies(self):
+    """Yields once per serialization strategy of the implementation."""
+    if api_implementation.Type() != 'python':
+      yield
+      return
+    from google.protobuf.internal import python_message
+    old_strategy = python_message.GetSerializationStrategy()
+    try:
+      for strategy in python_message._SERIALIZATION_STRATEGIES:
+        python_message.SetSerializationStrategy(strategy)
+        yield
+    finally:
+      python_message.SetSerializationStrategy(old_strategy)
+
+  def testSerializeMany(self):
+    for _ in self._Strategies():
+      messages = _MakeMessages()
+      expected = [m.SerializeToString() for m in _MakeMessages()]
+      self.assertEqual(expected, batch.SerializeMany(messages))
+      self.assertEqual(expected, batch.SerializeMany(iter(messages)))
+      self.assertEqual([], batch.SerializeMany([]))
+
+  def testSerializeManyRequiresInitializedMessages(self):
+    messages = [unittest_pb2.TestAllTypes(), unittest_pb2.TestRequired()]
+    self.assertRaises(message.EncodeError, batch.SerializeMany, messages)
+    self.assertEqual([b'', b''], batch.SerializeMany(messages, partial=True))
+    foreign = unittest_pb2.TestRequiredForeign()
+    foreign.optional_message.a = 1
+    self.assertRaises(message.EncodeError, batch.SerializeMany,
+                      [unittest_pb2.TestRequiredForeign(), foreign])
+    self.assertEqual([foreign.SerializePartialToString()],
+                     batch.SerializeMany([foreign], partial=True))
+
+  def testParseMany(self):
+    messages = _MakeMessages()[:2]
+    payloads = [m.SerializeToString() for m in messages]
+    parsed = batch.ParseMany(unittest_pb2.TestAllTypes, payloads)
+    self.assertEqual(messages, parsed)
+    self.assertEqual(payloads, batch.SerializeMany(parsed))
+    self.assertEqual(
+        [], batch.ParseMany(unittest_pb2.TestAllTypes, iter([])))
+
+  def testParseManyOfClassNeverInstantiated(self):
+    desc_proto = descriptor_pb2.DescriptorProto()
+    desc_proto.name = 'Batched'
+    field = desc_proto.field.add()
+    field.name, field.number = 'value', 1
+    field.type = descriptor_pb2.FieldDescriptorProto.TYPE_INT64
+    field.label = descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+    batched_class = reflection.MakeClass(descriptor.MakeDescriptor(desc_proto))
+    parsed = batch.ParseMany(batched_class, [b'\x08\x07', b'\x08\x02'])
+    self.assertEqual([7, 2], [m.value for m in parsed])
+
+  def testParseManyRaisesDecodeError(self):
+    self.assertRaises(message.DecodeError, batch.ParseMany,
+                      unittest_pb2.TestAllTypes, [b'', b'\x08'])
+
+
+if __name__ == '__main__':
+  unittest.main()
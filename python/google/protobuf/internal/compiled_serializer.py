@@ -0,0 +1,287 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Generates a specialized serialization function for a message type.
+
+The generic _InternalSerialize() in python_message.py calls ListFields(), which
+filters and sorts the contents of _fields on every call, and then dispatches to
+the encoder closure attached to each FieldDescriptor.  The function generated
+here does the same job, but everything that only depends on the message type is
+decided once, when the code is generated:
+* Fields are visited in field number order, so nothing needs to be sorted.
+* Every field is looked up directly in _fields, so no (field, value) tuples are
+  built.
+* Tags are pre-encoded and, for bools and fixed-width types, joined with the
+  value into a single write() call.
+* The encoding steps for each field type are inlined into the function body
+  (much as encoder.py inlines the single-value encoders into its loops), so
+  there is no per-field closure call.  Packed fields are the exception:  they
+  are handed to their field encoder in one call, which encodes the whole list.
+
+The generated function must produce exactly the same bytes as the generic one;
+internal/compiled_serializer_test.py checks that.
+"""
+
+import struct
+
+from google.protobuf.internal import encoder
+from google.protobuf.internal import type_checkers
+from google.protobuf.internal import wire_format
+from google.protobuf import descriptor as descriptor_mod
+
+_FieldDescriptor = descriptor_mod.FieldDescriptor
+
+_TRUE_BYTE = encoder._VarintBytes(1)
+_FALSE_BYTE = encoder._VarintBytes(0)
+
+
+# Snippets encoding one value, which is held in the variable %(v)s.  %(i)d is
+# the index of the field, used to name its constants:  F<i> is the field
+# descriptor, T<i> its tag bytes and E<i> its field encoder.  Every snippet is
+# a list of lines, indented relative to the enclosing block.
+
+_VARINT_SNIPPET = ['write(T%(i)d + VarintBytes(%(v)s))']
+
+_SIGNED_VARINT_SNIPPET = ['write(T%(i)d + SignedVarintBytes(%(v)s))']
+
+_ZIGZAG_SNIPPET = ['write(T%(i)d + VarintBytes(ZigZagEncode(%(v)s)))']
+
+_BOOL_SNIPPET = ['write(T%(i)d_TRUE if %(v)s else T%(i)d_FALSE)']
+
+# The tag and the value are concatenated before anything is written, so that
+# if struct.pack() fails on a non-finite value we can still hand the whole
+# field to the regular encoder, which knows how to deal with it.
+_FLOAT_SNIPPET = ['try:',
+                  '  write(T%(i)d + pack(%(format)r, %(v)s))',
+                  'except SystemError:',
+                  '  E%(i)d(write, %(v)s)']
+
+_FIXED_SNIPPET = ['write(T%(i)d + pack(%(format)r, %(v)s))']
+
+_STRING_SNIPPET = ['encoded = %(v)s.encode("utf-8")',
+                   'write(T%(i)d + VarintBytes(len(encoded)))',
+                   'write(encoded)']
+
+_BYTES_SNIPPET = ['write(T%(i)d + VarintBytes(len(%(v)s)))',
+                  'write(%(v)s)']
+
+_MESSAGE_SNIPPET = ['write(T%(i)d + VarintBytes(%(v)s.ByteSize()))',
+                    '%(v)s._CompiledInternalSerialize(write)']
+
+_GROUP_SNIPPET = ['write(T%(i)d)',
+                  '%(v)s._CompiledInternalSerialize(write)',
+                  'write(T%(i)d_END)']
+
+_TYPE_TO_SNIPPET = {
+    _FieldDescriptor.TYPE_DOUBLE: _FLOAT_SNIPPET,
+    _FieldDescriptor.TYPE_FLOAT: _FLOAT_SNIPPET,
+    _FieldDescriptor.TYPE_INT64: _SIGNED_VARINT_SNIPPET,
+    _FieldDescriptor.TYPE_UINT64: _VARINT_SNIPPET,
+    _FieldDescriptor.TYPE_INT32: _SIGNED_VARINT_SNIPPET,
+    _FieldDescriptor.TYPE_FIXED64: _FIXED_SNIPPET,
+    _FieldDescriptor.TYPE_FIXED32: _FIXED_SNIPPET,
+    _FieldDescriptor.TYPE_BOOL: _BOOL_SNIPPET,
+    _FieldDescriptor.TYPE_STRING: _STRING_SNIPPET,
+    _FieldDescriptor.TYPE_GROUP: _GROUP_SNIPPET,
+    _FieldDescriptor.TYPE_MESSAGE: _MESSAGE_SNIPPET,
+    _FieldDescriptor.TYPE_BYTES: _BYTES_SNIPPET,
+    _FieldDescriptor.TYPE_UINT32: _VARINT_SNIPPET,
+    _FieldDescriptor.TYPE_ENUM: _SIGNED_VARINT_SNIPPET,
+    _FieldDescriptor.TYPE_SFIXED32: _FIXED_SNIPPET,
+    _FieldDescriptor.TYPE_SFIXED64: _FIXED_SNIPPET,
+    _FieldDescriptor.TYPE_SINT32: _ZIGZAG_SNIPPET,
+    _FieldDescriptor.TYPE_SINT64: _ZIGZAG_SNIPPET,
+    }
+
+_TYPE_TO_STRUCT_FORMAT = {
+    _FieldDescriptor.TYPE_DOUBLE: '<d',
+    _FieldDescriptor.TYPE_FLOAT: '<f',
+    _FieldDescriptor.TYPE_FIXED64: '<Q',
+    _FieldDescriptor.TYPE_FIXED32: '<I',
+    _FieldDescriptor.TYPE_SFIXED32: '<i',
+    _FieldDescriptor.TYPE_SFIXED64: '<q',
+    }
+
+
+def _FieldNumber(item):
+  return item[0].number
+
+
+def _Indent(lines, snippet, depth, substitutions):
+  prefix = '  ' * depth
+  for line in snippet:
+    lines.append(prefix + line % substitutions)
+
+
+def _AddFieldCode(lines, namespace, index, field):
+  """Adds the code serializing one regular (non-extension) field."""
+
+  is_repeated = field.label == _FieldDescriptor.LABEL_REPEATED
+  is_packed = (is_repeated and field.has_options and
+               field.GetOptions().packed)
+  wire_type = wire_format.WIRETYPE_LENGTH_DELIMITED
+  if not is_packed:
+    wire_type = type_checkers.FIELD_TYPE_TO_WIRE_TYPE[field.type]
+
+  namespace['F%d' % index] = field
+  namespace['T%d' % index] = encoder.TagBytes(field.number, wire_type)
+  namespace['E%d' % index] = field._encoder
+  if field.type == _FieldDescriptor.TYPE_BOOL:
+    namespace['T%d_TRUE' % index] = encoder.TagBytes(
+        field.number, wire_type) + _TRUE_BYTE
+    namespace['T%d_FALSE' % index] = encoder.TagBytes(
+        field.number, wire_type) + _FALSE_BYTE
+  elif field.type == _FieldDescriptor.TYPE_GROUP:
+    namespace['T%d_END' % index] = encoder.TagBytes(
+        field.number, wire_format.WIRETYPE_END_GROUP)
+
+  snippet = _TYPE_TO_SNIPPET[field.type]
+  substitutions = {'i': index,
+                   'format': _TYPE_TO_STRUCT_FORMAT.get(field.type)}
+
+  if is_repeated:
+    condition = 'value'
+  elif field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+    condition = 'value is not None and value._is_present_in_parent'
+  else:
+    condition = 'value is not None'
+
+  lines.append('  value = fields.get(F%d)' % index)
+  if field.type == _FieldDescriptor.TYPE_STRING:
+    # Use the UTF-8 encoding left behind by ByteSize(), if there is one.
+    namespace['U%d' % index] = field._utf8_encoder
+    lines.append('  encoded = utf8_cache.get(F%d)' % index)
+    lines.append('  if encoded is not None:')
+    lines.append('    U%d(write, encoded)' % index)
+    lines.append('  elif %s:' % condition)
+  else:
+    lines.append('  if %s:' % condition)
+  if is_packed:
+    lines.append('    E%d(write, value)' % index)
+  elif is_repeated:
+    lines.append('    for element in value:')
+    substitutions['v'] = 'element'
+    _Indent(lines, snippet, 3, substitutions)
+  else:
+    substitutions['v'] = 'value'
+    _Indent(lines, snippet, 2, substitutions)
+
+
+def _AddExtensionsCode(lines, limit):
+  """Adds the code serializing the set extensions numbered below limit."""
+
+  if limit is None:
+    lines.append('    for field, value in extensions[ext_index:]:')
+    lines.append('      field._encoder(write, value)')
+    return
+  lines.append('    while (ext_index < ext_count and')
+  lines.append('           extensions[ext_index][0].number < %d):' % limit)
+  lines.append('      field, value = extensions[ext_index]')
+  lines.append('      field._encoder(write, value)')
+  lines.append('      ext_index += 1')
+
+
+def MakeInternalSerialize(message_descriptor, is_present):
+  """Generates the serialization function for a message type.
+
+  Args:
+    message_descriptor: A Descriptor describing the message type.  Field
+      helpers (see python_message._AttachFieldHelpers()) must already be
+      attached to its fields.
+    is_present: The function ListFields() uses to tell whether a
+      (field, value) item from _fields is set.  Only used for extensions.
+
+  Returns:
+    A function with the signature of _InternalSerialize(self, write_bytes).
+  """
+  namespace = {
+      'VarintBytes': encoder._VarintBytes,
+      'SignedVarintBytes': encoder._SignedVarintBytes,
+      'ZigZagEncode': wire_format.ZigZagEncode,
+      'pack': struct.pack,
+      'IsPresent': is_present,
+      'FieldNumber': _FieldNumber,
+      'EMPTY': {},
+      }
+
+  lines = ['def InternalSerialize(self, write):',
+           '  wire_span = self._wire_span',
+           '  if wire_span:',
+           '    return write(wire_span[0][wire_span[1]:wire_span[2]])',
+           '  fields = self._fields']
+  if any(field.type == _FieldDescriptor.TYPE_STRING
+         for field in message_descriptor.fields):
+    lines.append('  utf8_cache = self._utf8_cache')
+    lines.append('  if utf8_cache is None:')
+    lines.append('    utf8_cache = EMPTY')
+    lines.append('  else:')
+    lines.append('    self._utf8_cache = None')
+
+  # Extensions live in _fields next to the regular fields, so their position in
+  # the output is only known at runtime.  Since they can only use numbers from
+  # the extension ranges, we flush the ones from each range just before the
+  # first regular field numbered after it.  Without range information we have
+  # to check before every field.
+  is_extendable = message_descriptor.is_extendable
+  extension_limits = []
+  if is_extendable:
+    lines.append('  extensions = [item for item in fields.items()')
+    lines.append('                if item[0].is_extension and IsPresent(item)]')
+    lines.append('  ext_count = len(extensions)')
+    lines.append('  if ext_count:')
+    lines.append('    extensions.sort(key=FieldNumber)')
+    lines.append('  ext_index = 0')
+    extension_limits = sorted(
+        end for (start, end) in message_descriptor.extension_ranges or ())
+
+  fields = sorted(message_descriptor.fields, key=lambda f: f.number)
+  for index, field in enumerate(fields):
+    if is_extendable:
+      if not message_descriptor.extension_ranges:
+        lines.append('  if ext_index < ext_count:')
+        _AddExtensionsCode(lines, field.number)
+      while extension_limits and extension_limits[0] <= field.number:
+        lines.append('  if ext_index < ext_count:')
+        _AddExtensionsCode(lines, extension_limits.pop(0))
+    _AddFieldCode(lines, namespace, index, field)
+
+  if is_extendable:
+    lines.append('  if ext_index < ext_count:')
+    _AddExtensionsCode(lines, None)
+
+  lines.append('  for tag_bytes, value_bytes in self._unknown_fields:')
+  lines.append('    write(tag_bytes)')
+  lines.append('    write(value_bytes)')
+
+  source = '\n'.join(lines) + '\n'
+  code = compile(source, '<serializer for %s>' % message_descriptor.full_name,
+                 'exec')
+  exec(code, namespace)
+  return namespace['InternalSerialize']
@@ -0,0 +1,176 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Tests for google.protobuf.internal.compiled_serializer."""
+
+import unittest
+
+from google.protobuf import unittest_mset_pb2
+from google.protobuf import unittest_pb2
+from google.protobuf import unittest_proto3_arena_pb2
+from google.protobuf.internal import api_implementation
+from google.protobuf.internal import test_util
+
+
+class CompiledSerializerTest(unittest.TestCase):
+
+  def setUp(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('The serialization strategy only exists in the pure '
+                    'Python implementation.')
+    from google.protobuf.internal import python_message
+    self.python_message = python_message
+    self.saved_strategy = python_message.GetSerializationStrategy()
+
+  def tearDown(self):
+    if api_implementation.Type() == 'python':
+      self.python_message.SetSerializationStrategy(self.saved_strategy)
+
+  def Serialize(self, message, strategy):
+    self.python_message.SetSerializationStrategy(strategy)
+    # Fresh copies, so that neither serialization can reuse the other's work.
+    copy = type(message)()
+    copy.MergeFrom(message)
+    return copy.SerializePartialToString()
+
+  def assertSameBytes(self, message):
+    generic = self.Serialize(message, 'generic')
+    compiled = self.Serialize(message, 'compiled')
+    self.assertEqual(generic, compiled)
+    return compiled
+
+  def testStrategySelection(self):
+    self.python_message.SetSerializationStrategy('compiled')
+    self.assertEqual('compiled', self.python_message.GetSerializationStrategy())
+    self.python_message.SetSerializationStrategy('generic')
+    self.assertEqual('generic', self.python_message.GetSerializationStrategy())
+    self.assertRaises(ValueError,
+                      self.python_message.SetSerializationStrategy, 'bogus')
+    self.assertEqual('generic', self.python_message.GetSerializationStrategy())
+
+  def testEmptyMessage(self):
+    self.assertEqual(b'', self.assertSameBytes(unittest_pb2.TestAllTypes()))
+
+  def testAllFields(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    serialized = self.assertSameBytes(message)
+    self.assertEqual(
+        test_util.GoldenFileData('golden_message_oneof_implemented'),
+        serialized)
+
+  def testAllExtensions(self):
+    message = unittest_pb2.TestAllExtensions()
+    test_util.SetAllExtensions(message)
+    self.assertSameBytes(message)
+
+  def testPackedFields(self):
+    message = unittest_pb2.TestPackedTypes()
+    test_util.SetAllPackedFields(message)
+    serialized = self.assertSameBytes(message)
+    self.assertEqual(test_util.GoldenFileData('golden_packed_fields_message'),
+                     serialized)
+
+  def testPackedExtensions(self):
+    message = unittest_pb2.TestPackedExtensions()
+    test_util.SetAllPackedExtensions(message)
+    self.assertSameBytes(message)
+
+  def testInterleavedExtensions(self):
+    message = unittest_pb2.TestFieldOrderings()
+    test_util.SetAllFieldsAndExtensions(message)
+    test_util.ExpectAllFieldsAndExtensionsInOrder(self.assertSameBytes(message))
+    message.optional_nested_message.bb = 7
+    self.assertSameBytes(message)
+
+  def testNegativeAndLargeValues(self):
+    message = unittest_pb2.TestAllTypes()
+    message.optional_int32 = -1
+    message.optional_int64 = -(1 << 63)
+    message.optional_sint32 = -(1 << 31)
+    message.optional_sint64 = -(1 << 63)
+    message.optional_uint64 = (1 << 64) - 1
+    message.optional_float = float('inf')
+    message.optional_double = float('-inf')
+    message.optional_nested_enum = unittest_pb2.TestAllTypes.BAZ
+    message.repeated_int32.extend([-1, 0, 1, 1 << 20])
+    self.assertSameBytes(message)
+
+  def testUnknownFields(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    empty = unittest_pb2.TestEmptyMessage()
+    empty.MergeFromString(message.SerializeToString())
+    self.assertEqual(message.SerializeToString(), self.assertSameBytes(empty))
+
+  def testMessageSet(self):
+    message = unittest_mset_pb2.TestMessageSet()
+    extension1 = (
+        unittest_mset_pb2.TestMessageSetExtension1.message_set_extension)
+    extension2 = (
+        unittest_mset_pb2.TestMessageSetExtension2.message_set_extension)
+    message.Extensions[extension1].i = 123
+    message.Extensions[extension2].str = 'foo'
+    self.assertSameBytes(message)
+
+  def testOneof(self):
+    message = unittest_pb2.TestOneof2()
+    message.foo_message.qux_int = 5
+    message.bar_string = 'bar'
+    message.baz_int = 3
+    self.assertSameBytes(message)
+
+  def testProto3(self):
+    message = unittest_proto3_arena_pb2.TestAllTypes()
+    message.optional_int32 = 0
+    message.optional_string = 'hello'
+    message.optional_nested_message.bb = 0
+    message.repeated_int32.extend([1, 2, 3])
+    message.repeated_nested_enum.append(
+        unittest_proto3_arena_pb2.TestAllTypes.BAZ)
+    self.assertSameBytes(message)
+
+  def testParsedMessageIsReencoded(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    parsed = unittest_pb2.TestAllTypes()
+    parsed.ParseFromString(message.SerializeToString())
+    parsed.optional_nested_message.bb += 1
+    self.python_message.SetSerializationStrategy('compiled')
+    compiled = parsed.SerializeToString()
+    self.python_message.SetSerializationStrategy('generic')
+    self.assertEqual(parsed.SerializeToString(), compiled)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -41,12 +41,16 @@ are:
 
 __author__ = 'petar@google.com (Petar Petrov)'
 
+from google.protobuf.internal import message_listener
+
 class BaseContainer(object):
 
   """Base container class."""
 
   # Minimizes memory usage and disallows assignment to other attributes.
-  __slots__ = ['_message_listener', '_values']
+  # Messages refer weakly to the containers they return for fields which are
+  # not set, see python_message._GetUnsetValue().
+  __slots__ = ['_message_listener', '_values', '__weakref__']
 
   def __init__(self, message_listener):
     """
@@ -66,6 +70,11 @@ class BaseContainer(object):
     """Returns the number of elements in the container."""
     return len(self._values)
 
+  def __iter__(self):
+    """Iterates over the elements.  Much faster than going through
+    __getitem__(), which is what Python would do otherwise."""
+    return iter(self._values)
+
   def __ne__(self, other):
     """Checks if another instance isn't equal to this one."""
     # The concrete classes should define __eq__.
@@ -122,6 +131,12 @@ class RepeatedScalarFieldContainer(BaseContainer):
 
     if elem_seq is None:
       return
+    # array.array and numpy arrays convert themselves to a list of plain
+    # Python numbers in one call, which is much faster than iterating them
+    # (and numpy's own scalar types would not pass the type checks).
+    to_list = getattr(elem_seq, 'tolist', None)
+    if to_list is not None:
+      elem_seq = to_list()
     try:
       elem_seq_iter = iter(elem_seq)
     except TypeError:
@@ -191,7 +206,7 @@ class RepeatedScalarFieldContainer(BaseContainer):
     if self is other:
       return True
     # Special case for the same type which should be common and fast.
-    if isinstance(other, self.__class__):
+    if isinstance(other, RepeatedScalarFieldContainer):
       return other._values == self._values
     # We are presumably comparing against some other sequence type.
     return other == self._values
@@ -247,19 +262,81 @@ class RepeatedCompositeFieldContainer(BaseContainer):
       values.append(new_element)
     listener.Modified()
 
+  def _CheckAllocated(self, message):
+    """Raises unless message can be added to this container as it is."""
+    if message.__class__ is not self._message_descriptor._concrete_class:
+      raise TypeError('Expected a %s message, got %s.' % (
+          self._message_descriptor.full_name, type(message).__name__))
+    if message._listener.__class__ is not message_listener.NullMessageListener:
+      raise ValueError('The message already belongs to another message.')
+    if message._ReachedBy(self._message_listener):
+      raise ValueError(
+          'A message cannot be added to itself or to one of its sub-messages.')
+
+  def AddAllocated(self, message):
+    """Appends message itself, rather than a copy of it.
+
+    The container takes message over:  later changes to it are changes to this
+    field.  message must not belong to another message, and messages taken
+    out of one, for instance by pop(), del or Message.ClearField(), do not.
+    It must not hold this field either.
+    """
+    self._CheckAllocated(message)
+    message._SetListener(self._message_listener)
+    self._values.append(message)
+    self._message_listener.Modified()
+
+  def ExtendAllocated(self, elem_seq):
+    """Like AddAllocated() for each message in elem_seq.  Nothing is added
+    unless all of them can be.
+    """
+    messages = list(elem_seq)
+    for message in messages:
+      self._CheckAllocated(message)
+    if len(set(map(id, messages))) != len(messages):
+      raise ValueError('The same message cannot be added twice.')
+    listener = self._message_listener
+    for message in messages:
+      message._SetListener(listener)
+    self._values.extend(messages)
+    listener.Modified()
+
+  def SwapElements(self, index1, index2):
+    """Swaps the elements at the given indices, without copying them."""
+    values = self._values
+    values[index1], values[index2] = values[index2], values[index1]
+    self._message_listener.Modified()
+
   def MergeFrom(self, other):
     """Appends the contents of another repeated field of the same type to this
     one, copying each individual message.
     """
-    self.extend(other._values)
+    # Unlike extend(), the elements are known to be of the right type, so they
+    # are copied as they are instead of being merged into new messages.
+    if other._message_descriptor is not self._message_descriptor:
+      raise TypeError(
+          'Parameter to MergeFrom() must be a repeated field of %s messages, '
+          'got %s messages.' % (self._message_descriptor.full_name,
+                                other._message_descriptor.full_name))
+    listener = self._message_listener
+    append = self._values.append
+    for message in other._values:
+      new_element = message.__class__()
+      new_element._SetListener(listener)
+      new_element._CopyState(message)
+      append(new_element)
+    listener.Modified()
 
   def remove(self, elem):
     """Removes an item from the list. Similar to list.remove()."""
-    self._values.remove(elem)
-    self._message_listener.Modified()
+    self.__delitem__(self._values.index(elem))
 
   def pop(self, key=-1):
-    """Removes and returns an item at a given index. Similar to list.pop()."""
+    """Removes and returns an item at a given index. Similar to list.pop().
+
+    The item no longer belongs to the container, and can be added to another
+    one with AddAllocated().
+    """
     value = self._values[key]
     self.__delitem__(key)
     return value
@@ -270,19 +347,61 @@ class RepeatedCompositeFieldContainer(BaseContainer):
 
   def __delitem__(self, key):
     """Deletes the item at the specified position."""
-    del self._values[key]
+    values = self._values
+    if isinstance(key, slice):
+      removed = values[key]
+    else:
+      removed = (values[key],)
+    del values[key]
+    # Like pop(), leaves the items free to be added elsewhere.
+    for value in removed:
+      value._SetListener(None)
     self._message_listener.Modified()
 
   def __delslice__(self, start, stop):
     """Deletes the subset of items from between the specified indices."""
-    del self._values[start:stop]
-    self._message_listener.Modified()
+    self.__delitem__(slice(start, stop))
 
   def __eq__(self, other):
     """Compares the current instance with another one."""
     if self is other:
       return True
-    if not isinstance(other, self.__class__):
+    if not isinstance(other, RepeatedCompositeFieldContainer):
       raise TypeError('Can only compare repeated composite fields against '
                       'other repeated composite fields.')
     return self._values == other._values
+
+
+# Message.Freeze() changes the class of the repeated fields of the message to
+# one of the following, which have the same layout but refuse modifications.
+
+
+def _RaiseFrozen(self, *args, **kwargs):
+  raise AttributeError('Cannot modify a repeated field of a frozen message.')
+
+
+class FrozenRepeatedScalarFieldContainer(RepeatedScalarFieldContainer):
+
+  """RepeatedScalarFieldContainer of a frozen message."""
+
+  __slots__ = []
+
+  append = insert = extend = MergeFrom = remove = sort = _RaiseFrozen
+  __setitem__ = __setslice__ = __delitem__ = __delslice__ = _RaiseFrozen
+
+  def __hash__(self):
+    return hash(tuple(self._values))
+
+
+class FrozenRepeatedCompositeFieldContainer(RepeatedCompositeFieldContainer):
+
+  """RepeatedCompositeFieldContainer of a frozen message."""
+
+  __slots__ = []
+
+  add = extend = MergeFrom = remove = sort = _RaiseFrozen
+  AddAllocated = ExtendAllocated = SwapElements = _RaiseFrozen
+  __delitem__ = __delslice__ = _RaiseFrozen
+
+  def __hash__(self):
+    return hash(tuple(self._values))
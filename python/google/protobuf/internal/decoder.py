@@ -54,6 +54,11 @@ Note that decoders may throw any of the following:
   struct.error:  Unpacking of a fixed-width field failed.
   message.DecodeError:  Other errors.
 
+Decoders of sub-messages additionally set message._wire_span to False when the
+sub-message they parsed is left with a dirty cached size.  This tells the
+message that it cannot remember the span it was parsed from, since a later
+change to that sub-message would not be reported back up to it.
+
 Decoders are expected to raise an exception if they are called with pos > end.
 This allows callers to be lax about bounds checking:  it's fineto read past
 "end" as long as you are sure that someone else will notice and throw an
@@ -580,7 +585,10 @@ def GroupDecoder(field_number, is_repeated, is_packed, key, new_default):
         if value is None:
           value = field_dict.setdefault(key, new_default(message))
         # Read sub-message.
-        pos = value.add()._InternalParse(buffer, pos, end)
+        element = value.add()
+        pos = element._InternalParse(buffer, pos, end)
+        if element._cached_byte_size_dirty:
+          message._wire_span = False
         # Read end tag.
         new_pos = pos+end_tag_len
         if buffer[pos:new_pos] != end_tag_bytes or new_pos > end:
@@ -598,6 +606,8 @@ def GroupDecoder(field_number, is_repeated, is_packed, key, new_default):
         value = field_dict.setdefault(key, new_default(message))
       # Read sub-message.
       pos = value._InternalParse(buffer, pos, end)
+      if value._cached_byte_size_dirty:
+        message._wire_span = False
       # Read end tag.
       new_pos = pos+end_tag_len
       if buffer[pos:new_pos] != end_tag_bytes or new_pos > end:
@@ -627,10 +637,13 @@ def MessageDecoder(field_number, is_repeated, is_packed, key, new_default):
         if new_pos > end:
           raise _DecodeError('Truncated message.')
         # Read sub-message.
-        if value.add()._InternalParse(buffer, pos, new_pos) != new_pos:
+        element = value.add()
+        if element._InternalParse(buffer, pos, new_pos) != new_pos:
           # The only reason _InternalParse would return early is if it
           # encountered an end-group tag.
           raise _DecodeError('Unexpected end-group tag.')
+        if element._cached_byte_size_dirty:
+          message._wire_span = False
         # Predict that the next tag is another copy of the same repeated field.
         pos = new_pos + tag_len
         if buffer[new_pos:pos] != tag_bytes or new_pos == end:
@@ -652,6 +665,8 @@ def MessageDecoder(field_number, is_repeated, is_packed, key, new_default):
         # The only reason _InternalParse would return early is if it encountered
         # an end-group tag.
         raise _DecodeError('Unexpected end-group tag.')
+      if value._cached_byte_size_dirty:
+        message._wire_span = False
       return new_pos
     return DecodeField
 
@@ -722,6 +737,8 @@ def MessageSetItemDecoder(extensions_by_number):
         # The only reason _InternalParse would return early is if it encountered
         # an end-group tag.
         raise _DecodeError('Unexpected end-group tag.')
+      # The extension has no listener, so changes to it would not reach us.
+      message._wire_span = False
     else:
       if not message._unknown_fields:
         message._unknown_fields = []
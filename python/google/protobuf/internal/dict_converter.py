@@ -0,0 +1,290 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Converts pure Python messages to and from native dicts.
+
+This is the implementation of dict_format for the pure Python implementation.
+The code converting a message type is put together the first time that type is
+converted and kept, as a table mapping each field to its dict key and to a
+function for its values.  Values are read from and written to _fields
+directly:  each value written is checked once by the type checker of its field,
+and sub-messages are filled in place instead of being built on their own and
+then copied with MergeFrom().
+"""
+
+from google.protobuf.internal import type_checkers
+from google.protobuf import descriptor as descriptor_mod
+
+_FieldDescriptor = descriptor_mod.FieldDescriptor
+
+
+# Functions returning the dict of a message, keyed by the message descriptor
+# and the options.
+_to_dict_functions = {}
+
+
+def MessageToDict(message, use_field_numbers, use_enum_names):
+  """Converts a message to a dict, see dict_format.MessageToDict()."""
+  return _GetToDict(message.DESCRIPTOR, use_field_numbers, use_enum_names)(
+      message)
+
+
+def _GetToDict(message_descriptor, use_field_numbers, use_enum_names):
+  key = (message_descriptor, use_field_numbers, use_enum_names)
+  to_dict = _to_dict_functions.get(key)
+  if to_dict is None:
+    to_dict = _MakeToDict(message_descriptor, use_field_numbers,
+                          use_enum_names)
+    _to_dict_functions[key] = to_dict
+  return to_dict
+
+
+def _MakeToDict(message_descriptor, use_field_numbers, use_enum_names):
+  """Returns a function converting messages of one type to dicts."""
+
+  def SubMessageConverter(message_type):
+    # Looked up on first use, since message types can be recursive.
+    to_dict = []
+    def Convert(value):
+      if not to_dict:
+        to_dict.append(_GetToDict(message_type, use_field_numbers,
+                                  use_enum_names))
+      return to_dict[0](value)
+    return Convert
+
+  def ValueConverter(field):
+    """Returns a function converting a value of field, or None if values of
+    field go into the dict as they are."""
+    repeated = field.label == _FieldDescriptor.LABEL_REPEATED
+    if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      if type_checkers.IsMapEntry(field):
+        entry_type = field.message_type
+        convert_value = ValueConverter(entry_type.fields_by_name['value'])
+        if convert_value is None:
+          return lambda value: dict(
+              (entry.key, entry.value) for entry in value._values)
+        return lambda value: dict(
+            (entry.key, convert_value(entry.value)) for entry in value._values)
+      convert = SubMessageConverter(field.message_type)
+      if repeated:
+        return lambda value: [convert(element) for element in value._values]
+      return convert
+    if field.cpp_type == _FieldDescriptor.CPPTYPE_ENUM and use_enum_names:
+      names = dict((number, enum_value.name) for number, enum_value
+                   in field.enum_type.values_by_number.iteritems())
+      if repeated:
+        return lambda value: [names.get(element, element)
+                              for element in value._values]
+      return lambda value: names.get(value, value)
+    if repeated:
+      return lambda value: list(value._values)
+    return None
+
+  def MakeEntry(field):
+    if use_field_numbers:
+      key = field.number
+    elif field.is_extension:
+      key = field.full_name
+    else:
+      key = field.name
+    return key, ValueConverter(field)
+
+  # Entries for extensions are added the first time they are converted.
+  entries = dict((field, MakeEntry(field))
+                 for field in message_descriptor.fields)
+
+  def ToDict(message):
+    result = {}
+    for field, value in message._ListFields():
+      entry = entries.get(field)
+      if entry is None:
+        entry = entries.setdefault(field, MakeEntry(field))
+      key, convert = entry
+      if convert is None:
+        result[key] = value
+      else:
+        result[key] = convert(value)
+    return result
+  return ToDict
+
+
+# Functions merging a dict into a message, keyed by the message descriptor.
+_from_dict_functions = {}
+
+
+def DictToMessage(values, message):
+  """Merges a dict into a message, see dict_format.DictToMessage()."""
+  _GetFromDict(message.DESCRIPTOR)(values, message)
+  return message
+
+
+def _GetFromDict(message_descriptor):
+  from_dict = _from_dict_functions.get(message_descriptor)
+  if from_dict is None:
+    from_dict = _MakeFromDict(message_descriptor)
+    _from_dict_functions[message_descriptor] = from_dict
+  return from_dict
+
+
+def _CheckIterable(field, value):
+  if isinstance(value, (basestring, bytes, dict)):
+    raise TypeError('Expected a sequence of values for repeated field %s, '
+                    'got %r.' % (field.full_name, value))
+
+
+def _MakeFromDict(message_descriptor):
+  """Returns a function merging dicts into messages of one type."""
+
+  def SubMessageMerger(message_type):
+    # Looked up on first use, since message types can be recursive.
+    from_dict = []
+    def Merge(value, message):
+      if isinstance(value, dict):
+        if not from_dict:
+          from_dict.append(_GetFromDict(message_type))
+        from_dict[0](value, message)
+      else:
+        message.MergeFrom(value)
+    return Merge
+
+  def ScalarChecker(field):
+    """Returns a function checking and converting a value for field."""
+    check_value = type_checkers.GetTypeChecker(field).CheckValue
+    if field.cpp_type != _FieldDescriptor.CPPTYPE_ENUM:
+      return check_value
+    values_by_name = field.enum_type.values_by_name
+    def CheckEnum(value):
+      if isinstance(value, basestring):
+        enum_value = values_by_name.get(value)
+        if enum_value is None:
+          raise ValueError('Enum type "%s" has no value named %s.' %
+                           (field.enum_type.full_name, value))
+        return enum_value.number
+      return check_value(value)
+    return CheckEnum
+
+  def FieldSetter(field):
+    """Returns a function which merges the dict value of field into a
+    message, and is called with (message, fields, value), fields being the
+    _fields of message."""
+    repeated = field.label == _FieldDescriptor.LABEL_REPEATED
+
+    if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      if type_checkers.IsMapEntry(field):
+        merge_entry = SubMessageMerger(field.message_type)
+        def SetMap(message, fields, value):
+          container = fields.get(field)
+          if container is None:
+            container = field._default_constructor(message)
+            fields[field] = container
+          for key, map_value in value.iteritems():
+            merge_entry({'key': key, 'value': map_value}, container.add())
+        return SetMap
+      merge = SubMessageMerger(field.message_type)
+      if repeated:
+        def SetRepeatedMessage(message, fields, value):
+          _CheckIterable(field, value)
+          container = fields.get(field)
+          if container is None:
+            container = field._default_constructor(message)
+            fields[field] = container
+          message_class = field.message_type._concrete_class
+          listener = container._message_listener
+          append = container._values.append
+          for element in value:
+            new_element = message_class()
+            new_element._SetListener(listener)
+            merge(element, new_element)
+            new_element._Modified()
+            append(new_element)
+        return SetRepeatedMessage
+      def SetMessage(message, fields, value):
+        sub_message = fields.get(field)
+        if sub_message is None:
+          sub_message = field._default_constructor(message)
+          fields[field] = sub_message
+        sub_message._Modified()
+        merge(value, sub_message)
+      return SetMessage
+
+    check = ScalarChecker(field)
+    if repeated:
+      def SetRepeatedScalar(message, fields, value):
+        _CheckIterable(field, value)
+        new_values = [check(element) for element in value]
+        container = fields.get(field)
+        if container is None:
+          container = field._default_constructor(message)
+          fields[field] = container
+        container._values.extend(new_values)
+      return SetRepeatedScalar
+    if field.containing_oneof:
+      def SetOneofScalar(message, fields, value):
+        fields[field] = check(value)
+        message._UpdateOneofState(field)
+      return SetOneofScalar
+    if message_descriptor.syntax == 'proto3':
+      def SetProto3Scalar(message, fields, value):
+        value = check(value)
+        # As with the setter, default values leave the field unset.
+        if value:
+          fields[field] = value
+        else:
+          fields.pop(field, None)
+      return SetProto3Scalar
+    def SetScalar(message, fields, value):
+      fields[field] = check(value)
+    return SetScalar
+
+  # Fields can be given by name or by number.  Extensions are added the first
+  # time they are seen, under their full name or number.
+  setters = {}
+  for field in message_descriptor.fields:
+    setters[field.name] = setters[field.number] = FieldSetter(field)
+
+  def FromDict(values, message):
+    if not isinstance(values, dict):
+      raise TypeError('Expected a dict for message %s, got %r.' %
+                      (message_descriptor.full_name, values))
+    message._Modified()
+    message._UnshareFields()
+    fields = message._fields
+    for key, value in values.iteritems():
+      setter = setters.get(key)
+      if setter is None:
+        extension = (message._extensions_by_name.get(key) or
+                     message._extensions_by_number.get(key))
+        if extension is None:
+          raise ValueError('Protocol message %s has no "%s" field.' %
+                           (message_descriptor.name, key))
+        setter = setters.setdefault(key, FieldSetter(extension))
+      if value is not None:
+        setter(message, fields, value)
+  return FromDict
@@ -0,0 +1,212 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for google.protobuf.dict_format."""
+
+import unittest
+
+from google.protobuf import dict_format
+from google.protobuf import unittest_pb2
+from google.protobuf import unittest_proto3_arena_pb2
+from google.protobuf.internal import test_util
+
+
+class DictFormatTest(unittest.TestCase):
+
+  message_to_dict = staticmethod(dict_format.MessageToDict)
+  dict_to_message = staticmethod(dict_format.DictToMessage)
+
+  def testMessageToDict(self):
+    message = unittest_pb2.TestAllTypes(
+        optional_int64=-2, optional_bytes=b'\xff',
+        optional_nested_enum=unittest_pb2.TestAllTypes.BAZ,
+        repeated_int32=[1, 2])
+    message.optional_nested_message.bb = 3
+    message.repeated_nested_message.add(bb=4)
+    message.repeated_nested_message.add()
+    self.assertEqual(
+        {'optional_int64': -2, 'optional_bytes': b'\xff',
+         'optional_nested_message': {'bb': 3},
+         'optional_nested_enum': unittest_pb2.TestAllTypes.BAZ,
+         'repeated_int32': [1, 2],
+         'repeated_nested_message': [{'bb': 4}, {}]},
+        self.message_to_dict(message))
+    self.assertEqual({}, self.message_to_dict(unittest_pb2.TestAllTypes()))
+
+  def testOptions(self):
+    message = unittest_pb2.TestAllTypes(
+        optional_int32=1, optional_nested_enum=unittest_pb2.TestAllTypes.BAZ,
+        repeated_foreign_enum=[unittest_pb2.FOREIGN_FOO])
+    message.optional_nested_message.bb = 3
+    self.assertEqual(
+        {1: 1, 18: {1: 3}, 21: unittest_pb2.TestAllTypes.BAZ,
+         52: [unittest_pb2.FOREIGN_FOO]},
+        self.message_to_dict(message, use_field_numbers=True))
+    values = self.message_to_dict(message, use_enum_names=True)
+    self.assertEqual('BAZ', values['optional_nested_enum'])
+    self.assertEqual(['FOREIGN_FOO'], values['repeated_foreign_enum'])
+    for values in [
+        {1: 1, 18: {1: 3}, 21: 3, 52: [4]},
+        {'optional_int32': 1, 'optional_nested_message': {'bb': 3},
+         'optional_nested_enum': 'BAZ',
+         'repeated_foreign_enum': ['FOREIGN_FOO']}]:
+      self.assertEqual(message, self.dict_to_message(
+          values, unittest_pb2.TestAllTypes()))
+
+  def testRoundTrip(self):
+    for message_class in [unittest_pb2.TestAllTypes,
+                          unittest_proto3_arena_pb2.TestAllTypes]:
+      message = message_class()
+      test_util.SetAllFields(message)
+      for options in [{}, {'use_field_numbers': True},
+                      {'use_enum_names': True}]:
+        parsed = self.dict_to_message(
+            self.message_to_dict(message, **options), message_class())
+        self.assertEqual(message, parsed)
+
+  def testExtensions(self):
+    message = unittest_pb2.TestAllExtensions()
+    test_util.SetAllExtensions(message)
+    values = self.message_to_dict(message)
+    self.assertEqual(101, values['protobuf_unittest.optional_int32_extension'])
+    self.assertEqual(message, self.dict_to_message(
+        values, unittest_pb2.TestAllExtensions()))
+    self.assertEqual(message, self.dict_to_message(
+        self.message_to_dict(message, use_field_numbers=True),
+        unittest_pb2.TestAllExtensions()))
+
+  def testMapField(self):
+    counter_class = test_util.MakeMapClass()
+    values = {'counts': {u'a': 1, u'b': 2}}
+    counter = self.dict_to_message(values, counter_class())
+    self.assertEqual(2, len(counter.counts))
+    self.assertEqual(values, self.message_to_dict(counter))
+
+  def testMergesIntoMessage(self):
+    message = unittest_pb2.TestAllTypes(repeated_int32=[1])
+    message.optional_nested_message.bb = 1
+    message = unittest_pb2.TestAllTypes.FromString(
+        message.SerializeToString())
+    self.assertTrue(message is self.dict_to_message(
+        {'repeated_int32': [2], 'optional_int32': None,
+         'optional_foreign_message': {},
+         'optional_nested_message': unittest_pb2.TestAllTypes.NestedMessage(),
+         'repeated_nested_message': [
+             {'bb': 2}, unittest_pb2.TestAllTypes.NestedMessage(bb=3)]},
+        message))
+    self.assertEqual([1, 2], message.repeated_int32)
+    self.assertFalse(message.HasField('optional_int32'))
+    self.assertTrue(message.HasField('optional_foreign_message'))
+    self.assertEqual(1, message.optional_nested_message.bb)
+    self.assertEqual(
+        [2, 3], [element.bb for element in message.repeated_nested_message])
+    self.assertEqual(message, unittest_pb2.TestAllTypes.FromString(
+        message.SerializeToString()))
+
+  def testSubMessagesNotifyParent(self):
+    message = self.dict_to_message(
+        {'optional_nested_message': {'bb': 1},
+         'repeated_nested_message': [{'bb': 2}]},
+        unittest_pb2.TestAllTypes())
+    message.SerializeToString()
+    message.optional_nested_message.bb = 3
+    message.repeated_nested_message[0].bb = 4
+    parsed = unittest_pb2.TestAllTypes.FromString(message.SerializeToString())
+    self.assertEqual(3, parsed.optional_nested_message.bb)
+    self.assertEqual(4, parsed.repeated_nested_message[0].bb)
+
+  def testOneof(self):
+    message = self.dict_to_message({'oneof_uint32': 1},
+                                   unittest_pb2.TestAllTypes())
+    self.dict_to_message({'oneof_string': u'a'}, message)
+    self.assertEqual('oneof_string', message.WhichOneof('oneof_field'))
+    self.assertFalse(message.HasField('oneof_uint32'))
+    self.dict_to_message({'oneof_nested_message': {}}, message)
+    self.assertEqual('oneof_nested_message', message.WhichOneof('oneof_field'))
+    self.assertEqual({'oneof_nested_message': {}},
+                     self.message_to_dict(message))
+
+  def testProto3DefaultValues(self):
+    message = unittest_proto3_arena_pb2.TestAllTypes(optional_int32=1)
+    self.dict_to_message({'optional_int32': 0, 'optional_string': u''},
+                         message)
+    self.assertEqual({}, self.message_to_dict(message))
+    self.assertEqual(b'', message.SerializeToString())
+
+  def testErrors(self):
+    for values, error in [
+        ({'no_such_field': 1}, ValueError), ({1000: 1}, ValueError),
+        ({'optional_int32': u'1'}, TypeError),
+        ({'optional_int32': 2 ** 32}, ValueError),
+        ({'optional_string': 1}, TypeError),
+        ({'optional_nested_enum': 'NOPE'}, ValueError),
+        ({'repeated_int32': 1}, TypeError),
+        ({'repeated_string': u'ab'}, TypeError),
+        ({'repeated_int32': [1, u'2']}, TypeError),
+        ({'optional_nested_message': []}, TypeError),
+        ({'optional_nested_message': unittest_pb2.ForeignMessage()},
+         TypeError),
+        ({'optional_nested_message': {'bb': u'x'}}, TypeError),
+        ([], TypeError)]:
+      self.assertRaises(error, self.dict_to_message, values,
+                        unittest_pb2.TestAllTypes())
+
+
+class GenericDictFormatTest(DictFormatTest):
+  """Runs the tests through the public message API fallback."""
+
+  @staticmethod
+  def message_to_dict(message, use_field_numbers=False, use_enum_names=False):
+    return dict_format._GenericMessageToDict(
+        message, use_field_numbers, use_enum_names)
+
+  dict_to_message = staticmethod(dict_format._GenericDictToMessage)
+
+  def testMatchesConverter(self):
+    # With the pure Python implementation, dict_format uses dict_converter,
+    # and both have to give the same results.
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    counter = dict_format.DictToMessage({'counts': {u'a': 1, u'b': 2}},
+                                        test_util.MakeMapClass()())
+    for value in [message, counter]:
+      for options in [{}, {'use_field_numbers': True},
+                      {'use_enum_names': True}]:
+        values = self.message_to_dict(value, **options)
+        self.assertEqual(dict_format.MessageToDict(value, **options), values)
+        self.assertEqual(
+            dict_format.DictToMessage(values, value.__class__()),
+            self.dict_to_message(values, value.__class__()))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -274,12 +274,28 @@ def BytesSizer(field_number, is_repeated, is_packed):
     return FieldSize
 
 
-def GroupSizer(field_number, is_repeated, is_packed):
+# Like encoders of sub-messages (see MessageEncoder()), sizers of sub-messages
+# call their ByteSize() method, or the method named size_method.
+
+
+def GroupSizer(field_number, is_repeated, is_packed, size_method='ByteSize'):
   """Returns a sizer for a group field."""
 
   tag_size = _TagSize(field_number) * 2
   assert not is_packed
-  if is_repeated:
+  if size_method != 'ByteSize':
+    if is_repeated:
+      def RepeatedFieldSize(value):
+        result = tag_size * len(value)
+        for element in value:
+          result += getattr(element, size_method)()
+        return result
+      return RepeatedFieldSize
+    else:
+      def FieldSize(value):
+        return tag_size + getattr(value, size_method)()
+      return FieldSize
+  elif is_repeated:
     def RepeatedFieldSize(value):
       result = tag_size * len(value)
       for element in value:
@@ -292,13 +308,27 @@ def GroupSizer(field_number, is_repeated, is_packed):
     return FieldSize
 
 
-def MessageSizer(field_number, is_repeated, is_packed):
+def MessageSizer(field_number, is_repeated, is_packed, size_method='ByteSize'):
   """Returns a sizer for a message field."""
 
   tag_size = _TagSize(field_number)
   local_VarintSize = _VarintSize
   assert not is_packed
-  if is_repeated:
+  if size_method != 'ByteSize':
+    if is_repeated:
+      def RepeatedFieldSize(value):
+        result = tag_size * len(value)
+        for element in value:
+          l = getattr(element, size_method)()
+          result += local_VarintSize(l) + l
+        return result
+      return RepeatedFieldSize
+    else:
+      def FieldSize(value):
+        l = getattr(value, size_method)()
+        return tag_size + local_VarintSize(l) + l
+      return FieldSize
+  elif is_repeated:
     def RepeatedFieldSize(value):
       result = tag_size * len(value)
       for element in value:
@@ -317,7 +347,7 @@ def MessageSizer(field_number, is_repeated, is_packed):
 # MessageSet is special.
 
 
-def MessageSetItemSizer(field_number):
+def MessageSetItemSizer(field_number, size_method='ByteSize'):
   """Returns a sizer for extensions of MessageSet.
 
   The message set message looks like this:
@@ -333,7 +363,7 @@ def MessageSetItemSizer(field_number):
   local_VarintSize = _VarintSize
 
   def FieldSize(value):
-    l = value.ByteSize()
+    l = getattr(value, size_method)()
     return static_size + local_VarintSize(l) + l
 
   return FieldSize
@@ -343,19 +373,83 @@ def MessageSetItemSizer(field_number):
 # Encoders!
 
 
+_chr = _PY2 and chr or (lambda x: bytes((x,)))  ##PY25
+##!PY25_chr = chr if bytes is str else lambda x: bytes((x,))
+_EMPTY_BYTES = "".encode("latin1")  ##PY25
+##!PY25_EMPTY_BYTES = b""
+
+
+_BYTE_TABLE = [_chr(i) for i in range(256)]
+
+
+def _ComputeVarintBytes(value):
+  """Encode a non-negative integer as a varint, one byte at a time."""
+
+  local_table = _BYTE_TABLE
+  pieces = []
+  bits = value & 0x7f
+  value >>= 7
+  while value:
+    pieces.append(local_table[0x80|bits])
+    bits = value & 0x7f
+    value >>= 7
+  pieces.append(local_table[bits])
+  return _EMPTY_BYTES.join(pieces)
+
+
+# Varints below _VARINT_TABLE_SIZE are looked up instead of being computed.
+# That covers every value which fits in two bytes:  nearly all lengths of
+# strings and sub-messages, enum values and small integers.  Entry
+# (high << 7 | low) of the two-byte part is simply chr(0x80 | low) + chr(high).
+_VARINT_TABLE_SIZE = 1 << 14
+_VARINT_TABLE = _BYTE_TABLE[:0x80] + [
+    _BYTE_TABLE[0x80 | low] + _BYTE_TABLE[high]
+    for high in range(1, 0x80) for low in range(0x80)]
+
+
+def _VarintBytesEncoder():
+  """Return a function which encodes a varint value (no tag) into bytes."""
+
+  local_table = _VARINT_TABLE
+  table_size = _VARINT_TABLE_SIZE
+  local_ComputeVarintBytes = _ComputeVarintBytes
+  def VarintBytes(value):
+    if value < table_size:
+      if value >= 0:
+        return local_table[value]
+      raise ValueError('Negative value for an unsigned varint: %d' % value)
+    return local_ComputeVarintBytes(value)
+
+  return VarintBytes
+
+
+def _SignedVarintBytesEncoder():
+  """Return a function which encodes a signed varint value (no tag) into
+  bytes."""
+
+  local_table = _VARINT_TABLE
+  table_size = _VARINT_TABLE_SIZE
+  local_ComputeVarintBytes = _ComputeVarintBytes
+  def SignedVarintBytes(value):
+    if value < table_size:
+      if value >= 0:
+        return local_table[value]
+      value += (1 << 64)
+    return local_ComputeVarintBytes(value)
+
+  return SignedVarintBytes
+
+
+_VarintBytes = _VarintBytesEncoder()
+_SignedVarintBytes = _SignedVarintBytesEncoder()
+
+
 def _VarintEncoder():
   """Return an encoder for a basic varint value (does not include tag)."""
 
-  local_chr = _PY2 and chr or (lambda x: bytes((x,)))  ##PY25
-##!PY25  local_chr = chr if bytes is str else lambda x: bytes((x,))
+  local_VarintBytes = _VarintBytes
   def EncodeVarint(write, value):
-    bits = value & 0x7f
-    value >>= 7
-    while value:
-      write(local_chr(0x80|bits))
-      bits = value & 0x7f
-      value >>= 7
-    return write(local_chr(bits))
+    return write(local_VarintBytes(value))
 
   return EncodeVarint
 
@@ -364,18 +458,9 @@ def _SignedVarintEncoder():
   """Return an encoder for a basic signed varint value (does not include
   tag)."""
 
-  local_chr = _PY2 and chr or (lambda x: bytes((x,)))  ##PY25
-##!PY25  local_chr = chr if bytes is str else lambda x: bytes((x,))
+  local_SignedVarintBytes = _SignedVarintBytes
   def EncodeSignedVarint(write, value):
-    if value < 0:
-      value += (1 << 64)
-    bits = value & 0x7f
-    value >>= 7
-    while value:
-      write(local_chr(0x80|bits))
-      bits = value & 0x7f
-      value >>= 7
-    return write(local_chr(bits))
+    return write(local_SignedVarintBytes(value))
 
   return EncodeSignedVarint
 
@@ -384,16 +469,6 @@ _EncodeVarint = _VarintEncoder()
 _EncodeSignedVarint = _SignedVarintEncoder()
 
 
-def _VarintBytes(value):
-  """Encode the given integer as a varint and return the bytes.  This is only
-  called at startup time so it doesn't need to be fast."""
-
-  pieces = []
-  _EncodeVarint(pieces.append, value)
-  return "".encode("latin1").join(pieces)  ##PY25
-##!PY25  return b"".join(pieces)
-
-
 def TagBytes(field_number, wire_type):
   """Encode the given tag and return the bytes.  Only called at startup."""
 
@@ -402,78 +477,73 @@ def TagBytes(field_number, wire_type):
 # --------------------------------------------------------------------
 # As with sizers (see above), we have a number of common encoder
 # implementations.
+#
+# Every varint, and every tag together with the value that follows it, goes
+# out in a single write() call, and repeated fields are joined into one byte
+# string before being written.  Calls to write() are far more expensive than
+# building short byte strings.  Note that repeated fields are never empty when
+# they are encoded, since ListFields() skips empty ones.
 
 
-def _SimpleEncoder(wire_type, encode_value, compute_value_size):
+def _SimpleEncoder(wire_type, value_bytes):
   """Return a constructor for an encoder for fields of a particular type.
 
   Args:
       wire_type:  The field's wire type, for encoding tags.
-      encode_value:  A function which encodes an individual value, e.g.
-        _EncodeVarint().
-      compute_value_size:  A function which computes the size of an individual
-        value, e.g. _VarintSize().
+      value_bytes:  A function which encodes an individual value into bytes,
+        e.g. _VarintBytes().
   """
 
   def SpecificEncoder(field_number, is_repeated, is_packed):
     if is_packed:
       tag_bytes = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
-      local_EncodeVarint = _EncodeVarint
+      local_VarintBytes = _VarintBytes
+      local_join = _EMPTY_BYTES.join
       def EncodePackedField(write, value):
-        write(tag_bytes)
-        size = 0
-        for element in value:
-          size += compute_value_size(element)
-        local_EncodeVarint(write, size)
-        for element in value:
-          encode_value(write, element)
+        payload = local_join([value_bytes(element) for element in value])
+        write(tag_bytes + local_VarintBytes(len(payload)))
+        return write(payload)
       return EncodePackedField
     elif is_repeated:
       tag_bytes = TagBytes(field_number, wire_type)
       def EncodeRepeatedField(write, value):
-        for element in value:
-          write(tag_bytes)
-          encode_value(write, element)
+        return write(tag_bytes + tag_bytes.join(
+            [value_bytes(element) for element in value]))
       return EncodeRepeatedField
     else:
       tag_bytes = TagBytes(field_number, wire_type)
       def EncodeField(write, value):
-        write(tag_bytes)
-        return encode_value(write, value)
+        return write(tag_bytes + value_bytes(value))
       return EncodeField
 
   return SpecificEncoder
 
 
-def _ModifiedEncoder(wire_type, encode_value, compute_value_size, modify_value):
+def _ModifiedEncoder(wire_type, value_bytes, modify_value):
   """Like SimpleEncoder but additionally invokes modify_value on every value
-  before passing it to encode_value.  Usually modify_value is ZigZagEncode."""
+  before passing it to value_bytes.  Usually modify_value is ZigZagEncode."""
 
   def SpecificEncoder(field_number, is_repeated, is_packed):
     if is_packed:
       tag_bytes = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
-      local_EncodeVarint = _EncodeVarint
+      local_VarintBytes = _VarintBytes
+      local_join = _EMPTY_BYTES.join
       def EncodePackedField(write, value):
-        write(tag_bytes)
-        size = 0
-        for element in value:
-          size += compute_value_size(modify_value(element))
-        local_EncodeVarint(write, size)
-        for element in value:
-          encode_value(write, modify_value(element))
+        payload = local_join(
+            [value_bytes(modify_value(element)) for element in value])
+        write(tag_bytes + local_VarintBytes(len(payload)))
+        return write(payload)
       return EncodePackedField
     elif is_repeated:
       tag_bytes = TagBytes(field_number, wire_type)
       def EncodeRepeatedField(write, value):
-        for element in value:
-          write(tag_bytes)
-          encode_value(write, modify_value(element))
+        return write(tag_bytes + tag_bytes.join(
+            [value_bytes(modify_value(element)) for element in value]))
       return EncodeRepeatedField
     else:
       tag_bytes = TagBytes(field_number, wire_type)
       def EncodeField(write, value):
-        write(tag_bytes)
-        return encode_value(write, modify_value(value))
+        return write(tag_bytes + value_bytes(modify_value(value)))
       return EncodeField
 
   return SpecificEncoder
@@ -493,25 +563,23 @@ def _StructPackEncoder(wire_type, format):
     local_struct_pack = struct.pack
     if is_packed:
       tag_bytes = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
-      local_EncodeVarint = _EncodeVarint
+      local_VarintBytes = _VarintBytes
+      # One struct.pack() call packs the whole field, e.g. '<100d'.
+      bulk_format = '<%d' + format[1:]
       def EncodePackedField(write, value):
-        write(tag_bytes)
-        local_EncodeVarint(write, len(value) * value_size)
-        for element in value:
-          write(local_struct_pack(format, element))
+        write(tag_bytes + local_VarintBytes(len(value) * value_size))
+        return write(local_struct_pack(bulk_format % len(value), *value))
       return EncodePackedField
     elif is_repeated:
       tag_bytes = TagBytes(field_number, wire_type)
       def EncodeRepeatedField(write, value):
-        for element in value:
-          write(tag_bytes)
-          write(local_struct_pack(format, element))
+        return write(tag_bytes + tag_bytes.join(
+            [local_struct_pack(format, element) for element in value]))
       return EncodeRepeatedField
     else:
       tag_bytes = TagBytes(field_number, wire_type)
       def EncodeField(write, value):
-        write(tag_bytes)
-        return write(local_struct_pack(format, value))
+        return write(tag_bytes + local_struct_pack(format, value))
       return EncodeField
 
   return SpecificEncoder
@@ -532,70 +600,76 @@ def _FloatingPointEncoder(wire_type, format):
   b = _PY2 and (lambda x:x) or (lambda x:x.encode('latin1'))  ##PY25
   value_size = struct.calcsize(format)
   if value_size == 4:
-    def EncodeNonFiniteOrRaise(write, value):
+    def NonFiniteBytesOrRaise(value):
       # Remember that the serialized form uses little-endian byte order.
       if value == _POS_INF:
-        write(b('\x00\x00\x80\x7F'))  ##PY25
-##!PY25        write(b'\x00\x00\x80\x7F')
+        return b('\x00\x00\x80\x7F')  ##PY25
+##!PY25        return b'\x00\x00\x80\x7F'
       elif value == _NEG_INF:
-        write(b('\x00\x00\x80\xFF'))  ##PY25
-##!PY25        write(b'\x00\x00\x80\xFF')
+        return b('\x00\x00\x80\xFF')  ##PY25
+##!PY25        return b'\x00\x00\x80\xFF'
       elif value != value:           # NaN
-        write(b('\x00\x00\xC0\x7F'))  ##PY25
-##!PY25        write(b'\x00\x00\xC0\x7F')
+        return b('\x00\x00\xC0\x7F')  ##PY25
+##!PY25        return b'\x00\x00\xC0\x7F'
       else:
         raise
   elif value_size == 8:
-    def EncodeNonFiniteOrRaise(write, value):
+    def NonFiniteBytesOrRaise(value):
       if value == _POS_INF:
-        write(b('\x00\x00\x00\x00\x00\x00\xF0\x7F'))  ##PY25
-##!PY25        write(b'\x00\x00\x00\x00\x00\x00\xF0\x7F')
+        return b('\x00\x00\x00\x00\x00\x00\xF0\x7F')  ##PY25
+##!PY25        return b'\x00\x00\x00\x00\x00\x00\xF0\x7F'
       elif value == _NEG_INF:
-        write(b('\x00\x00\x00\x00\x00\x00\xF0\xFF'))  ##PY25
-##!PY25        write(b'\x00\x00\x00\x00\x00\x00\xF0\xFF')
+        return b('\x00\x00\x00\x00\x00\x00\xF0\xFF')  ##PY25
+##!PY25        return b'\x00\x00\x00\x00\x00\x00\xF0\xFF'
       elif value != value:                         # NaN
-        write(b('\x00\x00\x00\x00\x00\x00\xF8\x7F'))  ##PY25
-##!PY25        write(b'\x00\x00\x00\x00\x00\x00\xF8\x7F')
+        return b('\x00\x00\x00\x00\x00\x00\xF8\x7F')  ##PY25
+##!PY25        return b'\x00\x00\x00\x00\x00\x00\xF8\x7F'
       else:
         raise
   else:
     raise ValueError('Can\'t encode floating-point values that are '
                      '%d bytes long (only 4 or 8)' % value_size)
 
+  local_struct_pack = struct.pack
+  def PackOne(value):
+    # This try/except block is going to be faster than any code that we could
+    # write to check whether value is finite.
+    try:
+      return local_struct_pack(format, value)
+    except SystemError:
+      return NonFiniteBytesOrRaise(value)
+
   def SpecificEncoder(field_number, is_repeated, is_packed):
-    local_struct_pack = struct.pack
     if is_packed:
       tag_bytes = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
-      local_EncodeVarint = _EncodeVarint
+      local_VarintBytes = _VarintBytes
+      local_join = _EMPTY_BYTES.join
+      bulk_format = '<%d' + format[1:]
       def EncodePackedField(write, value):
-        write(tag_bytes)
-        local_EncodeVarint(write, len(value) * value_size)
-        for element in value:
-          # This try/except block is going to be faster than any code that
-          # we could write to check whether element is finite.
-          try:
-            write(local_struct_pack(format, element))
-          except SystemError:
-            EncodeNonFiniteOrRaise(write, element)
+        write(tag_bytes + local_VarintBytes(len(value) * value_size))
+        try:
+          payload = local_struct_pack(bulk_format % len(value), *value)
+        except SystemError:
+          payload = local_join([PackOne(element) for element in value])
+        return write(payload)
       return EncodePackedField
     elif is_repeated:
       tag_bytes = TagBytes(field_number, wire_type)
       def EncodeRepeatedField(write, value):
-        for element in value:
-          write(tag_bytes)
-          try:
-            write(local_struct_pack(format, element))
-          except SystemError:
-            EncodeNonFiniteOrRaise(write, element)
+        try:
+          payload = tag_bytes.join(
+              [local_struct_pack(format, element) for element in value])
+        except SystemError:
+          payload = tag_bytes.join([PackOne(element) for element in value])
+        return write(tag_bytes + payload)
       return EncodeRepeatedField
     else:
       tag_bytes = TagBytes(field_number, wire_type)
       def EncodeField(write, value):
-        write(tag_bytes)
         try:
-          write(local_struct_pack(format, value))
+          return write(tag_bytes + local_struct_pack(format, value))
         except SystemError:
-          EncodeNonFiniteOrRaise(write, value)
+          return write(tag_bytes + NonFiniteBytesOrRaise(value))
       return EncodeField
 
   return SpecificEncoder
@@ -607,14 +681,13 @@ def _FloatingPointEncoder(wire_type, format):
 
 
 Int32Encoder = Int64Encoder = EnumEncoder = _SimpleEncoder(
-    wire_format.WIRETYPE_VARINT, _EncodeSignedVarint, _SignedVarintSize)
+    wire_format.WIRETYPE_VARINT, _SignedVarintBytes)
 
 UInt32Encoder = UInt64Encoder = _SimpleEncoder(
-    wire_format.WIRETYPE_VARINT, _EncodeVarint, _VarintSize)
+    wire_format.WIRETYPE_VARINT, _VarintBytes)
 
 SInt32Encoder = SInt64Encoder = _ModifiedEncoder(
-    wire_format.WIRETYPE_VARINT, _EncodeVarint, _VarintSize,
-    wire_format.ZigZagEncode)
+    wire_format.WIRETYPE_VARINT, _VarintBytes, wire_format.ZigZagEncode)
 
 # Note that Python conveniently guarantees that when using the '<' prefix on
 # formats, they will also have the same size across all platforms (as opposed
@@ -635,35 +708,31 @@ def BoolEncoder(field_number, is_repeated, is_packed):
 ##!PY25  true_byte = b'\x01'
   false_byte = '\x00'.encode('latin1')  ##PY25
   true_byte = '\x01'.encode('latin1')  ##PY25
+  local_join = _EMPTY_BYTES.join
   if is_packed:
     tag_bytes = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
-    local_EncodeVarint = _EncodeVarint
+    local_VarintBytes = _VarintBytes
     def EncodePackedField(write, value):
-      write(tag_bytes)
-      local_EncodeVarint(write, len(value))
-      for element in value:
-        if element:
-          write(true_byte)
-        else:
-          write(false_byte)
+      write(tag_bytes + local_VarintBytes(len(value)))
+      return write(local_join(
+          [element and true_byte or false_byte for element in value]))
     return EncodePackedField
   elif is_repeated:
     tag_bytes = TagBytes(field_number, wire_format.WIRETYPE_VARINT)
+    true_field = tag_bytes + true_byte
+    false_field = tag_bytes + false_byte
     def EncodeRepeatedField(write, value):
-      for element in value:
-        write(tag_bytes)
-        if element:
-          write(true_byte)
-        else:
-          write(false_byte)
+      return write(local_join(
+          [element and true_field or false_field for element in value]))
     return EncodeRepeatedField
   else:
     tag_bytes = TagBytes(field_number, wire_format.WIRETYPE_VARINT)
+    true_field = tag_bytes + true_byte
+    false_field = tag_bytes + false_byte
     def EncodeField(write, value):
-      write(tag_bytes)
       if value:
-        return write(true_byte)
-      return write(false_byte)
+        return write(true_field)
+      return write(false_field)
     return EncodeField
 
 
@@ -671,22 +740,24 @@ def StringEncoder(field_number, is_repeated, is_packed):
   """Returns an encoder for a string field."""
 
   tag = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
-  local_EncodeVarint = _EncodeVarint
+  local_VarintBytes = _VarintBytes
   local_len = len
   assert not is_packed
   if is_repeated:
+    local_join = _EMPTY_BYTES.join
     def EncodeRepeatedField(write, value):
+      pieces = []
+      append = pieces.append
       for element in value:
         encoded = element.encode('utf-8')
-        write(tag)
-        local_EncodeVarint(write, local_len(encoded))
-        write(encoded)
+        append(tag + local_VarintBytes(local_len(encoded)))
+        append(encoded)
+      return write(local_join(pieces))
     return EncodeRepeatedField
   else:
     def EncodeField(write, value):
       encoded = value.encode('utf-8')
-      write(tag)
-      local_EncodeVarint(write, local_len(encoded))
+      write(tag + local_VarintBytes(local_len(encoded)))
       return write(encoded)
     return EncodeField
 
@@ -695,31 +766,61 @@ def BytesEncoder(field_number, is_repeated, is_packed):
   """Returns an encoder for a bytes field."""
 
   tag = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
-  local_EncodeVarint = _EncodeVarint
+  local_VarintBytes = _VarintBytes
   local_len = len
   assert not is_packed
   if is_repeated:
+    local_join = _EMPTY_BYTES.join
     def EncodeRepeatedField(write, value):
+      pieces = []
+      append = pieces.append
       for element in value:
-        write(tag)
-        local_EncodeVarint(write, local_len(element))
-        write(element)
+        append(tag + local_VarintBytes(local_len(element)))
+        append(element)
+      return write(local_join(pieces))
     return EncodeRepeatedField
   else:
     def EncodeField(write, value):
-      write(tag)
-      local_EncodeVarint(write, local_len(value))
+      write(tag + local_VarintBytes(local_len(value)))
       return write(value)
     return EncodeField
 
 
-def GroupEncoder(field_number, is_repeated, is_packed):
+# Sub-messages are written by calling their _InternalSerialize() method.
+# Encoders for the other ways of serializing a message tree, such as
+# _InternalSerializeDeterministic(), are built by passing the name of the
+# method to call instead as serialize_method.
+#
+# ByteSize() of a message parsed from bytes it has kept is the length of those
+# bytes.  _InternalSerializeDeterministic() does not reuse them, and may write
+# a different number of bytes, so the length of length-delimited sub-messages
+# is taken from _DeterministicByteSize() instead.
+
+_DETERMINISTIC_METHOD = '_InternalSerializeDeterministic'
+
+
+def GroupEncoder(field_number, is_repeated, is_packed,
+                 serialize_method='_InternalSerialize'):
   """Returns an encoder for a group field."""
 
   start_tag = TagBytes(field_number, wire_format.WIRETYPE_START_GROUP)
   end_tag = TagBytes(field_number, wire_format.WIRETYPE_END_GROUP)
   assert not is_packed
-  if is_repeated:
+  if serialize_method != '_InternalSerialize':
+    if is_repeated:
+      def EncodeRepeatedField(write, value):
+        for element in value:
+          write(start_tag)
+          getattr(element, serialize_method)(write)
+          write(end_tag)
+      return EncodeRepeatedField
+    else:
+      def EncodeField(write, value):
+        write(start_tag)
+        getattr(value, serialize_method)(write)
+        return write(end_tag)
+      return EncodeField
+  elif is_repeated:
     def EncodeRepeatedField(write, value):
       for element in value:
         write(start_tag)
@@ -734,23 +835,46 @@ def GroupEncoder(field_number, is_repeated, is_packed):
     return EncodeField
 
 
-def MessageEncoder(field_number, is_repeated, is_packed):
+def MessageEncoder(field_number, is_repeated, is_packed,
+                   serialize_method='_InternalSerialize'):
   """Returns an encoder for a message field."""
 
   tag = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
-  local_EncodeVarint = _EncodeVarint
+  local_VarintBytes = _VarintBytes
   assert not is_packed
-  if is_repeated:
+  if serialize_method == _DETERMINISTIC_METHOD:
+    if is_repeated:
+      def EncodeRepeatedField(write, value):
+        for element in value:
+          write(tag + local_VarintBytes(element._DeterministicByteSize()))
+          element._InternalSerializeDeterministic(write)
+      return EncodeRepeatedField
+    else:
+      def EncodeField(write, value):
+        write(tag + local_VarintBytes(value._DeterministicByteSize()))
+        return value._InternalSerializeDeterministic(write)
+      return EncodeField
+  elif serialize_method != '_InternalSerialize':
+    if is_repeated:
+      def EncodeRepeatedField(write, value):
+        for element in value:
+          write(tag + local_VarintBytes(element.ByteSize()))
+          getattr(element, serialize_method)(write)
+      return EncodeRepeatedField
+    else:
+      def EncodeField(write, value):
+        write(tag + local_VarintBytes(value.ByteSize()))
+        return getattr(value, serialize_method)(write)
+      return EncodeField
+  elif is_repeated:
     def EncodeRepeatedField(write, value):
       for element in value:
-        write(tag)
-        local_EncodeVarint(write, element.ByteSize())
+        write(tag + local_VarintBytes(element.ByteSize()))
         element._InternalSerialize(write)
     return EncodeRepeatedField
   else:
     def EncodeField(write, value):
-      write(tag)
-      local_EncodeVarint(write, value.ByteSize())
+      write(tag + local_VarintBytes(value.ByteSize()))
       return value._InternalSerialize(write)
     return EncodeField
 
@@ -759,7 +883,7 @@ def MessageEncoder(field_number, is_repeated, is_packed):
 # As before, MessageSet is special.
 
 
-def MessageSetItemEncoder(field_number):
+def MessageSetItemEncoder(field_number, serialize_method='_InternalSerialize'):
   """Encoder for extensions of MessageSet.
 
   The message set message looks like this:
@@ -777,11 +901,23 @@ def MessageSetItemEncoder(field_number):
       _VarintBytes(field_number),
       TagBytes(3, wire_format.WIRETYPE_LENGTH_DELIMITED)])
   end_bytes = TagBytes(1, wire_format.WIRETYPE_END_GROUP)
-  local_EncodeVarint = _EncodeVarint
+  local_VarintBytes = _VarintBytes
+
+  if serialize_method == _DETERMINISTIC_METHOD:
+    def EncodeField(write, value):
+      write(start_bytes + local_VarintBytes(value._DeterministicByteSize()))
+      value._InternalSerializeDeterministic(write)
+      return write(end_bytes)
+    return EncodeField
+  elif serialize_method != '_InternalSerialize':
+    def EncodeField(write, value):
+      write(start_bytes + local_VarintBytes(value.ByteSize()))
+      getattr(value, serialize_method)(write)
+      return write(end_bytes)
+    return EncodeField
 
   def EncodeField(write, value):
-    write(start_bytes)
-    local_EncodeVarint(write, value.ByteSize())
+    write(start_bytes + local_VarintBytes(value.ByteSize()))
     value._InternalSerialize(write)
     return write(end_bytes)
 
@@ -0,0 +1,157 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for google.protobuf.field_mask."""
+
+import copy
+import unittest
+
+from google.protobuf import field_mask
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import test_util
+
+
+class FieldMaskTest(unittest.TestCase):
+
+  def setUp(self):
+    self.message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(self.message)
+    self.mask = field_mask.FieldMask(
+        unittest_pb2.TestAllTypes.DESCRIPTOR,
+        ['optional_int32', 'optional_nested_message.bb',
+         'repeated_nested_message.bb', 'repeated_string', 'optionalgroup'])
+
+  def Expected(self):
+    """Returns self.message with only the fields in self.mask."""
+    message = self.message
+    expected = unittest_pb2.TestAllTypes(
+        optional_int32=message.optional_int32,
+        repeated_string=message.repeated_string)
+    expected.optional_nested_message.bb = message.optional_nested_message.bb
+    expected.optionalgroup.a = message.optionalgroup.a
+    for element in message.repeated_nested_message:
+      expected.repeated_nested_message.add(bb=element.bb)
+    return expected
+
+  def testCompile(self):
+    self.assertEqual(
+        ['optional_int32', 'optional_nested_message.bb', 'optionalgroup',
+         'repeated_nested_message.bb', 'repeated_string'],
+        self.mask.paths)
+    for paths in (['nonexistent'], ['optional_nested_message.nonexistent'],
+                  ['optional_int32.bb'], ['']):
+      self.assertRaises(ValueError, field_mask.FieldMask,
+                        unittest_pb2.TestAllTypes.DESCRIPTOR, paths)
+
+  def testPrune(self):
+    self.assertIs(self.message,
+                  field_mask.Prune(self.message, self.mask))
+    self.assertEqual(self.Expected(), self.message)
+    self.assertFalse(self.message.HasField('optional_foreign_message'))
+    self.assertEqual(0, len(self.message.repeated_int32))
+
+  def testPruneEverything(self):
+    mask = field_mask.FieldMask(unittest_pb2.TestAllTypes.DESCRIPTOR, [])
+    field_mask.Prune(self.message, mask)
+    self.assertEqual(unittest_pb2.TestAllTypes(), self.message)
+
+  def testPrunePathsBelowWholeField(self):
+    message = unittest_pb2.TestAllTypes()
+    message.optional_nested_message.bb = 1
+    for paths in (['optional_nested_message', 'optional_nested_message.bb'],
+                  ['optional_nested_message.bb', 'optional_nested_message']):
+      mask = field_mask.FieldMask(unittest_pb2.TestAllTypes.DESCRIPTOR, paths)
+      pruned = field_mask.Prune(copy.deepcopy(message), mask)
+      self.assertEqual(message, pruned)
+
+  def testUnknownFieldsAreKept(self):
+    message = unittest_pb2.TestAllTypes.FromString(b'\x08\x01\xc0\x3e\x00')
+    mask = field_mask.FieldMask(unittest_pb2.TestAllTypes.DESCRIPTOR, [])
+    self.assertEqual(b'\xc0\x3e\x00', field_mask.SerializeMasked(message, mask))
+    self.assertEqual(b'\xc0\x3e\x00',
+                     field_mask.Prune(message, mask).SerializeToString())
+
+  def testMergeMasked(self):
+    destination = unittest_pb2.TestAllTypes(
+        optional_int32=5, optional_int64=6, repeated_string=['a'])
+    destination.optional_nested_message.bb = 7
+    destination.repeated_nested_message.add(bb=8)
+    self.assertIs(destination, field_mask.MergeMasked(
+        destination, self.message, self.mask))
+
+    # Like MergeFrom() of the pruned message.
+    expected = unittest_pb2.TestAllTypes(
+        optional_int32=5, optional_int64=6, repeated_string=['a'])
+    expected.optional_nested_message.bb = 7
+    expected.repeated_nested_message.add(bb=8)
+    expected.MergeFrom(self.Expected())
+    self.assertEqual(expected, destination)
+
+  def testMergeMaskedSetsSubMessages(self):
+    source = unittest_pb2.TestAllTypes()
+    source.optional_nested_message.SetInParent()
+    mask = field_mask.FieldMask(unittest_pb2.TestAllTypes.DESCRIPTOR,
+                                ['optional_nested_message.bb'])
+    destination = field_mask.MergeMasked(
+        unittest_pb2.TestAllTypes(), source, mask)
+    self.assertTrue(destination.HasField('optional_nested_message'))
+
+  def testSerializeMasked(self):
+    serialized = self.message.SerializeToString()
+    self.assertEqual(self.Expected().SerializeToString(),
+                     field_mask.SerializeMasked(self.message, self.mask))
+    # The message is left as it is.
+    self.assertEqual(serialized, self.message.SerializeToString())
+
+    message = unittest_pb2.TestAllTypes()
+    message.optional_nested_message.SetInParent()
+    mask = field_mask.FieldMask(unittest_pb2.TestAllTypes.DESCRIPTOR,
+                                ['optional_nested_message.bb'])
+    self.assertEqual(message.SerializeToString(),
+                     field_mask.SerializeMasked(message, mask))
+
+  def testSerializeMaskedDoesNotCheckRequiredFields(self):
+    message = unittest_pb2.TestRequired(a=1)
+    mask = field_mask.FieldMask(unittest_pb2.TestRequired.DESCRIPTOR, ['a'])
+    self.assertEqual(b'\x08\x01', field_mask.SerializeMasked(message, mask))
+
+  def testWrongMessageType(self):
+    message = unittest_pb2.ForeignMessage()
+    self.assertRaises(TypeError, field_mask.Prune, message, self.mask)
+    self.assertRaises(TypeError, field_mask.SerializeMasked, message,
+                      self.mask)
+    self.assertRaises(TypeError, field_mask.MergeMasked, message,
+                      self.message, self.mask)
+
+
+if __name__ == '__main__':
+  unittest.main()
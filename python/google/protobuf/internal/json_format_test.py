@@ -0,0 +1,173 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for google.protobuf.json_format."""
+
+import collections
+import json
+import unittest
+
+from google.protobuf import json_format
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import test_util
+
+
+class JsonFormatTest(unittest.TestCase):
+
+  def testPrintScalarsCompactly(self):
+    message = unittest_pb2.TestAllTypes(
+        optional_int32=1, optional_int64=-2, optional_uint64=3,
+        optional_bool=True, optional_string=u'a"\xe9',
+        optional_bytes=b'\x00\xff',
+        optional_nested_enum=unittest_pb2.TestAllTypes.BAZ,
+        repeated_int32=[1, 2], repeated_string=[u'x', u'y'])
+    message.optional_nested_message.bb = 3
+    self.assertEqual(
+        '{"optionalInt32":1,"optionalInt64":"-2","optionalUint64":"3",'
+        '"optionalBool":true,"optionalString":"a\\"\\u00e9",'
+        '"optionalBytes":"AP8=","optionalNestedMessage":{"bb":3},'
+        '"optionalNestedEnum":"BAZ","repeatedInt32":[1,2],'
+        '"repeatedString":["x","y"]}',
+        json_format.MessageToJson(message, indent=None))
+
+  def testPrintIndented(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    text = json_format.MessageToJson(message)
+    loaded = json.loads(text, object_pairs_hook=collections.OrderedDict)
+    self.assertEqual(json.dumps(loaded, indent=2, separators=(',', ': ')),
+                     text)
+    self.assertEqual('{}', json_format.MessageToJson(
+        unittest_pb2.TestAllTypes()))
+
+  def testPrintToFile(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    pieces = []
+    class Out(object):
+      write = pieces.append
+    json_format.PrintMessage(message, Out(), indent=4)
+    self.assertEqual(json_format.MessageToJson(message, indent=4),
+                     ''.join(pieces))
+
+  def testNonFiniteFloats(self):
+    message = unittest_pb2.TestAllTypes(
+        optional_float=float('inf'), optional_double=float('-inf'),
+        repeated_double=[float('nan'), 1.5])
+    text = json_format.MessageToJson(message, indent=None)
+    self.assertEqual(
+        '{"optionalFloat":"Infinity","optionalDouble":"-Infinity",'
+        '"repeatedDouble":["NaN",1.5]}', text)
+    parsed = json_format.Parse(text, unittest_pb2.TestAllTypes())
+    self.assertEqual(float('inf'), parsed.optional_float)
+    self.assertEqual(float('-inf'), parsed.optional_double)
+    self.assertTrue(parsed.repeated_double[0] != parsed.repeated_double[0])
+
+  def testRoundTrip(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    for indent in (None, 2):
+      parsed = json_format.Parse(
+          json_format.MessageToJson(message, indent=indent),
+          unittest_pb2.TestAllTypes())
+      self.assertEqual(message, parsed)
+
+  def testExtensions(self):
+    message = unittest_pb2.TestAllExtensions()
+    test_util.SetAllExtensions(message)
+    text = json_format.MessageToJson(message, indent=None)
+    self.assertTrue(
+        text.startswith('{"[protobuf_unittest.optional_int32_extension]":101,'))
+    self.assertEqual(message, json_format.Parse(
+        text, unittest_pb2.TestAllExtensions()))
+
+  def testOptions(self):
+    message = unittest_pb2.TestAllTypes(optional_int32=1)
+    self.assertEqual(
+        '{"optional_int32":1}',
+        json_format.MessageToJson(message, preserving_proto_field_name=True,
+                                  indent=None))
+    text = json_format.MessageToJson(
+        message, including_default_value_fields=True, indent=None)
+    loaded = json.loads(text)
+    self.assertEqual(1, loaded['optionalInt32'])
+    self.assertEqual('0', loaded['optionalInt64'])
+    self.assertEqual('FOO', loaded['optionalNestedEnum'])
+    self.assertEqual([], loaded['repeatedNestedMessage'])
+    self.assertFalse('optionalNestedMessage' in loaded)
+    self.assertFalse('oneofUint32' in loaded)
+    # Default values are still values, which proto2 fields keep.
+    parsed = json_format.Parse(text, unittest_pb2.TestAllTypes())
+    self.assertEqual(1, parsed.optional_int32)
+    self.assertTrue(parsed.HasField('optional_int64'))
+
+  def testMapField(self):
+    counter_class = test_util.MakeMapClass()
+    counter = counter_class()
+    entry = counter.counts.add()
+    entry.key, entry.value = u'a', 1
+    text = json_format.MessageToJson(counter, indent=None)
+    self.assertEqual('{"counts":{"a":1}}', text)
+    self.assertEqual(counter, json_format.Parse(text, counter_class()))
+
+  def testParseAlternativeForms(self):
+    message = json_format.Parse(
+        '{"optional_int32": 1.0, "optionalInt64": 2, "optionalUint32": "3",'
+        ' "optionalNestedEnum": 2, "optionalBytes": "_-8",'
+        ' "optionalString": null, "optionalNestedMessage": {}}',
+        unittest_pb2.TestAllTypes())
+    self.assertEqual(1, message.optional_int32)
+    self.assertEqual(2, message.optional_int64)
+    self.assertEqual(3, message.optional_uint32)
+    self.assertEqual(unittest_pb2.TestAllTypes.BAR,
+                     message.optional_nested_enum)
+    self.assertEqual(b'\xff\xef', message.optional_bytes)
+    self.assertFalse(message.HasField('optional_string'))
+    self.assertTrue(message.HasField('optional_nested_message'))
+
+  def testParseErrors(self):
+    for text in ['{"unknownField": 1}', '{"optionalInt32": "x"}',
+                 '{"optionalInt32": 1.5}', '{"optionalInt32": true}',
+                 '{"optionalInt32": 4294967296}', '{"optionalBool": 1}',
+                 '{"optionalString": 1}', '{"optionalNestedEnum": "NOPE"}',
+                 '{"repeatedInt32": 1}', '{"optionalNestedMessage": []}',
+                 '[]', '{']:
+      self.assertRaises(json_format.ParseError, json_format.Parse, text,
+                        unittest_pb2.TestAllTypes())
+    message = json_format.Parse('{"unknownField": 1, "optionalInt32": 2}',
+                                unittest_pb2.TestAllTypes(),
+                                ignore_unknown_fields=True)
+    self.assertEqual(unittest_pb2.TestAllTypes(optional_int32=2), message)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,223 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for google.protobuf.message_diff."""
+
+import copy
+import unittest
+
+from google.protobuf import message_diff
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import api_implementation
+from google.protobuf.internal import test_util
+
+
+class MessageDiffTest(unittest.TestCase):
+
+  def assertPatches(self, old, new):
+    """Checks that the patch from old to new survives serialization and turns
+    a copy of old into new, and returns it.
+    """
+    patch = message_diff.Diff(old, new)
+    patch = message_diff.MessagePatch.FromString(patch.SerializeToString())
+    patched = copy.deepcopy(old)
+    self.assertIs(patched, message_diff.ApplyPatch(patched, patch))
+    self.assertEqual(new, patched)
+    self.assertEqual(new.SerializeToString(), patched.SerializeToString())
+    return patch
+
+  def testEqualMessages(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    self.assertEqual(
+        0, len(message_diff.Diff(message, copy.deepcopy(message)).operation))
+    self.assertEqual(0, len(message_diff.Diff(message, message).operation))
+
+  def testScalarFields(self):
+    old = unittest_pb2.TestAllTypes(optional_int32=1, optional_string='a',
+                                    optional_double=0.0)
+    new = unittest_pb2.TestAllTypes(optional_int32=2, optional_int64=3,
+                                    optional_double=-0.0)
+    patch = self.assertPatches(old, new)
+    Operation = message_diff.MessagePatch.Operation
+    self.assertEqual(
+        [([14], Operation.CLEAR), ([1], Operation.SET), ([2], Operation.SET),
+         ([12], Operation.SET)],
+        [(list(operation.path), operation.kind)
+         for operation in patch.operation])
+    self.assertPatches(new, old)
+
+  def testAllFields(self):
+    empty = unittest_pb2.TestAllTypes()
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    self.assertPatches(empty, message)
+    self.assertPatches(message, empty)
+    modified = copy.deepcopy(message)
+    modified.optional_nested_message.bb = 1
+    modified.ClearField('optional_bytes')
+    modified.repeated_int32[1] = 7
+    del modified.repeated_string[0]
+    modified.repeated_nested_message[0].bb = 8
+    modified.repeated_foreign_message.add(c=9)
+    self.assertPatches(message, modified)
+    self.assertPatches(modified, message)
+
+    packed = unittest_pb2.TestPackedTypes()
+    test_util.SetAllPackedFields(packed)
+    modified = copy.deepcopy(packed)
+    modified.packed_double[0] = 0.5
+    modified.packed_sint64.append(-1)
+    self.assertPatches(unittest_pb2.TestPackedTypes(), packed)
+    self.assertPatches(packed, modified)
+
+  def testExtensions(self):
+    empty = unittest_pb2.TestAllExtensions()
+    message = unittest_pb2.TestAllExtensions()
+    test_util.SetAllExtensions(message)
+    self.assertPatches(empty, message)
+    self.assertPatches(message, empty)
+    modified = copy.deepcopy(message)
+    modified.Extensions[unittest_pb2.optional_int32_extension] = 1
+    modified.Extensions[unittest_pb2.optional_nested_message_extension].bb = 2
+    del modified.Extensions[unittest_pb2.repeated_int32_extension][0]
+    modified.Extensions[unittest_pb2.repeated_nested_message_extension].add(
+        bb=3)
+    modified.ClearExtension(unittest_pb2.optional_string_extension)
+    self.assertPatches(message, modified)
+    self.assertPatches(modified, message)
+
+  def testSubMessages(self):
+    old = unittest_pb2.TestAllTypes()
+    old.optional_nested_message.bb = 1
+    old.optional_foreign_message.c = 2
+    new = copy.deepcopy(old)
+    new.optional_nested_message.bb = 3
+    patch = self.assertPatches(old, new)
+    # Only the changed field of the changed sub-message is sent.
+    self.assertEqual(1, len(patch.operation))
+    self.assertEqual([18, 1], list(patch.operation[0].path))
+
+    # An empty sub-message is still present.
+    new = unittest_pb2.TestAllTypes()
+    new.optional_nested_message.SetInParent()
+    self.assertPatches(unittest_pb2.TestAllTypes(), new)
+    self.assertPatches(old, new)
+
+  def testRepeatedFields(self):
+    old = unittest_pb2.TestAllTypes(repeated_int32=[1, 2, 3, 4, 5])
+    for values in ([1, 2, 3, 4, 5, 6], [0, 1, 2, 3, 4, 5], [1, 2, 9, 4, 5],
+                   [1, 2, 4, 5], [1, 5], [], [6, 7]):
+      patch = self.assertPatches(
+          old, unittest_pb2.TestAllTypes(repeated_int32=values))
+      self.assertEqual(1, len(patch.operation))
+    patch = message_diff.Diff(
+        old, unittest_pb2.TestAllTypes(repeated_int32=[1, 2, 3, 4, 5, 6]))
+    self.assertEqual((5, 0), (patch.operation[0].start,
+                              patch.operation[0].count))
+
+  def testRepeatedMessages(self):
+    old = unittest_pb2.TestAllTypes()
+    for i in range(5):
+      old.repeated_nested_message.add(bb=i)
+    new = copy.deepcopy(old)
+    new.repeated_nested_message[2].bb = 9
+    patch = self.assertPatches(old, new)
+    self.assertEqual([48, 2, 1], list(patch.operation[0].path))
+
+    new = copy.deepcopy(old)
+    del new.repeated_nested_message[1:3]
+    new.repeated_nested_message.add(bb=7)
+    self.assertPatches(old, new)
+    self.assertPatches(new, old)
+    new = copy.deepcopy(old)
+    del new.repeated_nested_message[1]
+    self.assertPatches(old, new)
+
+  def testOneofs(self):
+    old = unittest_pb2.TestAllTypes(oneof_string='a')
+    new = unittest_pb2.TestAllTypes(oneof_uint32=1)
+    self.assertPatches(old, new)
+    self.assertPatches(new, old)
+    new = unittest_pb2.TestAllTypes()
+    new.oneof_nested_message.bb = 1
+    self.assertPatches(old, new)
+    self.assertPatches(new, old)
+
+  def _HashedByDiff(self, element_count):
+    """Changes one of element_count elements of a message after copying it,
+    and returns the number of messages Diff() computes a fingerprint of."""
+    from google.protobuf.internal import python_message
+    new = unittest_pb2.TestParsingMerge()
+    for _ in range(element_count):
+      test_util.SetAllFields(new.repeated_all_types.add())
+    new.Fingerprint()
+    old = copy.deepcopy(new)
+    new.repeated_all_types[1].optional_nested_message.bb = 9
+    hashed = []
+    fingerprint_digest = python_message._FingerprintDigest
+    def CountingDigest(message):
+      if message._fingerprint is None:
+        hashed.append(message)
+      return fingerprint_digest(message)
+    python_message._FingerprintDigest = CountingDigest
+    try:
+      patch = message_diff.Diff(old, new)
+    finally:
+      python_message._FingerprintDigest = fingerprint_digest
+    self.assertEqual([3, 1, 18, 1], list(patch.operation[0].path))
+    return len(hashed)
+
+  def testUnchangedElementsAreNotHashedAgain(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Fingerprints are only cached by the pure Python '
+                    'implementation.')
+    # Only the changed element is looked into, however many there are.
+    hashed = self._HashedByDiff(2)
+    self.assertTrue(hashed > 0)
+    self.assertEqual(hashed, self._HashedByDiff(40))
+
+  def testErrors(self):
+    self.assertRaises(TypeError, message_diff.Diff,
+                      unittest_pb2.TestAllTypes(), unittest_pb2.ForeignMessage())
+    Operation = message_diff.MessagePatch.Operation
+    for path, kind in [([], Operation.CLEAR), ([999], Operation.CLEAR),
+                       ([1, 1], Operation.CLEAR), ([48, 0, 1], Operation.SET),
+                       ([48], Operation.SPLICE), ([1], Operation.SPLICE)]:
+      patch = message_diff.MessagePatch()
+      patch.operation.add(path=path, kind=kind, start=1)
+      message = unittest_pb2.TestAllTypes()
+      self.assertRaises(ValueError, message_diff.ApplyPatch, message, patch)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -74,5 +74,7 @@ class NullMessageListener(object):
 
   """No-op MessageListener implementation."""
 
+  __slots__ = ()
+
   def Modified(self):
     pass
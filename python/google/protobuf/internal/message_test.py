@@ -51,6 +51,7 @@ import sys
 import unittest
 
 from google.protobuf.internal import _parameterized
+from google.protobuf import unittest_mset_pb2
 from google.protobuf import unittest_pb2
 from google.protobuf import unittest_proto3_arena_pb2
 from google.protobuf.internal import api_implementation
@@ -124,6 +125,19 @@ class MessageTest(unittest.TestCase):
     unpickled_message = pickle.loads(pickled_message)
     self.assertEqual(unpickled_message, golden_message)
 
+  def testPickleAllProtocols(self, message_module):
+    golden_data = test_util.GoldenFileData('golden_message')
+    golden_message = message_module.TestAllTypes.FromString(golden_data)
+    # Has no sub-message fields, so it is pickled field by field.
+    foreign_message = message_module.ForeignMessage(c=1)
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+      for original in (golden_message, foreign_message,
+                       message_module.ForeignMessage()):
+        unpickled = pickle.loads(pickle.dumps(original, protocol))
+        self.assertEqual(original, unpickled)
+        self.assertEqual(original.SerializeToString(),
+                         unpickled.SerializeToString())
+
   def testPositiveInfinity(self, message_module):
     golden_data = (b'\x5D\x00\x00\x80\x7F'
                    b'\x61\x00\x00\x00\x00\x00\x00\xF0\x7F'
@@ -655,6 +669,17 @@ class MessageTest(unittest.TestCase):
     m.oneof_bytes = b'bb'
     self.assertEqual('oneof_bytes', m.WhichOneof('oneof_field'))
 
+  def testOneofIsPerMessage(self, message_module):
+    m = message_module.TestAllTypes()
+    m2 = message_module.TestAllTypes()
+    m.oneof_uint32 = 11
+    self.assertIsNone(m2.WhichOneof('oneof_field'))
+    m.Clear()
+    m2.oneof_bytes = b'bb'
+    self.assertIsNone(m.WhichOneof('oneof_field'))
+    self.assertIsNone(message_module.TestAllTypes().WhichOneof('oneof_field'))
+    self.assertEqual('oneof_bytes', m2.WhichOneof('oneof_field'))
+
   def testAssignByteStringToUnicodeField(self, message_module):
     """Assigning a byte string to a string field should result
     in the value being converted to a Unicode string."""
@@ -884,6 +909,95 @@ class MessageTest(unittest.TestCase):
     self.assertEqual(2, m.repeated_nested_message.pop(1).bb)
     self.assertEqual([1, 3], [n.bb for n in m.repeated_nested_message])
 
+  def testUnmodifiedSubMessageKeepsWireBytes(self, message_module):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Only the python implementation re-uses parsed bytes.')
+    # The payload has optional_int64 before optional_int32, which is not the
+    # order in which we would serialize it ourselves.
+    payload = b'\x10\x02\x08\x01'
+    data = b'\x0A\x06\x12\x04' + payload + b'\x12\x04' + payload
+    m = message_module.NestedTestAllTypes.FromString(data)
+    self.assertEqual(data, m.SerializeToString())
+    self.assertEqual(len(data), m.ByteSize())
+
+    m.child.payload.optional_int32 = 3
+    expected = b'\x0A\x06\x12\x04\x08\x03\x10\x02\x12\x04' + payload
+    self.assertEqual(expected, m.SerializeToString())
+    self.assertEqual(len(expected), m.ByteSize())
+
+    m.payload.repeated_int32.append(7)
+    expected = (b'\x0A\x06\x12\x04\x08\x03\x10\x02'
+                b'\x12\x07\x08\x01\x10\x02\xF8\x01\x07')
+    self.assertEqual(expected, m.SerializeToString())
+
+  def testMergedSubMessageIsReencoded(self, message_module):
+    # The payload appears twice, so the parsed message is the merge of both.
+    data = b'\x12\x02\x10\x02\x12\x02\x08\x01'
+    m = message_module.NestedTestAllTypes.FromString(data)
+    self.assertEqual(b'\x12\x04\x08\x01\x10\x02', m.SerializeToString())
+    m.payload.ClearField('optional_int64')
+    self.assertEqual(b'\x12\x02\x08\x01', m.SerializeToString())
+
+  def testMergeIntoMessageWithFieldsIsReencoded(self, message_module):
+    merged = message_module.TestAllTypes(optional_int64=7).SerializeToString()
+    expected = b'\x08\x05\x10\x07'
+    m = message_module.TestAllTypes(optional_int32=5)
+    m.MergeFromString(merged)
+    self.assertEqual(expected, m.SerializeToString())
+    m = message_module.TestAllTypes()
+    m.optional_int32 = 5
+    m.SerializeToString()
+    m.MergeFromString(merged)
+    self.assertEqual(expected, m.SerializeToString())
+    m = message_module.TestAllTypes.FromString(b'\x08\x05')
+    m.MergeFromString(merged)
+    self.assertEqual(expected, m.SerializeToString())
+
+    data = b'\x12\x02\x08\x05'
+    m = message_module.NestedTestAllTypes(
+        payload=message_module.TestAllTypes(optional_int64=7))
+    m.MergeFromString(data)
+    self.assertEqual(b'\x12\x04\x08\x05\x10\x07', m.SerializeToString())
+
+  def testSubMessageWithUnknownFieldsKeepsWireBytes(self, message_module):
+    # Field 1000 is unknown to TestAllTypes.
+    data = b'\x12\x03\xC0\x3E\x01'
+    m = message_module.NestedTestAllTypes.FromString(data)
+    if message_module is unittest_pb2:
+      self.assertEqual(data, m.SerializeToString())
+    else:
+      # Proto3 drops unknown fields, so the original bytes must not be used.
+      self.assertEqual(b'\x12\x00', m.SerializeToString())
+
+  def testStringsEncodedBySizingAreReused(self, message_module):
+    if api_implementation.Type() != 'python':
+      self.skipTest('The UTF-8 cache only exists in the pure Python '
+                    'implementation.')
+    m = message_module.NestedTestAllTypes()
+    m.payload.optional_string = u'\xe9t\xe9'
+    m.payload.repeated_string.extend([u'a', u'\xfc'])
+    expected = copy.deepcopy(m).SerializeToString()
+    m.ByteSize()
+    self.assertEqual(b'\xc3\xa9t\xc3\xa9',
+                     m.payload._utf8_cache[
+                         m.payload.DESCRIPTOR.fields_by_name['optional_string']])
+    self.assertEqual(expected, m.SerializeToString())
+    # Serialization used up the cached encodings.
+    self.assertEqual(None, m.payload._utf8_cache)
+
+  def testModificationDropsEncodedStrings(self, message_module):
+    m = message_module.NestedTestAllTypes()
+    m.payload.optional_string = u'before'
+    m.payload.repeated_string.append(u'one')
+    m.ByteSize()
+    m.payload.optional_string = u'after'
+    m.payload.repeated_string.append(u'two')
+    serialized = m.SerializeToString()
+    self.assertEqual(len(serialized), m.ByteSize())
+    m2 = message_module.NestedTestAllTypes.FromString(serialized)
+    self.assertEqual(u'after', m2.payload.optional_string)
+    self.assertEqual([u'one', u'two'], m2.payload.repeated_string)
+
 
 # Class to test proto2-only features (required, extensions, etc.)
 class Proto2Test(unittest.TestCase):
@@ -1034,6 +1148,133 @@ class Proto2Test(unittest.TestCase):
     self.assertEqual(len(parsing_merge.Extensions[
         unittest_pb2.TestParsingMerge.repeated_ext]), 3)
 
+  def testDeterministicSerializationOrdersFields(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Deterministic serialization is only implemented in the '
+                    'pure Python implementation.')
+    # optional_int64 and then optional_int32, inside and outside a submessage.
+    data = b'\x10\x02\x08\x01'
+    m = unittest_pb2.TestAllTypes.FromString(data)
+    self.assertEqual(data, m.SerializeToString())
+    self.assertEqual(b'\x08\x01\x10\x02',
+                     m.SerializeToString(deterministic=True))
+    self.assertEqual(b'\x08\x01\x10\x02',
+                     m.SerializePartialToString(deterministic=True))
+
+    nested = unittest_pb2.NestedTestAllTypes.FromString(b'\x12\x04' + data)
+    self.assertEqual(b'\x12\x04\x08\x01\x10\x02',
+                     nested.SerializeToString(deterministic=True))
+
+  def testDeterministicSerializationOfNonCanonicalSubMessages(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Deterministic serialization is only implemented in the '
+                    'pure Python implementation.')
+    # The last of two values of optional_int32 wins, and bb is an overlong
+    # varint, so both sub-messages get shorter when re-encoded.
+    data = b'\x92\x01\x04\x08\x01\x08\x02\x82\x03\x03\x08\x81\x00'
+    m = unittest_pb2.TestAllTypes.FromString(data)
+    self.assertEqual(data, m.SerializeToString())
+    expected = b'\x92\x01\x02\x08\x02\x82\x03\x02\x08\x01'
+    self.assertEqual(expected, m.SerializeToString(deterministic=True))
+    self.assertEqual(m, unittest_pb2.TestAllTypes.FromString(expected))
+
+    message_set = unittest_mset_pb2.TestMessageSetContainer()
+    extension = unittest_mset_pb2.TestMessageSetExtension1.message_set_extension
+    message_set.message_set.Extensions[extension].i = 1
+    data = b'\x0a\x0a\x0b\x10\xb0\xa6\x5e\x1a\x02\x78\x01\x0c'
+    self.assertEqual(data, message_set.SerializeToString())
+    # The same item, with i as an overlong varint.
+    parsed = unittest_mset_pb2.TestMessageSetContainer.FromString(
+        b'\x0a\x0b\x0b\x10\xb0\xa6\x5e\x1a\x03\x78\x81\x00\x0c')
+    self.assertEqual(message_set, parsed)
+    self.assertEqual(data, parsed.SerializeToString(deterministic=True))
+
+  def testDeterministicSerializationOfNestedSubMessages(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Deterministic serialization is only implemented in the '
+                    'pure Python implementation.')
+    # child.child.payload.optional_int32, an overlong varint, makes every
+    # level one byte shorter.
+    data = b'\x0a\x07\x0a\x05\x12\x03\x08\x81\x00'
+    m = unittest_pb2.NestedTestAllTypes.FromString(data)
+    self.assertEqual(data, m.SerializeToString())
+    self.assertEqual(b'\x0a\x06\x0a\x04\x12\x02\x08\x01',
+                     m.SerializeToString(deterministic=True))
+    # Sizes kept from the last call are dropped along the changed path.
+    m.child.child.payload.optional_int64 = 2
+    self.assertEqual(b'\x0a\x08\x0a\x06\x12\x04\x08\x01\x10\x02',
+                     m.SerializeToString(deterministic=True))
+    self.assertEqual(m, unittest_pb2.NestedTestAllTypes.FromString(
+        m.SerializeToString(deterministic=True)))
+
+    # The same within a group, whose size counts towards the sub-message.
+    data = b'\x12\x08\x83\x01\x88\x01\x81\x00\x84\x01'
+    m = unittest_pb2.NestedTestAllTypes.FromString(data)
+    self.assertEqual(1, m.payload.optionalgroup.a)
+    self.assertEqual(b'\x12\x07\x83\x01\x88\x01\x01\x84\x01',
+                     m.SerializeToString(deterministic=True))
+
+  def testDeterministicSerializationOrdersExtensions(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Deterministic serialization is only implemented in the '
+                    'pure Python implementation.')
+    m = unittest_pb2.TestAllExtensions()
+    m.Extensions[unittest_pb2.optional_int64_extension] = 2
+    m.Extensions[unittest_pb2.optional_int32_extension] = 1
+    m.Extensions[unittest_pb2.optional_nested_message_extension].bb = 3
+    expected = b'\x08\x01\x10\x02\x92\x01\x02\x08\x03'
+    self.assertEqual(expected, m.SerializeToString(deterministic=True))
+    parsed = unittest_pb2.TestAllExtensions.FromString(
+        b'\x92\x01\x02\x08\x03\x10\x02\x08\x01')
+    self.assertEqual(expected, parsed.SerializeToString(deterministic=True))
+
+  def testDeterministicSerializationOrdersUnknownFields(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Deterministic serialization is only implemented in the '
+                    'pure Python implementation.')
+    first = b'\x18\x03\x08\x01'
+    second = b'\x10\x02\x08\x04'
+    m1 = unittest_pb2.TestEmptyMessage()
+    m1.MergeFromString(first)
+    m1.MergeFromString(second)
+    m2 = unittest_pb2.TestEmptyMessage()
+    m2.MergeFromString(second)
+    m2.MergeFromString(first)
+    self.assertNotEqual(m1.SerializeToString(), m2.SerializeToString())
+    # Values of the same field keep their relative order.
+    self.assertEqual(b'\x08\x01\x08\x04\x10\x02\x18\x03',
+                     m1.SerializeToString(deterministic=True))
+    self.assertEqual(b'\x08\x04\x08\x01\x10\x02\x18\x03',
+                     m2.SerializeToString(deterministic=True))
+
+    # Known fields are still written in order around the unknown ones.
+    m3 = unittest_pb2.TestAllTypes()
+    m3.optional_int32 = 1
+    m3.MergeFromString(b'\xf8\x7f\x05')
+    m3.MergeFromString(b'\x10\x02')
+    self.assertEqual(b'\x08\x01\x10\x02\xf8\x7f\x05',
+                     m3.SerializeToString(deterministic=True))
+
+  def testPickleOutOfBand(self):
+    if not hasattr(pickle, 'PickleBuffer'):
+      self.skipTest('Pickle protocol 5 needs Python 3.8 or later.')
+    data = b'x' * 10000
+    for original in (unittest_pb2.OneBytes(data=data),
+                     unittest_pb2.TestAllTypes(
+                         optional_bytes=data,
+                         optional_nested_message=(
+                             unittest_pb2.TestAllTypes.NestedMessage(bb=1)))):
+      buffers = []
+      pickled = pickle.dumps(original, 5, buffer_callback=buffers.append)
+      self.assertEqual(1, len(buffers))
+      self.assertLess(len(pickled), 1000)
+      unpickled = pickle.loads(pickled, buffers=buffers)
+      self.assertEqual(original, unpickled)
+      # Pickled in-band, the payload is not copied into the pickle twice.
+      self.assertLess(len(pickle.dumps(original, 5)), 11000)
+      self.assertEqual(original, pickle.loads(pickle.dumps(original, 5)))
+
+
 
 # Class to test proto3-only features/behavior (updated field presence & enums)
 class Proto3Test(unittest.TestCase):
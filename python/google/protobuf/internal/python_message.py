@@ -54,25 +54,32 @@ this file*.
 
 __author__ = 'robinson@google.com (Will Robinson)'
 
+import binascii
+import hashlib
+import operator
+import os
 import sys
 if sys.version_info[0] < 3:
   try:
     from cStringIO import StringIO as BytesIO
   except ImportError:
     from StringIO import StringIO as BytesIO
-  import copy_reg as copyreg
 else:
   from io import BytesIO
-  import copyreg
+import pickle
 import struct
+import threading
+import types
 import weakref
 
 # We use "as" to avoid name collisions with variables.
+from google.protobuf.internal import compiled_serializer
 from google.protobuf.internal import containers
 from google.protobuf.internal import decoder
 from google.protobuf.internal import encoder
 from google.protobuf.internal import enum_type_wrapper
 from google.protobuf.internal import message_listener as message_listener_mod
+from google.protobuf.internal import reverse_serializer
 from google.protobuf.internal import type_checkers
 from google.protobuf.internal import wire_format
 from google.protobuf import descriptor as descriptor_mod
@@ -82,33 +89,459 @@ from google.protobuf import text_format
 _FieldDescriptor = descriptor_mod.FieldDescriptor
 
 
+# The serialization strategy used by SerializeToString() and
+# SerializePartialToString().  All strategies produce exactly the same bytes:
+#   'generic':  walks ListFields() and calls each field's encoder.
+#   'compiled':  runs a serializer generated for each message type, see
+#     compiled_serializer.py.
+#   'reverse':  writes the message back-to-front, so that no ByteSize() pass
+#     is needed to know the length of sub-messages, see reverse_serializer.py.
+# The environment variable selects the initial strategy; any unknown value is
+# ignored.
+_SERIALIZATION_STRATEGIES = ('generic', 'compiled', 'reverse')
+_serialization_strategy = os.getenv(
+    'PROTOCOL_BUFFERS_PYTHON_SERIALIZATION_STRATEGY', 'generic')
+if _serialization_strategy not in _SERIALIZATION_STRATEGIES:
+  _serialization_strategy = 'generic'
+
+
+def SetSerializationStrategy(strategy):
+  """Selects how messages are serialized from now on.
+
+  Args:
+    strategy: One of 'generic', 'compiled' or 'reverse'.
+
+  Raises:
+    ValueError: if the strategy is not known.
+  """
+  global _serialization_strategy
+  if strategy not in _SERIALIZATION_STRATEGIES:
+    raise ValueError('Unknown serialization strategy "%s", expected one of: %s'
+                     % (strategy, ', '.join(_SERIALIZATION_STRATEGIES)))
+  _serialization_strategy = strategy
+
+
+def GetSerializationStrategy():
+  """Returns the name of the serialization strategy in use."""
+  return _serialization_strategy
+
+
+# How messages store the values of their fields in _fields.  Both layouts map
+# field descriptors to values, and the rest of this module goes through that
+# mapping, so they behave the same:
+#   'dict':  a dict.
+#   'slots':  for message types with at most _MAX_SLOT_FIELDS fields, an
+#     instance of a class generated for the message type, with one slot per
+#     field and a has-bits integer, see _SlotFields.  Its size only depends on
+#     the number of fields of the message type, 8 bytes each, while a dict
+#     holding even a single value takes 224 bytes (64-bit CPython 3).  The
+#     getters and setters of scalar fields read and write the slots directly,
+#     but everything else calls methods written in Python.  Message types
+#     with more fields use a dict.
+# Frozen messages, and copies which share values with the message they were
+# copied from, hold a dict in either layout.  The layout of a message type is
+# chosen when its first instance is created, so it can only be selected with
+# the environment variable; any unknown value is ignored.
+_FIELD_LAYOUTS = ('dict', 'slots')
+_field_layout = os.getenv('PROTOCOL_BUFFERS_PYTHON_FIELD_LAYOUT', 'dict')
+if _field_layout not in _FIELD_LAYOUTS:
+  _field_layout = 'dict'
+_MAX_SLOT_FIELDS = 20
+
+
+def GetFieldLayout():
+  """Returns the name of the layout of _fields, 'dict' or 'slots'."""
+  return _field_layout
+
+
+def SerializeMany(messages, partial=False):
+  """Serializes a batch of messages, see batch.SerializeMany()."""
+  results = []
+  append = results.append
+  # Messages are serialized one after the other into a shared buffer, and
+  # (index, start, end) records where each of them went.
+  spans = []
+  out = BytesIO()
+  write_bytes = out.write
+  tell = out.tell
+  # What only depends on the class of a message is looked up once per class:
+  # whether it needs an IsInitialized() check, and its generated serializer,
+  # which a batch is worth generating whatever the serialization strategy.
+  plans = {}
+  for message in messages:
+    cls = message.__class__
+    plan = plans.get(cls)
+    if plan is None:
+      plan = plans[cls] = (not partial and _CanHaveRequiredFields(cls),
+                           _CompileInternalSerialize(cls))
+    check_required, internal_serialize = plan
+    if check_required and not message.IsInitialized():
+      raise message_mod.EncodeError(
+          'Message %s is missing required fields: %s' % (
+          message.DESCRIPTOR.full_name,
+          ','.join(message.FindInitializationErrors())))
+    wire_span = message._wire_span
+    if wire_span and wire_span[1] == 0 and wire_span[2] == len(wire_span[0]):
+      append(wire_span[0])
+    else:
+      start = tell()
+      internal_serialize(message, write_bytes)
+      spans.append((len(results), start, tell()))
+      append(None)
+  if spans:
+    data = out.getvalue()
+    for index, start, end in spans:
+      results[index] = data[start:end]
+  return results
+
+
+def ParseMany(message_class, payloads):
+  """Parses a batch of messages, see batch.ParseMany()."""
+  results = []
+  append = results.append
+  # MergeFromString() is inlined, with _InternalParse() looked up once.
+  internal_parse = message_class._InternalParse
+  for serialized in payloads:
+    message = message_class()
+    length = len(serialized)
+    try:
+      if internal_parse(message, serialized, 0, length) != length:
+        raise message_mod.DecodeError('Unexpected end-group tag.')
+    except (IndexError, TypeError):
+      raise message_mod.DecodeError('Truncated message.')
+    except struct.error as e:
+      raise message_mod.DecodeError(e)
+    append(message)
+  return results
+
+
+def SerializeMasked(message, tree):
+  """Serializes the fields of message in a compiled field mask, see
+  field_mask.SerializeMasked().
+
+  Args:
+    message: The message to serialize.
+    tree: A dict from the descriptors of the fields to write to the dict of
+      the fields to write in each of their sub-messages, or None for the
+      whole field.
+  """
+  pieces = []
+  _SerializeMaskedFields(message, tree, pieces.append)
+  return b''.join(pieces)
+
+
+def _SerializeMaskedFields(message, tree, write):
+  for field, value in message._ListFields():
+    if field not in tree:
+      continue
+    subtree = tree[field]
+    if subtree is None:
+      field._encoder(write, value)
+    elif field.label == _FieldDescriptor.LABEL_REPEATED:
+      for element in value:
+        _SerializeMaskedMessage(field, element, subtree, write)
+    else:
+      _SerializeMaskedMessage(field, value, subtree, write)
+  for tag_bytes, value_bytes in message._unknown_fields:
+    write(tag_bytes)
+    write(value_bytes)
+
+
+def _SerializeMaskedMessage(field, value, tree, write):
+  """Writes sub-message value of field with the fields of value in tree."""
+  if field.type == _FieldDescriptor.TYPE_GROUP:
+    write(encoder.TagBytes(field.number, wire_format.WIRETYPE_START_GROUP))
+    _SerializeMaskedFields(value, tree, write)
+    write(encoder.TagBytes(field.number, wire_format.WIRETYPE_END_GROUP))
+  else:
+    # The length comes first, so the sub-message is serialized on its own.
+    serialized = SerializeMasked(value, tree)
+    write(encoder.TagBytes(field.number,
+                           wire_format.WIRETYPE_LENGTH_DELIMITED))
+    write(encoder._VarintBytes(len(serialized)))
+    write(serialized)
+
+
+# Per-instance state that most messages never change is shared between them,
+# to keep small messages small:
+#   _NULL_LISTENER:  the listener of every message without a parent.
+#   _NO_ONEOFS:  the _oneofs of every message with no oneof field set.  It is
+#     never written to; _UpdateOneofState() gives the message its own dict.
+_NULL_LISTENER = message_listener_mod.NullMessageListener()
+_NO_ONEOFS = {}
+
+
+class _SlotFields(object):
+
+  """The _fields of a message in the 'slots' layout, see _FIELD_LAYOUTS.
+
+  Maps field descriptors to values, like the dict of the 'dict' layout, and
+  has the dict methods this module uses.  Each field of the message type has a
+  slot, and a bit in has_bits which is set while the slot holds a value.
+  Extensions are kept in a dict, extensions, created when the first one is set.
+  _MakeSlotFieldsClass() generates a subclass with the slots of each message
+  type.
+  """
+
+  __slots__ = ['has_bits', 'extensions']
+
+  # Set on each subclass:  _slot_plan maps each field of the message type to
+  # (bit, get_slot, set_slot, delete_slot), and _slot_items lists
+  # (field, bit, get_slot) in order of bits, which is field number order.
+  _slot_plan = {}
+  _slot_items = ()
+
+  def __init__(self):
+    self.has_bits = 0
+    self.extensions = None
+
+  def get(self, field, default=None):
+    plan = self._slot_plan.get(field)
+    if plan is None:
+      extensions = self.extensions
+      if extensions is None:
+        return default
+      return extensions.get(field, default)
+    if self.has_bits & plan[0]:
+      return plan[1](self)
+    return default
+
+  def __getitem__(self, field):
+    value = self.get(field)
+    if value is None:
+      # None is never stored as a value.
+      raise KeyError(field)
+    return value
+
+  def __setitem__(self, field, value):
+    plan = self._slot_plan.get(field)
+    if plan is None:
+      extensions = self.extensions
+      if extensions is None:
+        extensions = self.extensions = {}
+      extensions[field] = value
+    else:
+      plan[2](self, value)
+      self.has_bits |= plan[0]
+
+  def __delitem__(self, field):
+    plan = self._slot_plan.get(field)
+    if plan is None:
+      extensions = self.extensions
+      if extensions is None:
+        raise KeyError(field)
+      del extensions[field]
+    elif self.has_bits & plan[0]:
+      plan[3](self)
+      self.has_bits &= ~plan[0]
+    else:
+      raise KeyError(field)
+
+  def __contains__(self, field):
+    plan = self._slot_plan.get(field)
+    if plan is None:
+      extensions = self.extensions
+      return extensions is not None and field in extensions
+    return bool(self.has_bits & plan[0])
+
+  def setdefault(self, field, default):
+    value = self.get(field)
+    if value is None:
+      self[field] = value = default
+    return value
+
+  def pop(self, field, *default):
+    value = self.get(field)
+    if value is None:
+      if default:
+        return default[0]
+      raise KeyError(field)
+    del self[field]
+    return value
+
+  def __len__(self):
+    extensions = self.extensions
+    return (bin(self.has_bits).count('1') +
+            (len(extensions) if extensions else 0))
+
+  def items(self):
+    items = []
+    bits = self.has_bits
+    if bits:
+      for field, bit, get_slot in self._slot_items:
+        if bits & bit:
+          items.append((field, get_slot(self)))
+        elif bit > bits:
+          break
+    extensions = self.extensions
+    if extensions:
+      items.extend(extensions.items())
+    return items
+
+  iteritems = items
+
+  def keys(self):
+    return [field for field, _ in self.items()]
+
+  def values(self):
+    return [value for _, value in self.items()]
+
+  def __iter__(self):
+    return iter(self.keys())
+
+
+def _MakeSlotFieldsClass(message_descriptor):
+  """Returns the _SlotFields subclass for messages of message_descriptor."""
+  fields = sorted(message_descriptor.fields, key=lambda field: field.number)
+  slot_names = ['_%d' % index for index in range(len(fields))]
+  fields_class = type(str(message_descriptor.name + 'Fields'), (_SlotFields,),
+                      {'__slots__': slot_names})
+  fields_class._slot_plan = plan = {}
+  items = []
+  for index, field in enumerate(fields):
+    slot = fields_class.__dict__[slot_names[index]]
+    get_slot = operator.attrgetter(slot_names[index])
+    bit = 1 << index
+    plan[field] = (bit, get_slot, slot.__set__, slot.__delete__)
+    items.append((field, bit, get_slot))
+  fields_class._slot_items = tuple(items)
+  return fields_class
+
+
 def NewMessage(bases, descriptor, dictionary):
   _AddClassAttributesForNestedExtensions(descriptor, dictionary)
   _AddSlots(descriptor, dictionary)
+  for name, lazy_method in _LAZY_METHODS.items():
+    dictionary.setdefault(name, lazy_method)
   return bases
 
 
 def InitMessage(descriptor, cls):
+  """Sets up the class-level attributes of cls.
+
+  Only what can be used without an instance is done here: constants, nested
+  enums, extension registration and FromString().  Encoders, decoders,
+  properties and methods are added by _CompleteInitMessage() when the first
+  instance is created, or when any of them is first looked up on the class, so
+  importing a module with many message types does not pay for the ones it
+  never uses.
+  """
   cls._decoders_by_tag = {}
   cls._extensions_by_name = {}
   cls._extensions_by_number = {}
+  # Extension handles known to be valid for cls, each mapped to the CheckValue
+  # method of its type checker, or to None if it is repeated or composite.
+  # See _VerifyExtensionHandle().
+  cls._extension_checkers = {}
   if (descriptor.has_options and
       descriptor.GetOptions().message_set_wire_format):
     cls._decoders_by_tag[decoder.MESSAGE_SET_ITEM_TAG] = (
         decoder.MessageSetItemDecoder(cls._extensions_by_number), None)
 
-  # Attach stuff to each FieldDescriptor for quick lookup later on.
-  for field in descriptor.fields:
-    _AttachFieldHelpers(cls, field)
-
   _AddEnumValues(descriptor, cls)
-  _AddInitMethod(descriptor, cls)
-  _AddPropertiesForFields(descriptor, cls)
-  _AddPropertiesForExtensions(descriptor, cls)
+  _AddFieldNumberConstants(descriptor, cls)
   _AddStaticMethods(cls)
-  _AddMessageMethods(descriptor, cls)
-  _AddPrivateHelperMethods(descriptor, cls)
-  copyreg.pickle(cls, lambda obj: (cls, (), obj.__getstate__()))
+  _AddLazyInitMethod(descriptor, cls)
+
+
+# Held while a class is being completed, so that two threads creating the
+# first instances of a class at the same time do not both complete it.
+_lazy_init_lock = threading.Lock()
+
+
+def _CompleteInitMessage(descriptor, cls):
+  """Does the part of InitMessage() which was put off until cls is used."""
+  _lazy_init_lock.acquire()
+  try:
+    if not cls._lazy_init_pending:
+      return
+    # Attach stuff to each FieldDescriptor for quick lookup later on.
+    for field in descriptor.fields:
+      _AttachFieldHelpers(cls, field)
+    # The class of _fields, see _FIELD_LAYOUTS.
+    if (_field_layout == 'slots' and
+        len(descriptor.fields) <= _MAX_SLOT_FIELDS):
+      cls._fields_class = _MakeSlotFieldsClass(descriptor)
+    else:
+      cls._fields_class = dict
+
+    _AddPropertiesForFields(descriptor, cls)
+    _AddMessageMethods(descriptor, cls)
+    _AddPrivateHelperMethods(descriptor, cls)
+    # Installed last: until it replaces the stub, other threads keep going
+    # through _CompleteInitMessage() and wait for the lock.
+    _AddInitMethod(descriptor, cls)
+    # The methods of message.Message which this module does not replace come
+    # back into view.
+    for name, lazy_method in _LAZY_METHODS.items():
+      if cls.__dict__.get(name) is lazy_method:
+        delattr(cls, name)
+    cls._lazy_init_pending = False
+  finally:
+    _lazy_init_lock.release()
+
+
+class _LazyMethod(object):
+
+  """Stands for a method of message.Message until the class is completed.
+
+  Without it, looking up a method on a class that has no instance yet would
+  find the abstract method of message.Message.  Looking it up, on the class or
+  on an instance, completes the class and returns the method put in its place.
+  """
+
+  __slots__ = ['name']
+
+  def __init__(self, name):
+    self.name = name
+
+  def __get__(self, instance, owner):
+    _CompleteInitMessage(owner.DESCRIPTOR, owner)
+    if instance is None:
+      return getattr(owner, self.name)
+    return getattr(instance, self.name)
+
+
+# Put in the dictionary of each class by NewMessage().  Special methods are
+# left out:  they are only looked up on instances, which complete the class.
+_LAZY_METHODS = dict(
+    (name, _LazyMethod(name))
+    for name, value in vars(message_mod.Message).items()
+    if not name.startswith('__') and isinstance(value, types.FunctionType))
+
+
+def GetLazyAttribute(cls, name):
+  """Completes cls and returns its attribute name.
+
+  Called by GeneratedProtocolMessageType.__getattr__() for the attributes a
+  class does not have, such as the properties of its fields until it is
+  completed.
+
+  Raises:
+    AttributeError: if cls does not have name once it is completed.
+  """
+  if not name.startswith('__') and cls.__dict__.get('_lazy_init_pending'):
+    _CompleteInitMessage(cls.DESCRIPTOR, cls)
+    return getattr(cls, name)
+  raise AttributeError(
+      'type object %r has no attribute %r' % (cls.__name__, name))
+
+
+def IsInitMessageComplete(cls):
+  """Returns whether the lazy part of InitMessage() has been done for cls."""
+  return not cls._lazy_init_pending
+
+
+def _AddLazyInitMethod(message_descriptor, cls):
+  """Adds a stub __init__ method which completes cls before its first use."""
+  def init(self, **kwargs):
+    _CompleteInitMessage(message_descriptor, cls)
+    cls.__init__(self, **kwargs)
+
+  init.__module__ = None
+  init.__doc__ = None
+  cls.__init__ = init
+  cls._lazy_init_pending = True
 
 
 # Stateless helpers for GeneratedProtocolMessageType below.
@@ -149,7 +582,18 @@ def _PropertyName(proto_field_name):
 
 
 def _VerifyExtensionHandle(message, extension_handle):
-  """Verify that the given extension handle is valid."""
+  """Verify that the given extension handle is valid.
+
+  Handles are registered with the class of message, or checked the first time
+  they are used with it, so later calls only look them up.
+  """
+
+  try:
+    if extension_handle in message._extension_checkers:
+      return
+  except TypeError:
+    # Not hashable, so not a handle either:  the checks below report it.
+    pass
 
   if not isinstance(extension_handle, _FieldDescriptor):
     raise KeyError('HasExtension() expects an extension handle, got: %s' %
@@ -169,6 +613,18 @@ def _VerifyExtensionHandle(message, extension_handle):
                     extension_handle.containing_type.full_name,
                     message.DESCRIPTOR.full_name))
 
+  message._extension_checkers[extension_handle] = _ExtensionChecker(
+      extension_handle)
+
+
+def _ExtensionChecker(extension_handle):
+  """Returns the CheckValue method of the type checker of an extension which
+  can be assigned, or None for repeated and composite extensions."""
+  if (extension_handle.label == _FieldDescriptor.LABEL_REPEATED or
+      extension_handle.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE):
+    return None
+  return type_checkers.GetTypeChecker(extension_handle).CheckValue
+
 
 def _AddSlots(message_descriptor, dictionary):
   """Adds a __slots__ entry to dictionary, containing the names of all valid
@@ -186,7 +642,16 @@ def _AddSlots(message_descriptor, dictionary):
                              '_listener',
                              '_listener_for_children',
                              '__weakref__',
-                             '_oneofs']
+                             '_oneofs',
+                             '_wire_span',
+                             '_utf8_cache',
+                             '_present_fields',
+                             '_fingerprint',
+                             '_deterministic_byte_size',
+                             '_unset_listener']
+  if message_descriptor.is_extendable:
+    # See _AddPropertiesForFields().
+    dictionary['__slots__'].append('_extension_dict')
 
 
 def _IsMessageSetExtension(field):
@@ -205,15 +670,54 @@ def _AttachFieldHelpers(cls, field_descriptor):
 
   if _IsMessageSetExtension(field_descriptor):
     field_encoder = encoder.MessageSetItemEncoder(field_descriptor.number)
+    deterministic_encoder = encoder.MessageSetItemEncoder(
+        field_descriptor.number, '_InternalSerializeDeterministic')
+    checked_encoder = encoder.MessageSetItemEncoder(
+        field_descriptor.number, '_InternalSerializeChecked')
     sizer = encoder.MessageSetItemSizer(field_descriptor.number)
+    deterministic_sizer = encoder.MessageSetItemSizer(
+        field_descriptor.number, '_DeterministicByteSize')
+    reverse_encoder = reverse_serializer.MessageSetItemEncoder(
+        field_descriptor.number)
   else:
     field_encoder = type_checkers.TYPE_TO_ENCODER[field_descriptor.type](
         field_descriptor.number, is_repeated, is_packed)
+    if field_descriptor.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      message_encoder = type_checkers.TYPE_TO_ENCODER[field_descriptor.type]
+      deterministic_encoder = message_encoder(
+          field_descriptor.number, is_repeated, is_packed,
+          '_InternalSerializeDeterministic')
+      checked_encoder = message_encoder(
+          field_descriptor.number, is_repeated, is_packed,
+          '_InternalSerializeChecked')
+    else:
+      deterministic_encoder = field_encoder
+      checked_encoder = field_encoder
     sizer = type_checkers.TYPE_TO_SIZER[field_descriptor.type](
         field_descriptor.number, is_repeated, is_packed)
+    if field_descriptor.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      deterministic_sizer = type_checkers.TYPE_TO_SIZER[field_descriptor.type](
+          field_descriptor.number, is_repeated, is_packed,
+          '_DeterministicByteSize')
+    else:
+      deterministic_sizer = sizer
+    reverse_encoder = reverse_serializer.FieldEncoder(
+        field_descriptor, is_repeated, field_encoder)
 
   field_descriptor._encoder = field_encoder
+  field_descriptor._deterministic_encoder = deterministic_encoder
+  field_descriptor._checked_encoder = checked_encoder
+  field_descriptor._reverse_encoder = reverse_encoder
+  if field_descriptor.type == _FieldDescriptor.TYPE_STRING:
+    # Strings and bytes look the same on the wire, so these size and encode
+    # strings which were already encoded to UTF-8.
+    field_descriptor._utf8_sizer = encoder.BytesSizer(
+        field_descriptor.number, is_repeated, False)
+    field_descriptor._utf8_encoder = encoder.BytesEncoder(
+        field_descriptor.number, is_repeated, False)
   field_descriptor._sizer = sizer
+  field_descriptor._deterministic_sizer = deterministic_sizer
+  field_descriptor._new_value = _NewValueConstructorForField(field_descriptor)
   field_descriptor._default_constructor = _DefaultValueConstructorForField(
       field_descriptor)
 
@@ -265,6 +769,136 @@ def _AddEnumValues(descriptor, cls):
       setattr(cls, enum_value.name, enum_value.number)
 
 
+def _NewValueConstructorForField(field):
+  """Returns a function which makes a new, empty value for a repeated or
+  composite field, or None for singular scalar fields.
+
+  The returned function has one argument, the listener of the new value.
+  """
+  if field.label == _FieldDescriptor.LABEL_REPEATED:
+    if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      # We can't look at _concrete_class yet since it might not have
+      # been set.  (Depends on order in which we initialize the classes).
+      def NewRepeatedMessage(listener):
+        return containers.RepeatedCompositeFieldContainer(
+            listener, field.message_type)
+      return NewRepeatedMessage
+    type_checker = type_checkers.GetTypeChecker(field)
+    def NewRepeatedScalar(listener):
+      return containers.RepeatedScalarFieldContainer(listener, type_checker)
+    return NewRepeatedScalar
+
+  if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+    # _concrete_class may not yet be initialized.
+    message_type = field.message_type
+    def NewSubMessage(listener):
+      result = message_type._concrete_class()
+      result._listener = listener
+      return result
+    return NewSubMessage
+
+  return None
+
+
+def _GetUnsetValue(message, field):
+  """Returns the value that getters return for a repeated or composite field
+  which is not set.
+
+  For a clean message, which is likely to be only read, the value is not put
+  in _fields, so that reading a field leaves the message as it is.  Its
+  listener, an _UnsetFieldsListener, puts it there once it is first changed,
+  and until then refers to it weakly so that reading the field again returns
+  the same value as long as it is in use.  A message which was changed since
+  it was last parsed or serialized is likely to be changed further, so the
+  value goes in _fields right away, as a new value for the field.  Frozen
+  messages share one frozen value per field, since nothing can be written
+  through it.
+  """
+  if message._cached_byte_size_dirty:
+    listener = _ListenerForField(message, field)
+    value = _TakeUnsetValue(message, field, listener)
+    if value is None:
+      value = field._new_value(listener)
+    # WARNING:  We are relying on setdefault() being atomic.  This is true
+    #   in CPython but we haven't investigated others.  This warning appears
+    #   in several other locations in this file.
+    return message._fields.setdefault(field, value)
+
+  if message._fields.__class__ is _FrozenFields:
+    try:
+      return field._frozen_default
+    except AttributeError:
+      value = field._new_value(_NULL_LISTENER)
+      _FreezeValue(value)
+      field._frozen_default = value
+      return value
+
+  listener_ref = message._unset_listener
+  listener = listener_ref and listener_ref()
+  if listener is None:
+    listener = _UnsetFieldsListener(message)
+    message._unset_listener = weakref.ref(listener)
+  else:
+    value_ref = listener.values.get(field)
+    if value_ref is not None:
+      value = value_ref()
+      if value is not None:
+        return value
+  value = field._new_value(listener)
+  listener.values[field] = weakref.ref(value)
+  return value
+
+
+def _ListenerForField(message, field):
+  """Returns the listener for a new value of a field of message."""
+  if (field.containing_oneof is not None and
+      field.label != _FieldDescriptor.LABEL_REPEATED):
+    return _OneofListener(message, field)
+  return message._ListenerForChildren()
+
+
+def _TakeUnsetValue(message, field, listener):
+  """Returns the value that _GetUnsetValue() returned for field, if it is
+  still in use, now listened to by listener.  The caller is expected to put it
+  in _fields.
+  """
+  listener_ref = message._unset_listener
+  unset_listener = listener_ref and listener_ref()
+  if unset_listener is not None:
+    value_ref = unset_listener.values.pop(field, None)
+    if value_ref is not None:
+      value = value_ref()
+      if value is not None:
+        unset_listener.Release(value, listener)
+        return value
+  return None
+
+
+def _ForgetUnsetValue(message, field):
+  """Leaves the value that _GetUnsetValue() returned for field, if any, out of
+  the message, as ClearField() does with a sub-message."""
+  listener_ref = message._unset_listener
+  listener = listener_ref and listener_ref()
+  if listener is not None:
+    listener.values.pop(field, None)
+
+
+def _DetachValue(fields, field, value):
+  """Makes value, the value of field which was just taken out of fields, the
+  _fields of a message, stop reporting its changes to the message, so that it
+  can be added elsewhere with AddAllocated()."""
+  if field.cpp_type != _FieldDescriptor.CPPTYPE_MESSAGE:
+    return
+  if fields.__class__ is _SharedFields and fields.shared.get(field) is value:
+    # It listens to the message it is shared from, which still holds it.
+    return
+  if field.label == _FieldDescriptor.LABEL_REPEATED:
+    for element in value._values:
+      element._SetListener(None)
+  else:
+    value._SetListener(None)
+
+
 def _DefaultValueConstructorForField(field):
   """Returns a function which returns a default value for a field.
 
@@ -283,27 +917,22 @@ def _DefaultValueConstructorForField(field):
     if field.has_default_value and field.default_value != []:
       raise ValueError('Repeated field default value not empty list: %s' % (
           field.default_value))
-    if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
-      # We can't look at _concrete_class yet since it might not have
-      # been set.  (Depends on order in which we initialize the classes).
-      message_type = field.message_type
-      def MakeRepeatedMessageDefault(message):
-        return containers.RepeatedCompositeFieldContainer(
-            message._listener_for_children, field.message_type)
-      return MakeRepeatedMessageDefault
-    else:
-      type_checker = type_checkers.GetTypeChecker(field)
-      def MakeRepeatedScalarDefault(message):
-        return containers.RepeatedScalarFieldContainer(
-            message._listener_for_children, type_checker)
-      return MakeRepeatedScalarDefault
+    new_value = field._new_value
+    def MakeRepeatedDefault(message):
+      listener = message._ListenerForChildren()
+      result = _TakeUnsetValue(message, field, listener)
+      if result is None:
+        result = new_value(listener)
+      return result
+    return MakeRepeatedDefault
 
   if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
-    # _concrete_class may not yet be initialized.
-    message_type = field.message_type
+    new_value = field._new_value
     def MakeSubMessageDefault(message):
-      result = message_type._concrete_class()
-      result._SetListener(message._listener_for_children)
+      listener = message._ListenerForChildren()
+      result = _TakeUnsetValue(message, field, listener)
+      if result is None:
+        result = new_value(listener)
       if field.containing_oneof:
         message._UpdateOneofState(field)
       return result
@@ -330,20 +959,38 @@ def _ReraiseTypeErrorWithFieldName(message_name, field_name):
 def _AddInitMethod(message_descriptor, cls):
   """Adds an __init__ method to cls."""
   fields = message_descriptor.fields
+  fields_class = cls._fields_class
   def init(self, **kwargs):
     self._cached_byte_size = 0
     self._cached_byte_size_dirty = len(kwargs) > 0
-    self._fields = {}
+    self._fields = fields_class()
     # Contains a mapping from oneof field descriptors to the descriptor
     # of the currently set field in that oneof field.
-    self._oneofs = {}
+    self._oneofs = _NO_ONEOFS
 
     # _unknown_fields is () when empty for efficiency, and will be turned into
     # a list if fields are added.
     self._unknown_fields = ()
     self._is_present_in_parent = False
-    self._listener = message_listener_mod.NullMessageListener()
-    self._listener_for_children = _Listener(self)
+    self._listener = _NULL_LISTENER
+    # Created by _ListenerForChildren() when the first child needs it.
+    self._listener_for_children = None
+    # (buffer, start, end) of the bytes this message was parsed from, as long
+    # as it has not been modified since.  See _InternalParse().
+    self._wire_span = None
+    # UTF-8 encodings of string fields, computed by ByteSize() and used up by
+    # the next serialization.  See _AddByteSizeMethod().
+    self._utf8_cache = None
+    # What _ListFields() returned while the message was clean.  See
+    # _AddListFieldsMethod().
+    self._present_fields = None
+    # Digest cached by Fingerprint() while the message is clean.
+    self._fingerprint = None
+    # Size cached by _DeterministicByteSize() while the message is clean.
+    self._deterministic_byte_size = None
+    # Weak reference to the _UnsetFieldsListener of the values that getters
+    # returned for repeated and composite fields which are not set.
+    self._unset_listener = None
     for field_name, field_value in kwargs.iteritems():
       field = _GetFieldByName(message_descriptor, field_name)
       if field is None:
@@ -396,9 +1043,16 @@ def _AddPropertiesForFields(descriptor, cls):
     _AddPropertiesForField(field, cls)
 
   if descriptor.is_extendable:
-    # _ExtensionDict is just an adaptor with no state so we allocate a new one
-    # every time it is accessed.
-    cls.Extensions = property(lambda self: _ExtensionDict(self))
+    # The _ExtensionDict of a message is made when it is first used and then
+    # kept in _extension_dict.  It refers back to the message, so a message
+    # whose Extensions were used is freed by the cycle collector.
+    def GetExtensions(self):
+      try:
+        return self._extension_dict
+      except AttributeError:
+        extension_dict = self._extension_dict = _ExtensionDict(self)
+        return extension_dict
+    cls.Extensions = property(GetExtensions)
 
 
 def _AddPropertiesForField(field, cls):
@@ -415,9 +1069,6 @@ def _AddPropertiesForField(field, cls):
   # handle specially here.
   assert _FieldDescriptor.MAX_CPPTYPE == 10
 
-  constant_name = field.name.upper() + "_FIELD_NUMBER"
-  setattr(cls, constant_name, field.number)
-
   if field.label == _FieldDescriptor.LABEL_REPEATED:
     _AddPropertiesForRepeatedField(field, cls)
   elif field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
@@ -444,18 +1095,13 @@ def _AddPropertiesForRepeatedField(field, cls):
   property_name = _PropertyName(proto_field_name)
 
   def getter(self):
-    field_value = self._fields.get(field)
+    fields = self._fields
+    field_value = fields.get(field)
     if field_value is None:
-      # Construct a new object to represent this field.
-      field_value = field._default_constructor(self)
-
-      # Atomically check if another thread has preempted us and, if not, swap
-      # in the new object we just created.  If someone has preempted us, we
-      # take that object and discard ours.
-      # WARNING:  We are relying on setdefault() being atomic.  This is true
-      #   in CPython but we haven't investigated others.  This warning appears
-      #   in several other locations in this file.
-      field_value = self._fields.setdefault(field, field_value)
+      field_value = _GetUnsetValue(self, field)
+    elif (fields.__class__ is _SharedFields and
+          fields.shared.get(field) is field_value):
+      field_value = _UnshareField(self, field)
     return field_value
   getter.__module__ = None
   getter.__doc__ = 'Getter for %s.' % proto_field_name
@@ -488,10 +1134,25 @@ def _AddPropertiesForNonRepeatedScalarField(field, cls):
   valid_values = set()
   is_proto3 = field.containing_type.syntax == "proto3"
 
-  def getter(self):
-    # TODO(protobuf-team): This may be broken since there may not be
-    # default_value.  Combine with has_default_value somehow.
-    return self._fields.get(field, default_value)
+  fields_class = cls._fields_class
+
+  if fields_class is dict:
+    def getter(self):
+      # TODO(protobuf-team): This may be broken since there may not be
+      # default_value.  Combine with has_default_value somehow.
+      return self._fields.get(field, default_value)
+  else:
+    # The 'slots' layout:  the slot is used directly, unless the message is
+    # frozen or shares values, see _FIELD_LAYOUTS.
+    bit, get_slot, set_slot, _ = fields_class._slot_plan[field]
+
+    def getter(self):
+      fields = self._fields
+      if fields.__class__ is fields_class:
+        if fields.has_bits & bit:
+          return get_slot(fields)
+        return default_value
+      return fields.get(field, default_value)
   getter.__module__ = None
   getter.__doc__ = 'Getter for %s.' % proto_field_name
 
@@ -502,10 +1163,14 @@ def _AddPropertiesForNonRepeatedScalarField(field, cls):
     # Testing the value for truthiness captures all of the proto3 defaults
     # (0, 0.0, enum 0, and False).
     new_value = type_checker.CheckValue(new_value)
+    fields = self._fields
     if clear_when_set_to_default and not new_value:
-      self._fields.pop(field, None)
+      fields.pop(field, None)
+    elif fields_class is not dict and fields.__class__ is fields_class:
+      set_slot(fields, new_value)
+      fields.has_bits |= bit
     else:
-      self._fields[field] = new_value
+      fields[field] = new_value
     # Check _cached_byte_size_dirty inline to improve performance, since scalar
     # setters are called frequently.
     if not self._cached_byte_size_dirty:
@@ -542,29 +1207,14 @@ def _AddPropertiesForNonRepeatedCompositeField(field, cls):
   proto_field_name = field.name
   property_name = _PropertyName(proto_field_name)
 
-  # TODO(komarek): Can anyone explain to me why we cache the message_type this
-  # way, instead of referring to field.message_type inside of getter(self)?
-  # What if someone sets message_type later on (which makes for simpler
-  # dyanmic proto descriptor and class creation code).
-  message_type = field.message_type
-
   def getter(self):
-    field_value = self._fields.get(field)
+    fields = self._fields
+    field_value = fields.get(field)
     if field_value is None:
-      # Construct a new object to represent this field.
-      field_value = message_type._concrete_class()  # use field.message_type?
-      field_value._SetListener(
-          _OneofListener(self, field)
-          if field.containing_oneof is not None
-          else self._listener_for_children)
-
-      # Atomically check if another thread has preempted us and, if not, swap
-      # in the new object we just created.  If someone has preempted us, we
-      # take that object and discard ours.
-      # WARNING:  We are relying on setdefault() being atomic.  This is true
-      #   in CPython but we haven't investigated others.  This warning appears
-      #   in several other locations in this file.
-      field_value = self._fields.setdefault(field, field_value)
+      field_value = _GetUnsetValue(self, field)
+    elif (fields.__class__ is _SharedFields and
+          fields.shared.get(field) is field_value):
+      field_value = _UnshareField(self, field)
     return field_value
   getter.__module__ = None
   getter.__doc__ = 'Getter for %s.' % proto_field_name
@@ -580,8 +1230,13 @@ def _AddPropertiesForNonRepeatedCompositeField(field, cls):
   setattr(cls, property_name, property(getter, setter, doc=doc))
 
 
-def _AddPropertiesForExtensions(descriptor, cls):
-  """Adds properties for all fields in this protocol message type."""
+def _AddFieldNumberConstants(descriptor, cls):
+  """Adds the FOO_FIELD_NUMBER constants for all fields and nested extensions
+  of this protocol message type."""
+  for field in descriptor.fields:
+    constant_name = field.name.upper() + "_FIELD_NUMBER"
+    setattr(cls, constant_name, field.number)
+
   extension_dict = descriptor.extensions_by_name
   for extension_name, extension_field in extension_dict.iteritems():
     constant_name = extension_name.upper() + "_FIELD_NUMBER"
@@ -606,6 +1261,8 @@ def _AddStaticMethods(cls):
            cls.DESCRIPTOR.full_name, extension_handle.number))
 
     cls._extensions_by_name[extension_handle.full_name] = extension_handle
+    cls._extension_checkers[extension_handle] = _ExtensionChecker(
+        extension_handle)
 
     handle = extension_handle  # avoid line wrapping
     if _IsMessageSetExtension(handle):
@@ -615,9 +1272,11 @@ def _AddStaticMethods(cls):
 
   cls.RegisterExtension = staticmethod(RegisterExtension)
 
-  def FromString(s):
+  def FromString(s, frozen=False):
     message = cls()
     message.MergeFromString(s)
+    if frozen:
+      message.Freeze()
     return message
   cls.FromString = staticmethod(FromString)
 
@@ -634,14 +1293,41 @@ def _IsPresent(item):
     return True
 
 
+def _FieldNumberOfItem(item):
+  return item[0].number
+
+
+def _PresentFields(message):
+  """Returns the present fields of message sorted by field number."""
+  all_fields = [item for item in message._fields.iteritems()
+                if _IsPresent(item)]
+  all_fields.sort(key=_FieldNumberOfItem)
+  return all_fields
+
+
 def _AddListFieldsMethod(message_descriptor, cls):
   """Helper for _AddMessageMethods()."""
 
-  def ListFields(self):
-    all_fields = [item for item in self._fields.iteritems() if _IsPresent(item)]
-    all_fields.sort(key = lambda item: item[0].number)
+  # A clean message (one with a valid cached size) cannot gain or lose a field
+  # without going through _Modified(), so the sorted list is kept in
+  # _present_fields for as long as the message stays clean.  _Modified() drops
+  # it, which keeps it None while the message is dirty.  Methods that make a
+  # message clean store the list they used, if any.
+  def _ListFields(self):
+    """Like ListFields(), but the list is shared and must not be modified."""
+    if self._cached_byte_size_dirty:
+      return _PresentFields(self)
+    all_fields = self._present_fields
+    if all_fields is None:
+      all_fields = self._present_fields = _PresentFields(self)
     return all_fields
 
+  def ListFields(self):
+    if self._fields.__class__ is _SharedFields:
+      _UnshareFields(self)
+    return list(_ListFields(self))
+
+  cls._ListFields = _ListFields
   cls.ListFields = ListFields
 
 _Proto3HasError = 'Protocol message has no non-repeated submessage field "%s"'
@@ -704,14 +1390,18 @@ def _AddClearFieldMethod(message_descriptor, cls):
       except KeyError:
         raise ValueError('Protocol message has no "%s" field.' % field_name)
 
-    if field in self._fields:
-      # Note:  If the field is a sub-message, its listener will still point
-      #   at us.  That's fine, because the worst than can happen is that it
-      #   will call _Modified() and invalidate our byte size.  Big deal.
-      del self._fields[field]
+    fields = self._fields
+    if field in fields:
+      value = fields[field]
+      del fields[field]
+      _DetachValue(fields, field, value)
 
       if self._oneofs.get(field.containing_oneof, None) is field:
         del self._oneofs[field.containing_oneof]
+    else:
+      # Like a sub-message removed from _fields above, a value returned while
+      # the field was not set no longer belongs to the message.
+      _ForgetUnsetValue(self, field)
 
     # Always call _Modified() -- even if nothing was changed, this is
     # a mutating method, and thus calling it should cause the field to become
@@ -721,26 +1411,72 @@ def _AddClearFieldMethod(message_descriptor, cls):
   cls.ClearField = ClearField
 
 
+def _AddReleaseFieldMethod(message_descriptor, cls):
+  """Helper for _AddMessageMethods()."""
+  def ReleaseField(self, field_name):
+    try:
+      field = message_descriptor.fields_by_name[field_name]
+    except KeyError:
+      raise ValueError('Protocol message has no "%s" field.' % field_name)
+    if (field.label == _FieldDescriptor.LABEL_REPEATED or
+        field.cpp_type != _FieldDescriptor.CPPTYPE_MESSAGE):
+      raise ValueError(
+          'Protocol message field "%s" is not a singular message field.' %
+          field_name)
+
+    fields = self._fields
+    value = fields.get(field)
+    if value is None or not value._is_present_in_parent:
+      return None
+    if (fields.__class__ is _SharedFields and
+        fields.shared.get(field) is value):
+      value = _UnshareField(self, field)
+    del fields[field]
+    if self._oneofs.get(field.containing_oneof, None) is field:
+      del self._oneofs[field.containing_oneof]
+    # Unlike ClearField(), the sub-message is handed over to the caller, so
+    # that it no longer marks us as modified.
+    value._SetListener(None)
+    self._Modified()
+    return value
+
+  cls.ReleaseField = ReleaseField
+
+
 def _AddClearExtensionMethod(cls):
   """Helper for _AddMessageMethods()."""
   def ClearExtension(self, extension_handle):
     _VerifyExtensionHandle(self, extension_handle)
 
     # Similar to ClearField(), above.
-    if extension_handle in self._fields:
-      del self._fields[extension_handle]
+    fields = self._fields
+    if extension_handle in fields:
+      value = fields[extension_handle]
+      del fields[extension_handle]
+      _DetachValue(fields, extension_handle, value)
+    else:
+      _ForgetUnsetValue(self, extension_handle)
     self._Modified()
   cls.ClearExtension = ClearExtension
 
 
 def _AddClearMethod(message_descriptor, cls):
   """Helper for _AddMessageMethods()."""
+  fields_class = cls._fields_class
   def Clear(self):
+    if self._fields.__class__ is _FrozenFields:
+      raise AttributeError('Cannot modify a frozen message.')
+    # Marked first, while any copies sharing our values are still listed in
+    # _fields.
+    self._Modified()
     # Clear fields.
-    self._fields = {}
+    fields = self._fields
+    self._fields = fields_class()
+    for field, value in fields.items():
+      _DetachValue(fields, field, value)
+    self._unset_listener = None
     self._unknown_fields = ()
-    self._oneofs = {}
-    self._Modified()
+    self._oneofs = _NO_ONEOFS
   cls.Clear = Clear
 
 
@@ -769,7 +1505,18 @@ def _AddEqualsMethod(message_descriptor, cls):
     if self is other:
       return True
 
-    if not self.ListFields() == other.ListFields():
+    if (self._fields.__class__ is _FrozenFields and
+        other._fields.__class__ is _FrozenFields):
+      if hash(self) != hash(other):
+        return False
+      wire_span = self._wire_span
+      other_wire_span = other._wire_span
+      if (wire_span and other_wire_span and
+          wire_span[0][wire_span[1]:wire_span[2]] ==
+          other_wire_span[0][other_wire_span[1]:other_wire_span[2]]):
+        return True
+
+    if not self._ListFields() == other._ListFields():
       return False
 
     # Sort unknown fields because their order shouldn't affect equality test.
@@ -802,7 +1549,7 @@ def _AddSetListenerMethod(cls):
   """Helper for _AddMessageMethods()."""
   def SetListener(self, listener):
     if listener is None:
-      self._listener = message_listener_mod.NullMessageListener()
+      self._listener = _NULL_LISTENER
     else:
       self._listener = listener
   cls._SetListener = SetListener
@@ -831,12 +1578,24 @@ def _BytesForNonRepeatedElement(value, field_number, field_type):
 def _AddByteSizeMethod(message_descriptor, cls):
   """Helper for _AddMessageMethods()."""
 
+  # Sizing a string field means encoding it to UTF-8, and serialization has to
+  # encode it again.  Sub-messages are always sized right before they are
+  # serialized, so ByteSize() keeps the encodings in _utf8_cache, where the
+  # next serialization picks them up (and drops them, so that they do not take
+  # up memory for longer than needed).  Any modification clears the cache as
+  # well, see _Modified().  Extensions are not cached.
+  string_fields = dict(
+      (field, field.label == _FieldDescriptor.LABEL_REPEATED)
+      for field in message_descriptor.fields
+      if field.type == _FieldDescriptor.TYPE_STRING)
+
   def ByteSize(self):
     if not self._cached_byte_size_dirty:
       return self._cached_byte_size
 
     size = 0
-    for field_descriptor, field_value in self.ListFields():
+    all_fields = _PresentFields(self)
+    for field_descriptor, field_value in all_fields:
       size += field_descriptor._sizer(field_value)
 
     for tag_bytes, value_bytes in self._unknown_fields:
@@ -844,43 +1603,280 @@ def _AddByteSizeMethod(message_descriptor, cls):
 
     self._cached_byte_size = size
     self._cached_byte_size_dirty = False
-    self._listener_for_children.dirty = False
+    self._present_fields = all_fields
+    listener_for_children = self._listener_for_children
+    if listener_for_children is not None:
+      listener_for_children.dirty = False
     return size
 
-  cls.ByteSize = ByteSize
+  def ByteSizeCachingStrings(self):
+    if not self._cached_byte_size_dirty:
+      return self._cached_byte_size
+
+    size = 0
+    utf8_cache = None
+    all_fields = _PresentFields(self)
+    for field_descriptor, field_value in all_fields:
+      is_repeated = string_fields.get(field_descriptor)
+      if is_repeated is None:
+        size += field_descriptor._sizer(field_value)
+        continue
+      if is_repeated:
+        encoded = [element.encode('utf-8') for element in field_value]
+      else:
+        encoded = field_value.encode('utf-8')
+      if utf8_cache is None:
+        utf8_cache = {}
+      utf8_cache[field_descriptor] = encoded
+      size += field_descriptor._utf8_sizer(encoded)
+
+    for tag_bytes, value_bytes in self._unknown_fields:
+      size += len(tag_bytes) + len(value_bytes)
+
+    self._utf8_cache = utf8_cache
+    self._cached_byte_size = size
+    self._cached_byte_size_dirty = False
+    self._present_fields = all_fields
+    listener_for_children = self._listener_for_children
+    if listener_for_children is not None:
+      listener_for_children.dirty = False
+    return size
+
+  if string_fields:
+    cls.ByteSize = ByteSizeCachingStrings
+  else:
+    cls.ByteSize = ByteSize
+
+  message_fields = [field for field in message_descriptor.fields
+                    if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE]
+  extendable = message_descriptor.is_extendable
+
+  def DeterministicByteSize(self):
+    # The number of bytes _InternalSerializeDeterministic() writes.  Unlike
+    # ByteSize(), it never is the length of the bytes the message, or one of
+    # its sub-messages, was parsed from, which it does not reuse.  Kept in
+    # _deterministic_byte_size until _Modified() drops it, like _fingerprint,
+    # so that each message of a tree is sized once.
+    size = self._deterministic_byte_size
+    if size is None:
+      # Also makes the message clean, which keeping the size needs.
+      size = self.ByteSize()
+      if self._wire_span is None:
+        # Counted field by field, so only sub-messages can differ.  Those
+        # which are not present count for nothing either way.
+        if extendable:
+          sub_message_fields = [
+              field for field, _ in self._ListFields()
+              if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE]
+        else:
+          sub_message_fields = message_fields
+        fields = self._fields
+        for field_descriptor in sub_message_fields:
+          field_value = fields.get(field_descriptor)
+          if field_value is not None:
+            size += (field_descriptor._deterministic_sizer(field_value) -
+                     field_descriptor._sizer(field_value))
+      else:
+        size = 0
+        for field_descriptor, field_value in self._ListFields():
+          size += field_descriptor._deterministic_sizer(field_value)
+        for tag_bytes, value_bytes in self._unknown_fields:
+          size += len(tag_bytes) + len(value_bytes)
+      self._deterministic_byte_size = size
+    return size
+  cls._DeterministicByteSize = DeterministicByteSize
 
 
 def _AddSerializeToStringMethod(message_descriptor, cls):
   """Helper for _AddMessageMethods()."""
 
-  def SerializeToString(self):
-    # Check if the message has all of its required fields set.
-    errors = []
-    if not self.IsInitialized():
-      raise message_mod.EncodeError(
-          'Message %s is missing required fields: %s' % (
-          self.DESCRIPTOR.full_name, ','.join(self.FindInitializationErrors())))
-    return self.SerializePartialToString()
+  def SerializeToString(self, deterministic=False):
+    if (deterministic or self._wire_span or
+        _serialization_strategy != 'generic'):
+      # Check if the message has all of its required fields set.
+      if self.IsInitialized():
+        return self.SerializePartialToString(deterministic)
+    else:
+      # Required fields are checked while the message is written, rather than
+      # by a separate IsInitialized() pass over the whole tree.
+      out = BytesIO()
+      try:
+        self._InternalSerializeChecked(out.write)
+        return out.getvalue()
+      except _RequiredFieldMissing:
+        pass
+    raise message_mod.EncodeError(
+        'Message %s is missing required fields: %s' % (
+        self.DESCRIPTOR.full_name, ','.join(self.FindInitializationErrors())))
   cls.SerializeToString = SerializeToString
 
 
+def _CompileInternalSerialize(cls):
+  """Returns the serialization function compiled_serializer generates for cls.
+
+  It is generated on first use, and then replaces the placeholder
+  _CompiledInternalSerialize() method of cls.
+  """
+  # Read from the class dictionary, so that Python 2 hands back the function
+  # rather than an unbound method.
+  internal_serialize = cls.__dict__['_compiled_internal_serialize']
+  if internal_serialize is None:
+    internal_serialize = compiled_serializer.MakeInternalSerialize(
+        cls.DESCRIPTOR, _IsPresent)
+    cls._compiled_internal_serialize = internal_serialize
+    cls._CompiledInternalSerialize = internal_serialize
+  return internal_serialize
+
+
+class _RequiredFieldMissing(Exception):
+  """Raised by _InternalSerializeChecked() on an uninitialized message."""
+
+
+def _UnknownFieldNumber(unknown_field):
+  """Returns the field number of a (tag_bytes, value_bytes) unknown field."""
+  return decoder._DecodeVarint(unknown_field[0], 0)[0] >> 3
+
+
 def _AddSerializePartialToStringMethod(message_descriptor, cls):
   """Helper for _AddMessageMethods()."""
 
-  def SerializePartialToString(self):
+  def SerializePartialToString(self, deterministic=False):
+    if deterministic:
+      out = BytesIO()
+      self._InternalSerializeDeterministic(out.write)
+      return out.getvalue()
+    wire_span = self._wire_span
+    if wire_span and wire_span[1] == 0 and wire_span[2] == len(wire_span[0]):
+      # Parsed from a whole string and never modified:  hand back the original.
+      return wire_span[0]
+    if _serialization_strategy == 'reverse':
+      buffer = reverse_serializer.ReverseBuffer()
+      self._InternalSerializeReversed(buffer)
+      return buffer.getvalue()
     out = BytesIO()
-    self._InternalSerialize(out.write)
+    if _serialization_strategy == 'compiled':
+      self._CompiledInternalSerialize(out.write)
+    else:
+      self._InternalSerialize(out.write)
     return out.getvalue()
   cls.SerializePartialToString = SerializePartialToString
 
+  def CompiledInternalSerialize(self, write_bytes):
+    # Most message types are never serialized, so we only generate their
+    # serializer the first time it is needed, see _CompileInternalSerialize().
+    return _CompileInternalSerialize(cls)(self, write_bytes)
+  cls._CompiledInternalSerialize = CompiledInternalSerialize
+  cls._compiled_internal_serialize = None
+
   def InternalSerialize(self, write_bytes):
-    for field_descriptor, field_value in self.ListFields():
-      field_descriptor._encoder(write_bytes, field_value)
+    wire_span = self._wire_span
+    if wire_span:
+      (buffer, start, end) = wire_span
+      return write_bytes(buffer[start:end])
+    utf8_cache = self._utf8_cache
+    if utf8_cache is None:
+      for field_descriptor, field_value in self._ListFields():
+        field_descriptor._encoder(write_bytes, field_value)
+    else:
+      # Left behind by ByteSize(), see _AddByteSizeMethod().
+      self._utf8_cache = None
+      for field_descriptor, field_value in self._ListFields():
+        encoded = utf8_cache.get(field_descriptor)
+        if encoded is None:
+          field_descriptor._encoder(write_bytes, field_value)
+        else:
+          field_descriptor._utf8_encoder(write_bytes, encoded)
     for tag_bytes, value_bytes in self._unknown_fields:
       write_bytes(tag_bytes)
       write_bytes(value_bytes)
   cls._InternalSerialize = InternalSerialize
 
+  required_fields = [field for field in message_descriptor.fields
+                     if field.label == _FieldDescriptor.LABEL_REQUIRED]
+
+  def InternalSerializeChecked(self, write_bytes):
+    # Like InternalSerialize(), but raises _RequiredFieldMissing if a required
+    # field is missing anywhere in the message tree.
+    if not _CanHaveRequiredFields(cls):
+      return InternalSerialize(self, write_bytes)
+    fields = self._fields
+    for field in required_fields:
+      if (field not in fields or
+          (field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE and
+           not fields[field]._is_present_in_parent)):
+        raise _RequiredFieldMissing()
+    if self._wire_span:
+      # The parsed bytes are reused, but what they hold still needs checking.
+      if not self.IsInitialized():
+        raise _RequiredFieldMissing()
+      return InternalSerialize(self, write_bytes)
+    utf8_cache = self._utf8_cache
+    if utf8_cache is None:
+      for field_descriptor, field_value in self._ListFields():
+        field_descriptor._checked_encoder(write_bytes, field_value)
+    else:
+      self._utf8_cache = None
+      for field_descriptor, field_value in self._ListFields():
+        encoded = utf8_cache.get(field_descriptor)
+        if encoded is None:
+          field_descriptor._checked_encoder(write_bytes, field_value)
+        else:
+          field_descriptor._utf8_encoder(write_bytes, encoded)
+    for tag_bytes, value_bytes in self._unknown_fields:
+      write_bytes(tag_bytes)
+      write_bytes(value_bytes)
+  cls._InternalSerializeChecked = InternalSerializeChecked
+
+  def InternalSerializeDeterministic(self, write_bytes):
+    # Fields and extensions come out of ListFields() in field number order.
+    # Parsed bytes are never reused, since they are in whatever order the
+    # sender chose, and unknown fields are sorted by field number.  The order
+    # of unknown values with the same number is kept, as it is significant for
+    # repeated fields.
+    utf8_cache = self._utf8_cache
+    if utf8_cache is None:
+      for field_descriptor, field_value in self._ListFields():
+        field_descriptor._deterministic_encoder(write_bytes, field_value)
+    else:
+      self._utf8_cache = None
+      for field_descriptor, field_value in self._ListFields():
+        encoded = utf8_cache.get(field_descriptor)
+        if encoded is None:
+          field_descriptor._deterministic_encoder(write_bytes, field_value)
+        else:
+          field_descriptor._utf8_encoder(write_bytes, encoded)
+    if self._unknown_fields:
+      for tag_bytes, value_bytes in sorted(self._unknown_fields,
+                                           key=_UnknownFieldNumber):
+        write_bytes(tag_bytes)
+        write_bytes(value_bytes)
+  cls._InternalSerializeDeterministic = InternalSerializeDeterministic
+
+  def InternalSerializeReversed(self, buffer):
+    wire_span = self._wire_span
+    if wire_span:
+      (data, start, end) = wire_span
+      return buffer.Prepend(data[start:end])
+    size_before = buffer.Size()
+    # This strategy never calls ByteSize(), so it has no use for encodings
+    # cached by an earlier call.
+    self._utf8_cache = None
+    for tag_bytes, value_bytes in reversed(self._unknown_fields):
+      buffer.Prepend(value_bytes)
+      buffer.Prepend(tag_bytes)
+    all_fields = self._ListFields()
+    for field_descriptor, field_value in reversed(all_fields):
+      field_descriptor._reverse_encoder(buffer, field_value)
+    # Everything written since we started is this message, so this is exactly
+    # what ByteSize() would compute.  Cache it the same way.
+    self._cached_byte_size = buffer.Size() - size_before
+    self._cached_byte_size_dirty = False
+    self._present_fields = all_fields
+    listener_for_children = self._listener_for_children
+    if listener_for_children is not None:
+      listener_for_children.dirty = False
+  cls._InternalSerializeReversed = InternalSerializeReversed
+
 
 def _AddMergeFromStringMethod(message_descriptor, cls):
   """Helper for _AddMessageMethods()."""
@@ -905,6 +1901,21 @@ def _AddMergeFromStringMethod(message_descriptor, cls):
   is_proto3 = message_descriptor.syntax == "proto3"
 
   def InternalParse(self, buffer, pos, end):
+    # A message which was empty before this call and is parsed from an
+    # immutable string remembers the span it came from, so that it can be
+    # re-serialized by copying those bytes for as long as it stays unmodified.
+    # Emptiness is checked on _fields itself:  messages built from keyword
+    # arguments hold fields without having been marked present.
+    # Holding a span implies a clean cached size, so the first modification
+    # goes through _Modified(), which drops the span here and in all ancestors.
+    # That only works if every sub-message is clean too, so the decoders set
+    # _wire_span to False on the parent when a sub-message could not keep its
+    # own span.
+    if self._fields.__class__ is _SharedFields:
+      _UnshareFields(self)
+    retain_span = (not self._fields and not self._unknown_fields and
+                   type(buffer) is bytes)
+    start = pos
     self._Modified()
     field_dict = self._fields
     unknown_field_list = self._unknown_fields
@@ -915,27 +1926,67 @@ def _AddMergeFromStringMethod(message_descriptor, cls):
         value_start_pos = new_pos
         new_pos = local_SkipField(buffer, new_pos, end, tag_bytes)
         if new_pos == -1:
-          return pos
+          break
         if not is_proto3:
           if not unknown_field_list:
             unknown_field_list = self._unknown_fields = []
           unknown_field_list.append(
               (tag_bytes, buffer[value_start_pos:new_pos]))
+        else:
+          # The original bytes contain fields we are dropping.
+          retain_span = False
         pos = new_pos
       else:
         pos = field_decoder(buffer, new_pos, end, self, field_dict)
         if field_desc:
           self._UpdateOneofState(field_desc)
+    if retain_span and self._wire_span is None:
+      self._wire_span = (buffer, start, pos)
+      self._cached_byte_size = pos - start
+      self._cached_byte_size_dirty = False
+      listener_for_children = self._listener_for_children
+      if listener_for_children is not None:
+        listener_for_children.dirty = False
     return pos
   cls._InternalParse = InternalParse
 
 
+def _CanHaveRequiredFields(cls):
+  """Returns whether messages of class cls can contain required fields.
+
+  Every message type that can be nested in cls.DESCRIPTOR, at any depth, is
+  looked at.  Extendable types count as having required fields, since any
+  message type could be used as an extension.  The answer is computed on first
+  use and kept in cls._can_have_required_fields.
+  """
+  can_have_required_fields = cls._can_have_required_fields
+  if can_have_required_fields is None:
+    can_have_required_fields = False
+    pending = [cls.DESCRIPTOR]
+    seen = set(pending)
+    while pending and not can_have_required_fields:
+      message_descriptor = pending.pop()
+      if message_descriptor.is_extendable:
+        can_have_required_fields = True
+      for field in message_descriptor.fields:
+        if field.label == _FieldDescriptor.LABEL_REQUIRED:
+          can_have_required_fields = True
+        elif (field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE and
+              field.message_type not in seen):
+          seen.add(field.message_type)
+          pending.append(field.message_type)
+    cls._can_have_required_fields = can_have_required_fields
+  return can_have_required_fields
+
+
 def _AddIsInitializedMethod(message_descriptor, cls):
   """Adds the IsInitialized and FindInitializationError methods to the
   protocol message class."""
 
   required_fields = [field for field in message_descriptor.fields
                            if field.label == _FieldDescriptor.LABEL_REQUIRED]
+  # Filled in by _CanHaveRequiredFields().
+  cls._can_have_required_fields = None
 
   def IsInitialized(self, errors=None):
     """Checks if all required fields of a message are set.
@@ -950,6 +2001,9 @@ def _AddIsInitializedMethod(message_descriptor, cls):
 
     # Performance is critical so we avoid HasField() and ListFields().
 
+    if not _CanHaveRequiredFields(cls):
+      return True
+
     for field in required_fields:
       if (field not in self._fields or
           (field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE and
@@ -985,11 +2039,14 @@ def _AddIsInitializedMethod(message_descriptor, cls):
 
     errors = []  # simplify things
 
+    if not _CanHaveRequiredFields(cls):
+      return errors
+
     for field in required_fields:
       if not self.HasField(field.name):
         errors.append(field.name)
 
-    for field, value in self.ListFields():
+    for field, value in self._ListFields():
       if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
         if field.is_extension:
           name = "(%s)" % field.full_name
@@ -1012,9 +2069,35 @@ def _AddIsInitializedMethod(message_descriptor, cls):
   cls.FindInitializationErrors = FindInitializationErrors
 
 
-def _AddMergeFromMethod(cls):
-  LABEL_REPEATED = _FieldDescriptor.LABEL_REPEATED
-  CPPTYPE_MESSAGE = _FieldDescriptor.CPPTYPE_MESSAGE
+# What MergeFrom() does with each field of the message merged in.  See
+# _MergeAction().
+_MERGE_SCALAR = 0
+_MERGE_ONEOF_SCALAR = 1
+_MERGE_REPEATED_SCALAR = 2
+_MERGE_REPEATED_COMPOSITE = 3
+_MERGE_COMPOSITE = 4
+
+
+def _MergeAction(field):
+  """Returns the _MERGE_* constant telling MergeFrom() how to merge field."""
+  if field.label == _FieldDescriptor.LABEL_REPEATED:
+    if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      return _MERGE_REPEATED_COMPOSITE
+    return _MERGE_REPEATED_SCALAR
+  elif field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+    return _MERGE_COMPOSITE
+  elif field.containing_oneof:
+    return _MERGE_ONEOF_SCALAR
+  else:
+    return _MERGE_SCALAR
+
+
+def _AddMergeFromMethod(message_descriptor, cls):
+  # The merge plan maps each field to its _MERGE_* action, so that merging
+  # does not look at the label, type and oneof of every field again.
+  # Extensions are added to it the first time they are merged.
+  merge_plan = dict((field, _MergeAction(field))
+                    for field in message_descriptor.fields)
 
   def MergeFrom(self, msg):
     if not isinstance(msg, cls):
@@ -1026,29 +2109,47 @@ def _AddMergeFromMethod(cls):
     self._Modified()
 
     fields = self._fields
+    if fields.__class__ is _SharedFields:
+      _UnshareFields(self)
 
     for field, value in msg._fields.iteritems():
-      if field.label == LABEL_REPEATED:
-        field_value = fields.get(field)
-        if field_value is None:
-          # Construct a new object to represent this field.
-          field_value = field._default_constructor(self)
-          fields[field] = field_value
-        field_value.MergeFrom(value)
-      elif field.cpp_type == CPPTYPE_MESSAGE:
-        if value._is_present_in_parent:
+      action = merge_plan.get(field)
+      if action is None:
+        action = merge_plan.setdefault(field, _MergeAction(field))
+      if action == _MERGE_SCALAR:
+        fields[field] = value
+      elif action == _MERGE_ONEOF_SCALAR:
+        fields[field] = value
+        self._UpdateOneofState(field)
+      elif action == _MERGE_REPEATED_SCALAR:
+        values = value._values
+        if values:
           field_value = fields.get(field)
           if field_value is None:
             # Construct a new object to represent this field.
             field_value = field._default_constructor(self)
             fields[field] = field_value
-            if field.containing_oneof:
-              self._UpdateOneofState(field)
+          # The values were checked when they were added to msg, and self is
+          # already marked as modified, so they are simply appended.
+          field_value._values.extend(values)
+      elif action == _MERGE_REPEATED_COMPOSITE:
+        if value._values:
+          field_value = fields.get(field)
+          if field_value is None:
+            field_value = field._default_constructor(self)
+            fields[field] = field_value
+          field_value.MergeFrom(value)
+      elif value._is_present_in_parent:
+        field_value = fields.get(field)
+        if field_value is None:
+          # Nothing to merge into, so copy value without checking it again.
+          field_value = field._default_constructor(self)
+          field_value._CopyState(value)
+          fields[field] = field_value
+          if field.containing_oneof:
+            self._UpdateOneofState(field)
+        else:
           field_value.MergeFrom(value)
-      else:
-        self._fields[field] = value
-        if field.containing_oneof:
-          self._UpdateOneofState(field)
 
     if msg._unknown_fields:
       if not self._unknown_fields:
@@ -1058,6 +2159,536 @@ def _AddMergeFromMethod(cls):
   cls.MergeFrom = MergeFrom
 
 
+class _FrozenFields(dict):
+
+  """The _fields of a frozen message, see Freeze().
+
+  Writes raise, so that setters fail before changing anything.  setdefault()
+  leaves the dict alone and returns the default frozen.
+  """
+
+  __slots__ = ['hash']
+
+  def __init__(self, fields):
+    dict.__init__(self, fields)
+    # Filled in by __hash__().
+    self.hash = None
+
+  def _RaiseFrozen(self, *args, **kwargs):
+    raise AttributeError('Cannot modify a frozen message.')
+
+  __setitem__ = __delitem__ = clear = pop = popitem = update = _RaiseFrozen
+
+  def setdefault(self, key, default):
+    value = self.get(key)
+    if value is None:
+      value = default
+      _FreezeValue(value)
+    return value
+
+
+def _FreezeValue(value):
+  """Freezes a message or repeated field, and everything it holds."""
+  if isinstance(value, containers.RepeatedCompositeFieldContainer):
+    for element in value:
+      _FreezeValue(element)
+    value.__class__ = containers.FrozenRepeatedCompositeFieldContainer
+  elif isinstance(value, containers.RepeatedScalarFieldContainer):
+    value.__class__ = containers.FrozenRepeatedScalarFieldContainer
+  else:
+    if value._fields.__class__ is _SharedFields:
+      _UnshareFields(value)
+    fields = value._fields
+    if fields.__class__ is not _FrozenFields:
+      for field, field_value in fields.items():
+        if (field.label == _FieldDescriptor.LABEL_REPEATED or
+            field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE):
+          _FreezeValue(field_value)
+      value._fields = _FrozenFields(fields)
+      value._unset_listener = None
+
+
+def _AddFreezeMethod(cls):
+  """Helper for _AddMessageMethods()."""
+
+  def Freeze(self):
+    if self._fields.__class__ is not _FrozenFields:
+      # A frozen message is always clean, so that any attempt to modify it
+      # that gets past the checks of _FrozenFields fails in _Modified().
+      self.ByteSize()
+      _FreezeValue(self)
+      if not self._wire_span:
+        serialized = self.SerializePartialToString()
+        self._wire_span = (serialized, 0, len(serialized))
+    return self
+  cls.Freeze = Freeze
+
+  def __hash__(self):
+    fields = self._fields
+    if fields.__class__ is not _FrozenFields:
+      raise TypeError('unhashable object')
+    if fields.hash is None:
+      fields.hash = hash((tuple(self._ListFields()),
+                          tuple(sorted(self._unknown_fields))))
+    return fields.hash
+  cls.__hash__ = __hash__
+
+
+def _FingerprintDigest(message):
+  """Returns the MD5 digest of the contents of message, which must be clean.
+
+  The digest covers the present fields in field number order, each encoded
+  like on the wire except for sub-messages, which contribute their own digest,
+  followed by the unknown fields, sorted.  Like _present_fields, it is kept in
+  _fingerprint until _Modified() drops it, so that only the messages modified
+  since the last call are hashed again.
+  """
+  digest = message._fingerprint
+  if digest is None:
+    pieces = []
+    write = pieces.append
+    for field, value in message._ListFields():
+      if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+        tag_bytes = encoder.TagBytes(field.number,
+                                     wire_format.WIRETYPE_LENGTH_DELIMITED)
+        if field.label == _FieldDescriptor.LABEL_REPEATED:
+          for element in value:
+            write(tag_bytes)
+            write(_FingerprintDigest(element))
+        else:
+          write(tag_bytes)
+          write(_FingerprintDigest(value))
+      else:
+        field._encoder(write, value)
+    if message._unknown_fields:
+      # In the order of deterministic serialization, field number order, and
+      # in the order __eq__() compares them within the same number, so that
+      # the order they arrived in does not count.
+      unknown_fields = sorted(message._unknown_fields)
+      unknown_fields.sort(key=_UnknownFieldNumber)
+      for tag_bytes, value_bytes in unknown_fields:
+        write(tag_bytes)
+        write(value_bytes)
+    digest = message._fingerprint = hashlib.md5(b''.join(pieces)).digest()
+  return digest
+
+
+def _AddFingerprintMethod(cls):
+  """Helper for _AddMessageMethods()."""
+
+  def Fingerprint(self):
+    # ByteSize() makes every message in the tree clean, which digests need.
+    self.ByteSize()
+    return int(binascii.hexlify(_FingerprintDigest(self)), 16)
+  cls.Fingerprint = Fingerprint
+
+
+# The shared values of a _SharedFields which does not share any.  Never written
+# to.
+_NO_SHARED_VALUES = {}
+
+
+class _SharedFields(dict):
+
+  """The _fields of a message which shares values with other messages.
+
+  Copying a clean message does not copy its sub-messages and repeated fields:
+  the copy holds the same objects, listed in shared, which keep listening to
+  the message they were copied from, their source.  Nothing is written through
+  a shared value:  before a getter or a method of the copy hands one out or
+  changes it, _UnshareField() gives the copy a value of its own.
+
+  The source lists its copies in copies.  It stays clean for as long as they
+  share its values, since any change to them, or to anything they hold, makes
+  it dirty.  When it does, _ReleaseCopies() parses the bytes the source held
+  until then into a new message, which the copies share from instead.  Each
+  copy refers to its source, so that a change made through a value that was
+  read from the source before it was copied still reaches it.
+
+  A message shares the values of its source only, never values that its
+  source shares in turn:  the source unshares its own values first.
+  """
+
+  __slots__ = ['owner', 'shared', 'source', 'copies', 'copied_messages',
+               '__weakref__']
+
+  def __init__(self, message, fields):
+    dict.__init__(self, fields)
+    # Weak reference to the message.
+    self.owner = weakref.ref(message)
+    # Shared values, by field.
+    self.shared = _NO_SHARED_VALUES
+    # The message the shared values belong to, if any.
+    self.source = None
+    # The _SharedFields of the copies which share values of this message, by
+    # id(), or None.
+    self.copies = None
+    # The sub-messages of this message when it was copied, see
+    # _CarryFingerprints().
+    self.copied_messages = ()
+
+
+def _CopyValue(message, field, value):
+  """Returns a copy of value, the repeated or composite value of field in
+  another message, for field in message."""
+  field_value = field._default_constructor(message)
+  if field.label == _FieldDescriptor.LABEL_REPEATED:
+    if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      listener = field_value._message_listener
+      append = field_value._values.append
+      for element in value:
+        element_copy = element.__class__()
+        element_copy._SetListener(listener)
+        element_copy._CopyState(element)
+        append(element_copy)
+    else:
+      field_value._values.extend(value._values)
+  else:
+    field_value._CopyState(value)
+  return field_value
+
+
+def _ShareFields(message, msg, copy_plan):
+  """Makes message, which has no fields, share the values of msg, which is
+  clean.  See _SharedFields.  copy_plan maps fields to their _MERGE_* action,
+  as in MergeFrom()."""
+  source_fields = msg._fields
+  frozen = source_fields.__class__ is _FrozenFields
+  if not frozen and source_fields.__class__ is _SharedFields:
+    _UnshareFields(msg)
+  listener_ref = message._unset_listener
+  unset_listener = listener_ref and listener_ref()
+  if unset_listener is None:
+    unset_values = _NO_SHARED_VALUES
+  else:
+    unset_values = unset_listener.values
+  fields = message._fields_class()
+  shared = {}
+  for field, value in source_fields.iteritems():
+    action = copy_plan.get(field)
+    if action is None:
+      action = copy_plan.setdefault(field, _MergeAction(field))
+    if action == _MERGE_COMPOSITE:
+      if not value._is_present_in_parent:
+        continue
+    elif action >= _MERGE_REPEATED_SCALAR:
+      if not value._values:
+        continue
+    else:
+      fields[field] = value
+      continue
+    if field in unset_values:
+      # The value read while the field was unset becomes the copy, as it does
+      # in MergeFrom().
+      fields[field] = _CopyValue(message, field, value)
+    else:
+      fields[field] = shared[field] = value
+  if shared:
+    fields = _SharedFields(message, fields)
+    fields.shared = shared
+    if not frozen:
+      # A frozen message never changes, so its copies need not be released.
+      _AddCopy(msg, fields)
+  message._fields = fields
+  if msg._oneofs is not _NO_ONEOFS:
+    for field in msg._oneofs.itervalues():
+      if field in fields:
+        message._UpdateOneofState(field)
+  if msg._unknown_fields:
+    message._unknown_fields = list(msg._unknown_fields)
+
+
+def _AddCopy(message, fields):
+  """Lists fields, the _SharedFields of a copy of message, in the copies of
+  message."""
+  if not message._wire_span:
+    # _ReleaseCopies() needs the bytes of message, and keeping them is also
+    # what Freeze() does.
+    serialized = message.SerializePartialToString()
+    message._wire_span = (serialized, 0, len(serialized))
+  source_fields = message._fields
+  if source_fields.__class__ is not _SharedFields:
+    source_fields = message._fields = _SharedFields(message, source_fields)
+  copies = source_fields.copies
+  if copies is None:
+    copies = source_fields.copies = weakref.WeakValueDictionary()
+    # Kept until _ReleaseCopies(), for _CarryFingerprints().
+    source_fields.copied_messages = _SubMessages(source_fields)
+  copies[id(fields)] = fields
+  fields.source = message
+
+
+def _StopSharing(fields):
+  """Removes fields, a _SharedFields which no longer shares any value, from
+  the copies of its source."""
+  fields.shared = _NO_SHARED_VALUES
+  source = fields.source
+  if source is not None:
+    fields.source = None
+    copies = getattr(source._fields, 'copies', None)
+    if copies:
+      copies.pop(id(fields), None)
+
+
+def _UnshareField(message, field):
+  """Gives message a value of its own for field instead of the shared one,
+  and returns it."""
+  fields = message._fields
+  shared = fields.shared
+  value = fields[field] = _CopyValue(message, field, shared.pop(field))
+  message._present_fields = None
+  if not shared:
+    _StopSharing(fields)
+  return value
+
+
+def _UnshareFields(message):
+  """Gives message values of its own instead of all the shared ones."""
+  fields = message._fields
+  if fields.__class__ is not _SharedFields or not fields.shared:
+    return
+  shared = fields.shared
+  _StopSharing(fields)
+  for field, value in shared.iteritems():
+    # Shared values which were cleared since are left out.
+    if fields.get(field) is value:
+      fields[field] = _CopyValue(message, field, value)
+  message._present_fields = None
+
+
+def _ReleaseCopies(message, fields):
+  """Makes the copies listed in fields, the _SharedFields of message, share
+  the values of a new message parsed from the bytes of message instead.
+
+  Called by _Modified() before message, which is clean, is marked dirty.  Its
+  values may have changed already, but not its bytes.
+  """
+  copies = list(fields.copies.values())
+  fields.copies = None
+  copied_messages = fields.copied_messages
+  fields.copied_messages = ()
+  if not copies:
+    return
+  buffer, start, end = message._wire_span
+  original = message.__class__()
+  original._InternalParse(buffer, start, end)
+  _CarryFingerprints(copied_messages, original)
+  original_fields = original._fields
+  for copy_fields in copies:
+    shared = copy_fields.shared
+    copy_fields.shared = {}
+    for field, value in shared.iteritems():
+      if copy_fields.get(field) is value:
+        value = copy_fields[field] = original_fields[field]
+        copy_fields.shared[field] = value
+    copy = copy_fields.owner()
+    if copy is not None:
+      copy._present_fields = None
+    if copy_fields.shared:
+      _AddCopy(original, copy_fields)
+    else:
+      copy_fields.source = None
+      copy_fields.shared = _NO_SHARED_VALUES
+
+
+def _SubMessages(fields):
+  """Returns (field, messages) for each message field present in fields, the
+  _fields of a message, where messages lists the sub-message or elements."""
+  sub_messages = []
+  for field, value in fields.iteritems():
+    if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      if field.label == _FieldDescriptor.LABEL_REPEATED:
+        if value._values:
+          sub_messages.append((field, list(value._values)))
+      elif value._is_present_in_parent:
+        sub_messages.append((field, [value]))
+  return sub_messages
+
+
+def _CarryFingerprints(sub_messages, message):
+  """Gives the sub-messages of message, just parsed from the bytes of another
+  message, the fingerprints cached by the sub-messages they were parsed from.
+
+  sub_messages is what _SubMessages() returned for the other message when its
+  bytes were current.  Of those, the ones still clean have not changed since:
+  any change to them would have made them dirty, and released the copies
+  before the other message was marked dirty.  Without this, diffing a copy
+  against its changed source hashes every sub-message of the copy again.
+  """
+  parsed_fields = message._fields
+  for field, values in sub_messages:
+    parsed_value = parsed_fields.get(field)
+    if parsed_value is None:
+      continue
+    if field.label == _FieldDescriptor.LABEL_REPEATED:
+      parsed_values = parsed_value._values
+      if len(parsed_values) != len(values):
+        continue
+    else:
+      parsed_values = [parsed_value]
+    for value, parsed_value in zip(values, parsed_values):
+      if not value._cached_byte_size_dirty:
+        parsed_value._fingerprint = value._fingerprint
+
+
+def _AddCopyMethods(cls):
+  """Adds CopyFrom() and __deepcopy__() methods to cls."""
+  LABEL_REPEATED = _FieldDescriptor.LABEL_REPEATED
+  CPPTYPE_MESSAGE = _FieldDescriptor.CPPTYPE_MESSAGE
+  # Like the merge plan of MergeFrom(), for _ShareFields().
+  copy_plan = dict((field, _MergeAction(field))
+                   for field in cls.DESCRIPTOR.fields)
+
+  def CopyFields(self, msg):
+    # Fills self, which has no fields yet, with copies of the fields of msg,
+    # which is dirty.  Unlike MergeFrom(), values are not checked again and
+    # new sub-messages are not marked as modified:  CopyState() gives them the
+    # state of the message they are copied from.
+    fields = self._fields
+    for field, value in msg._fields.iteritems():
+      if field.label == LABEL_REPEATED:
+        fields[field] = _CopyValue(self, field, value)
+      elif field.cpp_type == CPPTYPE_MESSAGE:
+        if value._is_present_in_parent:
+          fields[field] = _CopyValue(self, field, value)
+      else:
+        fields[field] = value
+        if field.containing_oneof:
+          self._UpdateOneofState(field)
+    if msg._unknown_fields:
+      self._unknown_fields = list(msg._unknown_fields)
+
+  def CopyState(self, msg):
+    # Makes self, a message with no fields and nothing to notify yet, a copy
+    # of msg.  A clean msg has a valid cached size and the bytes it was parsed
+    # from, or serialized to by _AddCopy(), which hold for the copy as well;
+    # its values are shared rather than copied.  self may be a value read while
+    # unset (see _TakeUnsetValue()), which can have kept its own empty
+    # ListFields().
+    self._is_present_in_parent = True
+    self._present_fields = None
+    if msg._cached_byte_size_dirty:
+      self._cached_byte_size_dirty = True
+      CopyFields(self, msg)
+    else:
+      _ShareFields(self, msg, copy_plan)
+      self._cached_byte_size = msg._cached_byte_size
+      self._wire_span = msg._wire_span
+      self._fingerprint = msg._fingerprint
+      self._deterministic_byte_size = msg._deterministic_byte_size
+  cls._CopyState = CopyState
+
+  def CopyFrom(self, msg):
+    if self is msg:
+      return
+    if not isinstance(msg, cls):
+      raise TypeError(
+          "Parameter to CopyFrom() must be instance of same class: "
+          "expected %s got %s." % (cls.__name__, type(msg).__name__))
+    self.Clear()
+    if msg._cached_byte_size_dirty:
+      CopyFields(self, msg)
+    else:
+      _ShareFields(self, msg, copy_plan)
+  cls.CopyFrom = CopyFrom
+
+  def DeepCopy(self, memo=None):
+    if self._fields.__class__ is _FrozenFields:
+      # Can be shared, since neither side can change it.
+      return self
+    clone = cls()
+    CopyState(clone, self)
+    return clone
+  cls.__deepcopy__ = DeepCopy
+  cls._UnshareFields = _UnshareFields
+
+
+# pickle.PickleBuffer is new in Python 3.8, along with pickle protocol 5.
+_PickleBuffer = getattr(pickle, 'PickleBuffer', None)
+
+# Values of bytes fields at least this long are handed to protocol 5 pickles
+# as PickleBuffers, which the pickler may transfer out-of-band.
+_OUT_OF_BAND_MIN_SIZE = 1024
+
+
+def _BytesFromBuffer(buffer):
+  """Returns the contents of buffer (bytes, PickleBuffer, bytearray or any
+  other object supporting the buffer protocol) as bytes, without copying if
+  buffer wraps a whole bytes object."""
+  if isinstance(buffer, bytes):
+    return buffer
+  view = memoryview(buffer)
+  if isinstance(view.obj, bytes) and view.nbytes == len(view.obj):
+    return view.obj
+  return view.tobytes()
+
+
+def _UnpickleMessage(cls, serialized):
+  """Rebuilds a message pickled by __reduce_ex__() in serialized form."""
+  return cls.FromString(_BytesFromBuffer(serialized))
+
+
+def _UnpickleFields(cls, values):
+  """Rebuilds a message pickled by __reduce_ex__() as (number, value) pairs.
+
+  The values were checked when they were set on the pickled message, so they
+  are stored as they are.
+  """
+  message = cls()
+  message._Modified()
+  fields = message._fields
+  fields_by_number = cls.DESCRIPTOR.fields_by_number
+  for number, value in values:
+    field = fields_by_number[number]
+    if field.label == _FieldDescriptor.LABEL_REPEATED:
+      field_value = field._default_constructor(message)
+      field_value._values.extend(value)
+      value = field_value
+    elif field.type == _FieldDescriptor.TYPE_BYTES:
+      value = _BytesFromBuffer(value)
+    fields[field] = value
+    if field.containing_oneof:
+      message._UpdateOneofState(field)
+  return message
+
+
+def _AddPickleMethods(message_descriptor, cls):
+  """Adds a __reduce_ex__() method to cls.
+
+  Messages are pickled in serialized form.  With protocol 5 the serialized
+  bytes are wrapped in a PickleBuffer, so that a pickler given a
+  buffer_callback can pass them on without copying them into the pickle.
+
+  Messages of a type with no sub-message fields and no extensions, which are
+  typically small, are pickled as (field number, value) pairs instead, which
+  saves encoding and decoding every field.  With protocol 5, large values of
+  bytes fields are PickleBuffers as well.
+  """
+  CPPTYPE_MESSAGE = _FieldDescriptor.CPPTYPE_MESSAGE
+  LABEL_REPEATED = _FieldDescriptor.LABEL_REPEATED
+  TYPE_BYTES = _FieldDescriptor.TYPE_BYTES
+  scalar_only = not message_descriptor.is_extendable and not any(
+      field.cpp_type == CPPTYPE_MESSAGE for field in message_descriptor.fields)
+  out_of_band = _PickleBuffer is not None
+
+  def ReduceEx(self, protocol):
+    if scalar_only and not self._unknown_fields:
+      values = []
+      for field, value in self._ListFields():
+        if field.label == LABEL_REPEATED:
+          value = list(value._values)
+        elif (field.type == TYPE_BYTES and protocol >= 5 and out_of_band and
+              len(value) >= _OUT_OF_BAND_MIN_SIZE):
+          value = _PickleBuffer(value)
+        values.append((field.number, value))
+      return (_UnpickleFields, (cls, tuple(values)))
+    serialized = self.SerializePartialToString()
+    if protocol >= 5 and out_of_band:
+      serialized = _PickleBuffer(serialized)
+    return (_UnpickleMessage, (cls, serialized))
+  cls.__reduce_ex__ = ReduceEx
+
+
 def _AddWhichOneofMethod(message_descriptor, cls):
   def WhichOneof(self, oneof_name):
     """Returns the name of the currently set field inside a oneof, or None."""
@@ -1081,6 +2712,7 @@ def _AddMessageMethods(message_descriptor, cls):
   _AddListFieldsMethod(message_descriptor, cls)
   _AddHasFieldMethod(message_descriptor, cls)
   _AddClearFieldMethod(message_descriptor, cls)
+  _AddReleaseFieldMethod(message_descriptor, cls)
   if message_descriptor.is_extendable:
     _AddClearExtensionMethod(cls)
     _AddHasExtensionMethod(cls)
@@ -1094,7 +2726,11 @@ def _AddMessageMethods(message_descriptor, cls):
   _AddSerializePartialToStringMethod(message_descriptor, cls)
   _AddMergeFromStringMethod(message_descriptor, cls)
   _AddIsInitializedMethod(message_descriptor, cls)
-  _AddMergeFromMethod(cls)
+  _AddMergeFromMethod(message_descriptor, cls)
+  _AddCopyMethods(cls)
+  _AddFreezeMethod(cls)
+  _AddFingerprintMethod(cls)
+  _AddPickleMethods(message_descriptor, cls)
   _AddWhichOneofMethod(message_descriptor, cls)
 
 def _AddPrivateHelperMethods(message_descriptor, cls):
@@ -1110,9 +2746,22 @@ def _AddPrivateHelperMethods(message_descriptor, cls):
     #   changed such that it does stuff even when _cached_byte_size_dirty is
     #   already true, the callers need to be updated.
     if not self._cached_byte_size_dirty:
+      fields = self._fields
+      if fields.__class__ is _SharedFields:
+        if fields.copies is not None:
+          _ReleaseCopies(self, fields)
+      elif fields.__class__ is _FrozenFields:
+        raise AttributeError('Cannot modify a frozen message.')
       self._cached_byte_size_dirty = True
-      self._listener_for_children.dirty = True
+      listener_for_children = self._listener_for_children
+      if listener_for_children is not None:
+        listener_for_children.dirty = True
       self._is_present_in_parent = True
+      self._wire_span = None
+      self._utf8_cache = None
+      self._present_fields = None
+      self._fingerprint = None
+      self._deterministic_byte_size = None
       self._listener.Modified()
 
   def _UpdateOneofState(self, field):
@@ -1121,12 +2770,51 @@ def _AddPrivateHelperMethods(message_descriptor, cls):
     Will also delete currently active field in the oneof, if it is different
     from the argument. Does not mark the message as modified.
     """
+    if self._oneofs is _NO_ONEOFS:
+      self._oneofs = {}
     other_field = self._oneofs.setdefault(field.containing_oneof, field)
     if other_field is not field:
-      del self._fields[other_field]
+      fields = self._fields
+      value = fields[other_field]
+      del fields[other_field]
+      _DetachValue(fields, other_field, value)
       self._oneofs[field.containing_oneof] = field
 
+  def ListenerForChildren(self):
+    """Returns the listener given to sub-messages and repeated fields.
+
+    Most messages never get a child, so it is only created on first use.
+    """
+    listener = self._listener_for_children
+    if listener is None:
+      listener = _Listener(self)
+      listener.dirty = self._cached_byte_size_dirty
+      self._listener_for_children = listener
+    return listener
+
+  def ReachedBy(self, listener):
+    """Returns whether the changes reported to listener reach this message,
+    that is whether listener belongs to it or to one of its sub-messages."""
+    fields = self._fields
+    while True:
+      if isinstance(listener, _Listener):
+        parent = listener._parent_message_weakref
+      elif listener.__class__ is _UnsetFieldsListener:
+        parent = listener._parent_message
+      else:
+        return False
+      try:
+        # parent may be a weak proxy, which is not the message itself, but
+        # whose _fields are.
+        if parent._fields is fields:
+          return True
+        listener = parent._listener
+      except ReferenceError:
+        return False
+
   cls._Modified = Modified
+  cls._ListenerForChildren = ListenerForChildren
+  cls._ReachedBy = ReachedBy
   cls.SetInParent = Modified
   cls._UpdateOneofState = _UpdateOneofState
 
@@ -1145,6 +2833,8 @@ class _Listener(object):
   This helper class is at the heart of this support.
   """
 
+  __slots__ = ['_parent_message_weakref', 'dirty']
+
   def __init__(self, parent_message):
     """Args:
       parent_message: The message whose _Modified() method we should call when
@@ -1177,9 +2867,68 @@ class _Listener(object):
       pass
 
 
+class _UnsetFieldsListener(object):
+
+  """Listener of the values that getters return for fields of a message which
+  are not set, see _GetUnsetValue().
+
+  The first change to one of the values, or to anything it holds, moves it to
+  the _fields of the message, and hands it the listener that new values get.
+  Until then the values refer to the message strongly, through this listener,
+  so that a value read through other unset values, as in foo.bar.baz, keeps
+  them alive.  The message only refers to the listener weakly, which drops it
+  along with the last value in use.
+  """
+
+  __slots__ = ['_parent_message', 'values', '__weakref__']
+
+  # Values call Modified() whenever they change while the parent is clean, and
+  # this listener needs to be called whenever one of them becomes set.
+  dirty = False
+
+  def __init__(self, parent_message):
+    self._parent_message = parent_message
+    # Weak references to the values, by field.
+    self.values = {}
+
+  def Release(self, value, listener):
+    """Hands value, which was taken out of values, over to listener."""
+    if isinstance(value, containers.BaseContainer):
+      value._message_listener = listener
+      if isinstance(value, containers.RepeatedCompositeFieldContainer):
+        # Added before the container was set.
+        for element in value._values:
+          if element._listener is self:
+            element._listener = listener
+    else:
+      value._listener = listener
+
+  def Modified(self):
+    parent = self._parent_message
+    values = self.values
+    if values:
+      if parent._unset_listener is None or parent._unset_listener() is not self:
+        # The parent was cleared since, which leaves the values out.
+        values.clear()
+      for field, value_ref in values.items():
+        value = value_ref()
+        if value is None:
+          del values[field]
+        elif (value._values if field.label == _FieldDescriptor.LABEL_REPEATED
+              else value._is_present_in_parent):
+          del values[field]
+          self.Release(value, _ListenerForField(parent, field))
+          parent._fields.setdefault(field, value)
+          if field.containing_oneof is not None:
+            parent._UpdateOneofState(field)
+    parent._Modified()
+
+
 class _OneofListener(_Listener):
   """Special listener implementation for setting composite oneof fields."""
 
+  __slots__ = ['_field']
+
   def __init__(self, parent_message, field):
     """Args:
       parent_message: The message whose _Modified() method we should call when
@@ -1200,17 +2949,18 @@ class _OneofListener(_Listener):
 
 # TODO(robinson): Move elsewhere?  This file is getting pretty ridiculous...
 # TODO(robinson): Unify error handling of "unknown extension" crap.
-# TODO(robinson): Support iteritems()-style iteration over all
-# extensions with the "has" bits turned on?
 class _ExtensionDict(object):
 
   """Dict-like container for supporting an indexable "Extensions"
   field on proto instances.
 
   Note that in all cases we expect extension handles to be
-  FieldDescriptors.
+  FieldDescriptors.  Iterating over the dict gives the handles of the
+  extensions which are set, in no particular order.
   """
 
+  __slots__ = ['_extended_message']
+
   def __init__(self, extended_message):
     """extended_message: Message instance for which we are the Extensions dict.
     """
@@ -1222,40 +2972,28 @@ class _ExtensionDict(object):
 
     _VerifyExtensionHandle(self._extended_message, extension_handle)
 
-    result = self._extended_message._fields.get(extension_handle)
+    fields = self._extended_message._fields
+    result = fields.get(extension_handle)
     if result is not None:
+      if (fields.__class__ is _SharedFields and
+          fields.shared.get(extension_handle) is result):
+        result = _UnshareField(self._extended_message, extension_handle)
       return result
 
-    if extension_handle.label == _FieldDescriptor.LABEL_REPEATED:
-      result = extension_handle._default_constructor(self._extended_message)
-    elif extension_handle.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
-      result = extension_handle.message_type._concrete_class()
-      try:
-        result._SetListener(self._extended_message._listener_for_children)
-      except ReferenceError:
-        pass
-    else:
-      # Singular scalar -- just return the default without inserting into the
-      # dict.
-      return extension_handle.default_value
-
-    # Atomically check if another thread has preempted us and, if not, swap
-    # in the new object we just created.  If someone has preempted us, we
-    # take that object and discard ours.
-    # WARNING:  We are relying on setdefault() being atomic.  This is true
-    #   in CPython but we haven't investigated others.  This warning appears
-    #   in several other locations in this file.
-    result = self._extended_message._fields.setdefault(
-        extension_handle, result)
+    if (extension_handle.label == _FieldDescriptor.LABEL_REPEATED or
+        extension_handle.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE):
+      return _GetUnsetValue(self._extended_message, extension_handle)
 
-    return result
+    # Singular scalar -- just return the default without inserting into the
+    # dict.
+    return extension_handle.default_value
 
   def __eq__(self, other):
     if not isinstance(other, self.__class__):
       return False
 
-    my_fields = self._extended_message.ListFields()
-    other_fields = other._extended_message.ListFields()
+    my_fields = self._extended_message._ListFields()
+    other_fields = other._extended_message._ListFields()
 
     # Get rid of non-extension fields.
     my_fields    = [ field for field in my_fields    if field.is_extension ]
@@ -1280,20 +3018,46 @@ class _ExtensionDict(object):
 
     _VerifyExtensionHandle(self._extended_message, extension_handle)
 
-    if (extension_handle.label == _FieldDescriptor.LABEL_REPEATED or
-        extension_handle.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE):
+    # pylint: disable=protected-access
+    check_value = self._extended_message._extension_checkers[extension_handle]
+    if check_value is None:
       raise TypeError(
           'Cannot assign to extension "%s" because it is a repeated or '
           'composite type.' % extension_handle.full_name)
 
-    # It's slightly wasteful to lookup the type checker each time,
-    # but we expect this to be a vanishingly uncommon case anyway.
-    type_checker = type_checkers.GetTypeChecker(extension_handle)
-    # pylint: disable=protected-access
-    self._extended_message._fields[extension_handle] = (
-        type_checker.CheckValue(value))
+    self._extended_message._fields[extension_handle] = check_value(value)
     self._extended_message._Modified()
 
+  def __contains__(self, extension_handle):
+    """Returns true if the given extension is set."""
+    _VerifyExtensionHandle(self._extended_message, extension_handle)
+    value = self._extended_message._fields.get(extension_handle)
+    return value is not None and _IsPresent((extension_handle, value))
+
+  def __iter__(self):
+    for item in self._extended_message._fields.items():
+      if item[0].is_extension and _IsPresent(item):
+        yield item[0]
+
+  def __len__(self):
+    return sum(1 for _ in self)
+
+  def iteritems(self):
+    """Yields (extension handle, value) for each extension which is set, in no
+    particular order."""
+    _UnshareFields(self._extended_message)
+    fields = self._extended_message._fields
+    for extension_handle in self:
+      yield extension_handle, fields[extension_handle]
+
+  def items(self):
+    """Returns a list of (extension handle, value) for each extension which is
+    set, in no particular order."""
+    _UnshareFields(self._extended_message)
+    fields = self._extended_message._fields
+    return [(extension_handle, fields[extension_handle])
+            for extension_handle in self]
+
   def _FindExtensionByName(self, name):
     """Tries to find a known extension with the specified name.
 
@@ -35,6 +35,7 @@
 pure-Python protocol compiler.
 """
 
+import array
 import copy
 import gc
 import operator
@@ -55,6 +56,7 @@ from google.protobuf.internal import more_messages_pb2
 from google.protobuf.internal import wire_format
 from google.protobuf.internal import test_util
 from google.protobuf.internal import decoder
+from google.protobuf.internal import encoder
 
 
 class _MiniDecoder(object):
@@ -406,6 +408,34 @@ class ReflectionTest(unittest.TestCase):
     del proto
     gc.collect()
 
+  def testNestedMessageOfCleanParent(self):
+    # Children only get attached after the parent was sized or parsed, which
+    # leaves the parent clean; modifying them must still reach the parent.
+    proto = unittest_pb2.NestedTestAllTypes()
+    self.assertEqual(0, proto.ByteSize())
+    proto.child.payload.optional_int32 = 1
+    self.assertTrue(proto.HasField('child'))
+    self.assertTrue(proto.child.HasField('payload'))
+    self.assertEqual(6, proto.ByteSize())
+
+    parsed = unittest_pb2.NestedTestAllTypes.FromString(
+        proto.SerializeToString())
+    parsed.child.child.payload.repeated_int32.append(2)
+    self.assertTrue(parsed.child.HasField('child'))
+    self.assertEqual(parsed.ByteSize(), len(parsed.SerializeToString()))
+    self.assertEqual(
+        parsed,
+        unittest_pb2.NestedTestAllTypes.FromString(parsed.SerializeToString()))
+
+  def testNestedMessageOutlivesParent(self):
+    proto = unittest_pb2.NestedTestAllTypes()
+    child = proto.child
+    del proto
+    gc.collect()
+    # The parent is gone, so there is nothing left to notify.
+    child.payload.optional_int32 = 1
+    self.assertTrue(child.HasField('payload'))
+
   def testHasBitsWhenModifyingRepeatedFields(self):
     # Test nesting when we add an element to a repeated field in a submessage.
     proto = unittest_pb2.TestNestedMessageHasBits()
@@ -517,6 +547,95 @@ class ReflectionTest(unittest.TestCase):
         (proto.DESCRIPTOR.fields_by_name['my_float' ], 1.0) ],
       proto.ListFields())
 
+  def testListFieldsAfterSerialization(self):
+    proto = unittest_pb2.TestAllTypes()
+    proto.optional_int32 = 1
+    proto.SerializeToString()
+    fields = proto.ListFields()
+    del fields[:]
+    self.assertEqual(1, len(proto.ListFields()))
+
+    # Each kind of change made to a clean message shows up in ListFields().
+    proto.optional_nested_message.bb = 2
+    self.assertEqual(2, len(proto.ListFields()))
+    proto.SerializeToString()
+    proto.repeated_int32.append(3)
+    self.assertEqual(3, len(proto.ListFields()))
+    proto.SerializeToString()
+    proto.ClearField('optional_int32')
+    self.assertEqual(2, len(proto.ListFields()))
+    proto.SerializeToString()
+    proto.MergeFrom(unittest_pb2.TestAllTypes(optional_int64=4))
+    self.assertEqual(3, len(proto.ListFields()))
+    proto.SerializeToString()
+    proto.Clear()
+    self.assertEqual([], proto.ListFields())
+
+    proto = unittest_pb2.TestAllTypes.FromString(b'\x08\x01')
+    self.assertEqual(1, len(proto.ListFields()))
+    proto.MergeFromString(b'\x10\x02')
+    self.assertEqual(2, len(proto.ListFields()))
+
+  def testReadingUnsetFields(self):
+    proto = unittest_pb2.TestAllTypes()
+    self.assertEqual(0, proto.optional_nested_message.bb)
+    self.assertEqual(0, len(proto.repeated_int32))
+    self.assertEqual(0, len(proto.repeated_nested_message))
+    self.assertEqual(0, proto.optional_foreign_message.c)
+    nested = proto.optional_nested_message
+    self.assertTrue(nested is proto.optional_nested_message)
+    if api_implementation.Type() == 'python':
+      # Reads leave the message as it is.
+      self.assertEqual(0, len(proto._fields))
+
+    # A value read while the field was unset becomes the field when changed,
+    # even through other unset values.
+    nested.bb = 1
+    self.assertTrue(nested is proto.optional_nested_message)
+    recursive = unittest_pb2.TestRecursiveMessage()
+    innermost = recursive.a.a.a
+    innermost.i = 2
+    self.assertEqual(2, recursive.a.a.a.i)
+    self.assertTrue(recursive.HasField('a'))
+    repeated = proto.repeated_nested_message
+    proto.SerializeToString()
+    repeated.add().bb = 3
+    proto.repeated_int32.append(4)
+    self.assertEqual(
+        unittest_pb2.TestAllTypes(
+            optional_nested_message=unittest_pb2.TestAllTypes.NestedMessage(
+                bb=1),
+            repeated_nested_message=[
+                unittest_pb2.TestAllTypes.NestedMessage(bb=3)],
+            repeated_int32=[4]),
+        unittest_pb2.TestAllTypes.FromString(proto.SerializeToString()))
+
+    # Parsing and merging fill in values that were read before.
+    proto = unittest_pb2.TestAllTypes()
+    foreign = proto.optional_foreign_message
+    proto.MergeFromString(unittest_pb2.TestAllTypes(
+        optional_foreign_message=unittest_pb2.ForeignMessage(
+            c=5)).SerializeToString())
+    self.assertEqual(5, foreign.c)
+    self.assertTrue(foreign is proto.optional_foreign_message)
+
+    # Values read from oneof fields become the field set in the oneof.
+    proto.oneof_uint32 = 6
+    oneof_nested = proto.oneof_nested_message
+    self.assertEqual('oneof_uint32', proto.WhichOneof('oneof_field'))
+    oneof_nested.bb = 7
+    self.assertEqual('oneof_nested_message', proto.WhichOneof('oneof_field'))
+
+    # Values read before the field was cleared are left out.
+    repeated = proto.repeated_int32
+    proto.ClearField('repeated_int32')
+    repeated.append(8)
+    self.assertEqual([], proto.repeated_int32)
+    nested = proto.optional_nested_message
+    proto.Clear()
+    nested.bb = 9
+    self.assertFalse(proto.HasField('optional_nested_message'))
+
   def testDefaultValues(self):
     proto = unittest_pb2.TestAllTypes()
     self.assertEqual(0, proto.optional_int32)
@@ -986,6 +1105,156 @@ class ReflectionTest(unittest.TestCase):
     self.assertEqual(1, len(proto.repeated_nested_message))
     self.assertEqual(m1, proto.repeated_nested_message[0])
 
+  @unittest.skipIf(api_implementation.Type() != 'python',
+                   'Ownership transfer is only in pure Python.')
+  def testRepeatedCompositeAddAllocated(self):
+    proto = unittest_pb2.TestAllTypes()
+    proto.SerializeToString()
+    m0 = unittest_pb2.TestAllTypes.NestedMessage(bb=1)
+    proto.repeated_nested_message.AddAllocated(m0)
+    self.assertTrue(proto.repeated_nested_message[0] is m0)
+    self.assertEqual(
+        unittest_pb2.TestAllTypes(repeated_nested_message=[
+            unittest_pb2.TestAllTypes.NestedMessage(bb=1)]),
+        proto)
+    # The message was not copied, so changing it changes proto.
+    serialized = proto.SerializeToString()
+    m0.bb = 2
+    self.assertNotEqual(serialized, proto.SerializeToString())
+
+    m1 = unittest_pb2.TestAllTypes.NestedMessage(bb=3)
+    m2 = unittest_pb2.TestAllTypes.NestedMessage(bb=4)
+    proto.repeated_nested_message.ExtendAllocated([m1, m2])
+    self.assertListsEqual([m0, m1, m2], proto.repeated_nested_message)
+    self.assertTrue(proto.repeated_nested_message[2] is m2)
+
+    # Only messages that belong to no other message can be added.
+    self.assertRaises(ValueError,
+                      proto.repeated_nested_message.AddAllocated, m0)
+    m3 = unittest_pb2.TestAllTypes.NestedMessage(bb=5)
+    self.assertRaises(ValueError,
+                      proto.repeated_nested_message.ExtendAllocated, [m3, m3])
+    self.assertRaises(ValueError,
+                      proto.repeated_nested_message.ExtendAllocated, [m3, m0])
+    self.assertRaises(TypeError, proto.repeated_nested_message.AddAllocated,
+                      unittest_pb2.ForeignMessage())
+    self.assertEqual(3, len(proto.repeated_nested_message))
+    proto.repeated_nested_message.AddAllocated(m3)
+
+    # Popped messages can be moved to another container.
+    other = unittest_pb2.TestAllTypes()
+    other.repeated_nested_message.AddAllocated(
+        proto.repeated_nested_message.pop(0))
+    self.assertTrue(other.repeated_nested_message[0] is m0)
+    self.assertEqual([3, 4, 5], [m.bb for m in proto.repeated_nested_message])
+
+    # Adding to a repeated field that was not set yet sets it.
+    proto = unittest_pb2.TestAllTypes()
+    proto.SerializeToString()
+    nested = proto.repeated_nested_message
+    nested.AddAllocated(other.repeated_nested_message.pop())
+    self.assertTrue(proto.repeated_nested_message is nested)
+    self.assertEqual(
+        unittest_pb2.TestAllTypes(repeated_nested_message=[
+            unittest_pb2.TestAllTypes.NestedMessage(bb=2)]),
+        unittest_pb2.TestAllTypes.FromString(proto.SerializeToString()))
+
+  @unittest.skipIf(api_implementation.Type() != 'python',
+                   'Ownership transfer is only in pure Python.')
+  def testRepeatedCompositeSwapElements(self):
+    proto = unittest_pb2.TestAllTypes()
+    m0 = proto.repeated_nested_message.add(bb=1)
+    m1 = proto.repeated_nested_message.add(bb=2)
+    m2 = proto.repeated_nested_message.add(bb=3)
+    serialized = proto.SerializeToString()
+    proto.repeated_nested_message.SwapElements(0, -1)
+    self.assertListsEqual([m2, m1, m0], proto.repeated_nested_message)
+    self.assertTrue(proto.repeated_nested_message[0] is m2)
+    self.assertNotEqual(serialized, proto.SerializeToString())
+    self.assertRaises(IndexError,
+                      proto.repeated_nested_message.SwapElements, 0, 3)
+
+  @unittest.skipIf(api_implementation.Type() != 'python',
+                   'Ownership transfer is only in pure Python.')
+  def testRemovedMessagesCanBeAddedElsewhere(self):
+    proto = unittest_pb2.TestAllTypes()
+    m0, m1, m2, m3, m4 = [proto.repeated_nested_message.add(bb=i)
+                          for i in range(5)]
+    proto.optional_nested_message.bb = 5
+    m5 = proto.optional_nested_message
+    proto.oneof_nested_message.bb = 6
+    m6 = proto.oneof_nested_message
+    del proto.repeated_nested_message[0]
+    proto.repeated_nested_message.remove(m1)
+    del proto.repeated_nested_message[1:]
+    proto.ClearField('optional_nested_message')
+    # Setting another field of the oneof clears oneof_nested_message.
+    proto.oneof_uint32 = 7
+    self.assertListsEqual([m2], proto.repeated_nested_message)
+    serialized = proto.SerializeToString()
+
+    other = unittest_pb2.TestAllTypes()
+    other.repeated_nested_message.ExtendAllocated([m0, m1, m3, m4, m5, m6])
+    self.assertEqual([0, 1, 3, 4, 5, 6],
+                     [m.bb for m in other.repeated_nested_message])
+    self.assertEqual(serialized, proto.SerializeToString())
+
+    proto.ClearField('repeated_nested_message')
+    other.repeated_nested_message.AddAllocated(m2)
+    proto.optional_nested_message.bb = 8
+    m8 = proto.optional_nested_message
+    proto.Clear()
+    other.repeated_nested_message.AddAllocated(m8)
+    self.assertEqual(8, len(other.repeated_nested_message))
+
+  @unittest.skipIf(api_implementation.Type() != 'python',
+                   'Ownership transfer is only in pure Python.')
+  def testAddAllocatedRejectsCycles(self):
+    proto = descriptor_pb2.DescriptorProto()
+    child = proto.nested_type.add()
+    self.assertRaises(ValueError, proto.nested_type.AddAllocated, proto)
+    self.assertRaises(ValueError, child.nested_type.AddAllocated, proto)
+    self.assertRaises(ValueError,
+                      child.nested_type.add().nested_type.ExtendAllocated,
+                      [descriptor_pb2.DescriptorProto(), proto])
+    self.assertEqual(1, len(proto.nested_type))
+    self.assertEqual(1, len(child.nested_type))
+    self.assertEqual(0, len(child.nested_type[0].nested_type))
+    # Nor through fields which are not set yet.
+    proto = descriptor_pb2.DescriptorProto()
+    self.assertRaises(ValueError, proto.nested_type.AddAllocated, proto)
+    self.assertFalse(proto.nested_type)
+
+  @unittest.skipIf(api_implementation.Type() != 'python',
+                   'Ownership transfer is only in pure Python.')
+  def testReleaseField(self):
+    proto = unittest_pb2.TestAllTypes()
+    self.assertTrue(proto.ReleaseField('optional_nested_message') is None)
+    proto.optional_nested_message.bb = 1
+    nested = proto.optional_nested_message
+    proto.SerializeToString()
+    self.assertTrue(proto.ReleaseField('optional_nested_message') is nested)
+    self.assertFalse(proto.HasField('optional_nested_message'))
+    self.assertEqual(b'', proto.SerializeToString())
+    self.assertTrue(proto.ReleaseField('optional_nested_message') is None)
+    # The released message no longer changes proto.
+    nested.bb = 2
+    self.assertFalse(proto.HasField('optional_nested_message'))
+    self.assertEqual(2, nested.bb)
+    proto.repeated_nested_message.AddAllocated(nested)
+    self.assertTrue(proto.repeated_nested_message[0] is nested)
+
+    proto = unittest_pb2.TestAllTypes()
+    proto.oneof_nested_message.bb = 3
+    nested = proto.ReleaseField('oneof_nested_message')
+    self.assertEqual(3, nested.bb)
+    self.assertEqual(None, proto.WhichOneof('oneof_field'))
+
+    self.assertRaises(ValueError, proto.ReleaseField, 'optional_int32')
+    self.assertRaises(ValueError, proto.ReleaseField,
+                      'repeated_nested_message')
+    self.assertRaises(ValueError, proto.ReleaseField, 'nonexistent_field')
+
   def testHandWrittenReflection(self):
     # Hand written extensions are only supported by the pure-Python
     # implementation of the API.
@@ -1078,6 +1347,71 @@ class ReflectionTest(unittest.TestCase):
     self.assertEqual(prius.price, new_prius.price)
     self.assertEqual(prius.owners, new_prius.owners)
 
+  def _MakeGarageClass(self):
+    desc_proto = descriptor_pb2.DescriptorProto()
+    desc_proto.name = 'Garage'
+    nested_proto = desc_proto.nested_type.add()
+    nested_proto.name = 'Car'
+    field = nested_proto.field.add()
+    field.name, field.number = 'year', 1
+    field.type = descriptor_pb2.FieldDescriptorProto.TYPE_INT64
+    field.label = descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+    field = desc_proto.field.add()
+    field.name, field.number = 'cars', 2
+    field.type = descriptor_pb2.FieldDescriptorProto.TYPE_MESSAGE
+    field.type_name = 'Car'
+    field.label = descriptor_pb2.FieldDescriptorProto.LABEL_REPEATED
+    return reflection.MakeClass(descriptor.MakeDescriptor(desc_proto))
+
+  def testLazyClassInit(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Only the pure Python implementation completes message '
+                    'classes lazily.')
+    from google.protobuf.internal import python_message
+
+    garage_class = self._MakeGarageClass()
+    car_class = garage_class.Car
+
+    # Constants are there from the start; the rest waits for an instance.
+    self.assertFalse(python_message.IsInitMessageComplete(garage_class))
+    self.assertFalse(python_message.IsInitMessageComplete(car_class))
+    self.assertEqual(2, garage_class.CARS_FIELD_NUMBER)
+    self.assertEqual(1, car_class.YEAR_FIELD_NUMBER)
+
+    garage = garage_class.FromString(b'\x12\x02\x08\x07')
+    self.assertTrue(python_message.IsInitMessageComplete(garage_class))
+    self.assertTrue(python_message.IsInitMessageComplete(car_class))
+    self.assertEqual(7, garage.cars[0].year)
+    self.assertEqual(b'\x12\x02\x08\x07', garage.SerializeToString())
+    self.assertEqual(garage, garage_class(cars=[car_class(year=7)]))
+
+  def testLazyClassInitOnClassAttribute(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Only the pure Python implementation completes message '
+                    'classes lazily.')
+    from google.protobuf.internal import python_message
+
+    garage_class = self._MakeGarageClass()
+    car_class = garage_class.Car
+    # A field property completes the class.
+    self.assertTrue(isinstance(car_class.year, property))
+    self.assertTrue(python_message.IsInitMessageComplete(car_class))
+    self.assertFalse(python_message.IsInitMessageComplete(garage_class))
+
+    # So does a method, which is not the abstract one of message.Message.
+    merge_from_string = garage_class.MergeFromString
+    self.assertTrue(python_message.IsInitMessageComplete(garage_class))
+    garage = garage_class()
+    merge_from_string(garage, b'\x12\x02\x08\x07')
+    self.assertEqual(7, garage.cars[0].year)
+    # Methods which only message.Message implements are still found.
+    self.assertTrue(garage_class.ParseFromString is not None)
+    self.assertRaises(AttributeError, getattr, garage_class, 'no_such_field')
+
+    garage_class = self._MakeGarageClass()
+    garage = garage_class.FromString(b'\x12\x02\x08\x07')
+    self.assertEqual(7, garage.cars[0].year)
+
   def testTopLevelExtensionsForOptionalScalar(self):
     extendee_proto = unittest_pb2.TestAllExtensions()
     extension = unittest_pb2.optional_int32_extension
@@ -1269,6 +1603,40 @@ class ReflectionTest(unittest.TestCase):
     self.assertRaises(KeyError, extendee_proto.HasExtension,
                       unittest_pb2.repeated_string_extension)
 
+  @unittest.skipIf(api_implementation.Type() != 'python',
+                   'Iteration over extensions is only in pure Python.')
+  def testIterateExtensions(self):
+    extendee_proto = unittest_pb2.TestAllExtensions()
+    extensions = extendee_proto.Extensions
+    self.assertTrue(extensions is extendee_proto.Extensions)
+    self.assertEqual(0, len(extensions))
+    self.assertEqual([], list(extensions))
+
+    extensions[unittest_pb2.optional_int32_extension] = 1
+    extensions[unittest_pb2.repeated_string_extension].append('a')
+    # Reading these does not set them.
+    extensions[unittest_pb2.repeated_int32_extension]
+    extensions[unittest_pb2.optional_nested_message_extension]
+    self.assertEqual(2, len(extensions))
+    self.assertEqual(
+        set([(unittest_pb2.optional_int32_extension, 1),
+             (unittest_pb2.repeated_string_extension, ('a',))]),
+        set((handle, value if isinstance(value, int) else tuple(value))
+            for handle, value in extensions.items()))
+    self.assertEqual(set([unittest_pb2.optional_int32_extension,
+                          unittest_pb2.repeated_string_extension]),
+                     set(extensions))
+    self.assertTrue(unittest_pb2.optional_int32_extension in extensions)
+    self.assertFalse(unittest_pb2.repeated_int32_extension in extensions)
+    self.assertFalse(
+        unittest_pb2.optional_nested_message_extension in extensions)
+    self.assertRaises(KeyError, extensions.__contains__,
+                      more_extensions_pb2.optional_int_extension)
+
+    extendee_proto.ClearExtension(unittest_pb2.optional_int32_extension)
+    self.assertEqual([unittest_pb2.repeated_string_extension],
+                     list(extensions))
+
   def testStaticParseFrom(self):
     proto1 = unittest_pb2.TestAllTypes()
     test_util.SetAllFields(proto1)
@@ -1336,6 +1704,11 @@ class ReflectionTest(unittest.TestCase):
     self.assertEqual(123, proto3.repeated_nested_message[1].bb)
     self.assertEqual(321, proto3.repeated_nested_message[2].bb)
 
+    proto3.repeated_foreign_message.add(c=1)
+    self.assertRaises(TypeError, proto3.repeated_nested_message.MergeFrom,
+                      proto3.repeated_foreign_message)
+    self.assertEqual(3, len(proto3.repeated_nested_message))
+
   def testMergeFromAllFields(self):
     # With all fields set.
     proto1 = unittest_pb2.TestAllTypes()
@@ -1413,6 +1786,45 @@ class ReflectionTest(unittest.TestCase):
     message2.MergeFrom(message1)
     self.assertFalse(message2.HasField('optional_nested_message'))
 
+  def testMergeFromCopiesSubMessages(self):
+    proto1 = unittest_pb2.TestAllTypes()
+    proto1.optional_nested_message.bb = 1
+    proto1.repeated_nested_message.add().bb = 2
+    proto1.oneof_nested_message.bb = 3
+    proto1.ByteSize()
+
+    proto2 = unittest_pb2.TestAllTypes(oneof_uint32=4)
+    proto2.MergeFrom(proto1)
+    self.assertEqual(proto1, proto2)
+    self.assertEqual('oneof_nested_message', proto2.WhichOneof('oneof_field'))
+
+    # The merged sub-messages are copies, which report their own changes.
+    proto1.optional_nested_message.bb = 5
+    proto1.repeated_nested_message[0].bb = 6
+    self.assertEqual(1, proto2.optional_nested_message.bb)
+    self.assertEqual(2, proto2.repeated_nested_message[0].bb)
+    serialized = proto2.SerializeToString()
+    proto2.optional_nested_message.bb = 7
+    proto2.repeated_nested_message[0].bb = 8
+    proto2.oneof_nested_message.bb = 9
+    self.assertNotEqual(serialized, proto2.SerializeToString())
+    self.assertEqual(proto2, unittest_pb2.TestAllTypes.FromString(
+        proto2.SerializeToString()))
+
+  def testMergeFromIntoSubMessageReadWhileUnset(self):
+    proto1 = unittest_pb2.TestAllTypes()
+    proto1.optional_nested_message.bb = 1
+    proto1.ByteSize()
+
+    proto2 = unittest_pb2.TestAllTypes()
+    nested = proto2.optional_nested_message
+    self.assertEqual([], nested.ListFields())
+    proto2.MergeFrom(proto1)
+    self.assertTrue(nested is proto2.optional_nested_message)
+    self.assertEqual(proto1.optional_nested_message.ListFields(),
+                     nested.ListFields())
+    self.assertEqual(proto1.SerializeToString(), proto2.SerializeToString())
+
   def testCopyFromSingularField(self):
     # Test copy with just a singular field.
     proto1 = unittest_pb2.TestAllTypes()
@@ -1466,10 +1878,6 @@ class ReflectionTest(unittest.TestCase):
     self.assertEqual('important-text', proto1.optional_string)
 
   def testCopyFromBadType(self):
-    # The python implementation doesn't raise an exception in this
-    # case. In theory it should.
-    if api_implementation.Type() == 'python':
-      return
     proto1 = unittest_pb2.TestAllTypes()
     proto2 = unittest_pb2.TestAllExtensions()
     self.assertRaises(TypeError, proto1.CopyFrom, proto2)
@@ -1487,6 +1895,44 @@ class ReflectionTest(unittest.TestCase):
 
     # TODO(anuraag): Implement deepcopy for repeated composite / extension dict
 
+  def testCopiesAreIndependent(self):
+    proto1 = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(proto1)
+    # Read, but not set.
+    proto1.ClearField('optional_import_message')
+    self.assertEqual(0, proto1.optional_import_message.d)
+    proto2 = unittest_pb2.TestAllTypes()
+    proto2.CopyFrom(proto1)
+    for copied in (copy.deepcopy(proto1), proto2):
+      self.assertEqual(proto1, copied)
+      self.assertFalse(copied.HasField('optional_import_message'))
+      self.assertEqual(proto1.ByteSize(), copied.ByteSize())
+      copied.optional_nested_message.bb = 100
+      copied.repeated_nested_message[0].bb = 101
+      copied.repeated_int32.append(102)
+      copied.optionalgroup.a = 103
+      self.assertEqual(copied.ByteSize(), len(copied.SerializeToString()))
+      self.assertNotEqual(100, proto1.optional_nested_message.bb)
+      self.assertNotEqual(101, proto1.repeated_nested_message[0].bb)
+      self.assertNotEqual(102, proto1.repeated_int32[-1])
+      self.assertNotEqual(103, proto1.optionalgroup.a)
+
+  def testCopyOfParsedMessage(self):
+    proto = unittest_pb2.NestedTestAllTypes()
+    proto.child.payload.optional_int32 = 1
+    proto.child.child.payload.repeated_string.append(u'a')
+    data = proto.SerializeToString()
+    parsed = unittest_pb2.NestedTestAllTypes.FromString(data)
+    copied = copy.deepcopy(parsed)
+    self.assertEqual(data, copied.SerializeToString())
+    copied.child.child.payload.repeated_string.append(u'b')
+    self.assertEqual(data, parsed.SerializeToString())
+    self.assertEqual(copied.ByteSize(), len(copied.SerializeToString()))
+    self.assertEqual([u'a', u'b'],
+                     unittest_pb2.NestedTestAllTypes.FromString(
+                         copied.SerializeToString()).child.child.payload
+                     .repeated_string)
+
   def testClear(self):
     proto = unittest_pb2.TestAllTypes()
     # C++ implementation does not support lazy fields right now so leave it
@@ -2251,6 +2697,479 @@ class ByteSizeTest(unittest.TestCase):
 #   * Handling of empty submessages (with and without "has"
 #     bits set).
 
+class FreezeTest(unittest.TestCase):
+
+  def setUp(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Freeze() is only implemented in the pure Python '
+                    'implementation.')
+    self.proto = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(self.proto)
+    self.serialized = self.proto.SerializeToString()
+    self.assertIs(self.proto, self.proto.Freeze())
+
+  def assertUnchanged(self):
+    self.assertEqual(self.serialized, self.proto.SerializeToString())
+    self.assertEqual(
+        self.serialized,
+        unittest_pb2.TestAllTypes.FromString(self.serialized).Freeze()
+        .SerializeToString())
+
+  def testModificationsRaise(self):
+    proto = self.proto
+    modifications = [
+        lambda: setattr(proto, 'optional_int32', 5),
+        lambda: setattr(proto.optional_nested_message, 'bb', 5),
+        lambda: setattr(proto.repeated_nested_message[0], 'bb', 5),
+        lambda: setattr(proto.optional_foreign_message, 'c', 5),
+        lambda: proto.repeated_int32.append(5),
+        lambda: proto.repeated_int32.extend([5]),
+        lambda: proto.repeated_int32.sort(),
+        lambda: proto.repeated_int32.pop(),
+        lambda: proto.repeated_int32.__setitem__(0, 5),
+        lambda: proto.repeated_int32.__delitem__(0),
+        lambda: proto.repeated_nested_message.add(),
+        lambda: proto.repeated_nested_message.remove(
+            proto.repeated_nested_message[0]),
+        lambda: proto.repeated_nested_message.pop(),
+        lambda: proto.repeated_nested_message.AddAllocated(
+            unittest_pb2.TestAllTypes.NestedMessage()),
+        lambda: proto.repeated_nested_message.SwapElements(0, 1),
+        lambda: proto.ClearField('optional_int32'),
+        lambda: proto.ReleaseField('optional_nested_message'),
+        lambda: proto.ClearField('optional_lazy_message'),
+        lambda: proto.Clear(),
+        lambda: proto.MergeFrom(unittest_pb2.TestAllTypes(optional_int32=5)),
+        lambda: proto.CopyFrom(unittest_pb2.TestAllTypes()),
+        lambda: proto.MergeFromString(b'\x08\x05'),
+        lambda: proto.ParseFromString(b''),
+        lambda: proto.optional_nested_message.SetInParent(),
+    ]
+    for modify in modifications:
+      self.assertRaises(AttributeError, modify)
+      self.assertUnchanged()
+
+  def testUnsetFieldsCanBeRead(self):
+    proto = unittest_pb2.TestAllTypes().Freeze()
+    self.assertEqual(0, proto.optional_nested_message.bb)
+    # Nothing can be written through the value, so it is shared.
+    other = unittest_pb2.TestAllTypes().Freeze()
+    self.assertTrue(proto.optional_nested_message is
+                    other.optional_nested_message)
+    self.assertEqual([], proto.repeated_int32)
+    self.assertEqual(0, len(proto.repeated_nested_message))
+    self.assertRaises(AttributeError, setattr, proto.optional_nested_message,
+                      'bb', 1)
+    self.assertRaises(AttributeError, proto.repeated_int32.append, 1)
+    self.assertFalse(proto.HasField('optional_nested_message'))
+    self.assertEqual([], proto.ListFields())
+    self.assertEqual(b'', proto.SerializeToString())
+
+  def testFrozenExtensions(self):
+    proto = unittest_pb2.TestAllExtensions()
+    test_util.SetAllExtensions(proto)
+    proto.Freeze()
+    self.assertRaises(AttributeError, proto.Extensions.__setitem__,
+                      unittest_pb2.optional_int32_extension, 5)
+    self.assertRaises(AttributeError, proto.ClearExtension,
+                      unittest_pb2.optional_int32_extension)
+    self.assertRaises(
+        AttributeError, setattr,
+        proto.Extensions[unittest_pb2.optional_nested_message_extension],
+        'bb', 5)
+    expected = unittest_pb2.TestAllExtensions()
+    test_util.SetAllExtensions(expected)
+    self.assertEqual(expected, proto)
+
+  def testHash(self):
+    self.assertRaises(TypeError, hash, unittest_pb2.TestAllTypes())
+    parsed = unittest_pb2.TestAllTypes.FromString(self.serialized, frozen=True)
+    self.assertEqual(hash(self.proto), hash(parsed))
+    self.assertEqual(self.proto, parsed)
+    other = unittest_pb2.TestAllTypes(optional_int32=1).Freeze()
+    self.assertNotEqual(self.proto, other)
+    table = {self.proto: 'all', other: 'one'}
+    self.assertEqual('all', table[parsed])
+    self.assertEqual(
+        'one', table[unittest_pb2.TestAllTypes(optional_int32=1).Freeze()])
+    # Equal to mutable messages holding the same fields.
+    self.assertEqual(self.proto,
+                     unittest_pb2.TestAllTypes.FromString(self.serialized))
+
+  def testFrozenFromString(self):
+    parsed = unittest_pb2.TestAllTypes.FromString(self.serialized, frozen=True)
+    self.assertIs(self.serialized, parsed.SerializeToString())
+    self.assertRaises(AttributeError, setattr, parsed, 'optional_int32', 5)
+    self.assertIs(parsed, parsed.Freeze())
+
+  def testCopies(self):
+    self.assertIs(self.proto, copy.deepcopy(self.proto))
+    mutable = unittest_pb2.TestAllTypes()
+    mutable.CopyFrom(self.proto)
+    mutable.optional_nested_message.bb = 5
+    mutable.repeated_int32.append(5)
+    self.assertUnchanged()
+    mutable = unittest_pb2.TestAllTypes()
+    mutable.MergeFrom(self.proto)
+    mutable.repeated_nested_message[0].bb = 5
+    self.assertUnchanged()
+
+
+class CopyOnWriteTest(unittest.TestCase):
+
+  def setUp(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Copies share values only in the pure Python '
+                    'implementation.')
+    proto = unittest_pb2.NestedTestAllTypes()
+    proto.payload.optional_int32 = 1
+    proto.payload.repeated_int32.extend([2, 3])
+    proto.payload.repeated_nested_message.add().bb = 4
+    proto.child.payload.optional_nested_message.bb = 5
+    proto.child.child.payload.optional_string = u'six'
+    self.serialized = proto.SerializeToString()
+    self.proto = unittest_pb2.NestedTestAllTypes.FromString(self.serialized)
+
+  def assertShares(self, copied, source, field_name):
+    field = copied.DESCRIPTOR.fields_by_name[field_name]
+    self.assertTrue(copied._fields[field] is source._fields[field])
+
+  def assertUnchanged(self):
+    self.assertEqual(self.serialized, self.proto.SerializeToString())
+    self.assertEqual(
+        unittest_pb2.NestedTestAllTypes.FromString(self.serialized),
+        self.proto)
+
+  def assertCopyIs(self, serialized, copied):
+    self.assertEqual(serialized, copied.SerializeToString())
+    self.assertEqual(copied.ByteSize(), len(serialized))
+    self.assertEqual(unittest_pb2.NestedTestAllTypes.FromString(serialized),
+                     copied)
+
+  def testCopiesShareValues(self):
+    deep = copy.deepcopy(self.proto)
+    self.assertShares(deep, self.proto, 'payload')
+    self.assertShares(deep, self.proto, 'child')
+    copied = unittest_pb2.NestedTestAllTypes()
+    copied.CopyFrom(self.proto)
+    self.assertShares(copied, self.proto, 'child')
+    for copied in (deep, copied):
+      self.assertEqual(self.proto, copied)
+      self.assertEqual(self.serialized, copied.SerializeToString())
+
+  def testWritingToCopy(self):
+    copied = copy.deepcopy(self.proto)
+    copied.child.child.payload.optional_string = u'seven'
+    copied.payload.repeated_int32.append(8)
+    copied.payload.repeated_nested_message[0].bb = 9
+    self.assertUnchanged()
+    expected = unittest_pb2.NestedTestAllTypes.FromString(self.serialized)
+    expected.child.child.payload.optional_string = u'seven'
+    expected.payload.repeated_int32.append(8)
+    expected.payload.repeated_nested_message[0].bb = 9
+    self.assertCopyIs(expected.SerializeToString(), copied)
+    # Only the values written through are copied.
+    self.assertShares(copied.child, self.proto.child, 'payload')
+
+  def testWritingToSource(self):
+    grandchild = self.proto.child.child.payload
+    nested = self.proto.payload.repeated_nested_message[0]
+    repeated = self.proto.payload.repeated_int32
+    copied = copy.deepcopy(self.proto)
+    grandchild.optional_string = u'seven'
+    nested.bb = 8
+    repeated.append(9)
+    self.assertCopyIs(self.serialized, copied)
+    self.assertEqual(u'seven',
+                     self.proto.child.child.payload.optional_string)
+    self.assertEqual(8, self.proto.payload.repeated_nested_message[0].bb)
+    self.assertEqual([2, 3, 9], self.proto.payload.repeated_int32)
+
+  def testSourceWithSeveralCopies(self):
+    copies = [copy.deepcopy(self.proto) for _ in range(3)]
+    copies.append(copy.deepcopy(copies[0]))
+    self.proto.payload.optional_int32 = 10
+    self.assertCopyIs(self.serialized, copies[0])
+    copies[1].payload.optional_int32 = 11
+    self.assertEqual(1, copies[2].payload.optional_int32)
+    self.assertEqual(1, copies[3].payload.optional_int32)
+    copies[2].Clear()
+    for copied in (copies[0], copies[3]):
+      self.assertCopyIs(self.serialized, copied)
+
+  def testBuiltSource(self):
+    proto = unittest_pb2.NestedTestAllTypes.FromString(self.serialized)
+    proto.payload.optional_int32 = 10
+    serialized = proto.SerializeToString()
+    copied = copy.deepcopy(proto)
+    proto.child.payload.optional_nested_message.bb = 11
+    self.assertCopyIs(serialized, copied)
+    del proto
+    gc.collect()
+    self.assertCopyIs(serialized, copied)
+
+  def testMethodsOfCopy(self):
+    copied = copy.deepcopy(self.proto)
+    self.assertEqual(self.proto.ListFields(), copied.ListFields())
+    child = copied.ReleaseField('child')
+    child.payload.optional_int32 = 10
+    self.assertFalse(copied.HasField('child'))
+    self.assertUnchanged()
+
+    copied = copy.deepcopy(self.proto)
+    copied.MergeFrom(self.proto)
+    copied.MergeFromString(self.serialized)
+    self.assertUnchanged()
+    self.assertEqual([2, 3, 2, 3, 2, 3], copied.payload.repeated_int32)
+
+    copied = copy.deepcopy(self.proto)
+    copied.Clear()
+    self.assertEqual(b'', copied.SerializeToString())
+    self.assertUnchanged()
+
+    copied = copy.deepcopy(self.proto).Freeze()
+    self.assertEqual(self.serialized, copied.SerializeToString())
+    self.proto.payload.optional_int32 = 10
+    self.assertEqual(1, copied.payload.optional_int32)
+
+  def testCopyOfFrozenSource(self):
+    self.proto.Freeze()
+    copied = unittest_pb2.NestedTestAllTypes()
+    copied.CopyFrom(self.proto)
+    self.assertShares(copied, self.proto, 'child')
+    copied.child.payload.optional_int32 = 10
+    self.assertUnchanged()
+
+  def testCopyIntoValueReadWhileUnset(self):
+    proto = unittest_pb2.NestedTestAllTypes()
+    payload = proto.child.payload
+    proto.MergeFrom(self.proto)
+    self.assertTrue(payload is proto.child.payload)
+    self.assertEqual(5, payload.optional_nested_message.bb)
+    payload.optional_nested_message.bb = 10
+    self.assertUnchanged()
+
+  def testSourceCollected(self):
+    copied = copy.deepcopy(self.proto)
+    del self.proto
+    gc.collect()
+    self.assertCopyIs(self.serialized, copied)
+    copied.child.payload.optional_int32 = 10
+    self.assertEqual(10, copied.child.payload.optional_int32)
+    self.assertEqual(5, copied.child.payload.optional_nested_message.bb)
+
+
+class SlotFieldsTest(unittest.TestCase):
+
+  def setUp(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Field layouts only exist in the pure Python '
+                    'implementation.')
+    from google.protobuf.internal import python_message
+    self.python_message = python_message
+
+  def testMapping(self):
+    fields_class = self.python_message._MakeSlotFieldsClass(
+        unittest_pb2.TestAllTypes.DESCRIPTOR)
+    fields_by_name = unittest_pb2.TestAllTypes.DESCRIPTOR.fields_by_name
+    int32_field = fields_by_name['optional_int32']
+    string_field = fields_by_name['optional_string']
+    last_field = fields_by_name['oneof_bytes']
+    extension = unittest_pb2.optional_int32_extension
+    fields = fields_class()
+    self.assertEqual(0, len(fields))
+    self.assertFalse(int32_field in fields)
+    self.assertEqual(None, fields.get(int32_field))
+    self.assertEqual(5, fields.get(int32_field, 5))
+    self.assertRaises(KeyError, fields.__getitem__, int32_field)
+    self.assertRaises(KeyError, fields.__delitem__, int32_field)
+    self.assertRaises(KeyError, fields.pop, extension)
+
+    fields[last_field] = b'x'
+    fields[string_field] = u'y'
+    fields[int32_field] = 1
+    fields[extension] = 2
+    self.assertEqual(4, len(fields))
+    self.assertTrue(int32_field in fields)
+    self.assertEqual(1, fields[int32_field])
+    self.assertEqual(2, fields.get(extension))
+    # Fields come in field number order, then extensions.
+    self.assertEqual([(int32_field, 1), (string_field, u'y'),
+                      (last_field, b'x'), (extension, 2)], fields.items())
+    self.assertEqual(dict(fields.items()), dict(fields))
+    self.assertEqual(u'y', fields.setdefault(string_field, u'z'))
+
+    del fields[int32_field]
+    self.assertFalse(int32_field in fields)
+    self.assertEqual(b'x', fields.pop(last_field))
+    self.assertEqual(None, fields.pop(last_field, None))
+    self.assertEqual(2, fields.pop(extension))
+    self.assertEqual([string_field], list(fields))
+    self.assertEqual(1, fields.setdefault(int32_field, 1))
+    self.assertEqual(2, len(fields))
+
+  def testMessages(self):
+    desc_proto = descriptor_pb2.DescriptorProto()
+    desc_proto.name = 'Fleet'
+    nested_proto = desc_proto.nested_type.add()
+    nested_proto.name = 'Truck'
+    field = nested_proto.field.add()
+    field.name, field.number = 'year', 1
+    field.type = descriptor_pb2.FieldDescriptorProto.TYPE_INT64
+    field.label = descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+    field = nested_proto.field.add()
+    field.name, field.number = 'model', 2
+    field.type = descriptor_pb2.FieldDescriptorProto.TYPE_STRING
+    field.label = descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+    field = desc_proto.field.add()
+    field.name, field.number = 'trucks', 1
+    field.type = descriptor_pb2.FieldDescriptorProto.TYPE_MESSAGE
+    field.type_name = 'Truck'
+    field.label = descriptor_pb2.FieldDescriptorProto.LABEL_REPEATED
+    field = desc_proto.field.add()
+    field.name, field.number = 'flagship', 2
+    field.type = descriptor_pb2.FieldDescriptorProto.TYPE_MESSAGE
+    field.type_name = 'Truck'
+    field.label = descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+    fleet_class = reflection.MakeClass(descriptor.MakeDescriptor(desc_proto))
+    truck_class = fleet_class.Truck
+
+    old_layout = self.python_message._field_layout
+    self.python_message._field_layout = 'slots'
+    try:
+      fleet = fleet_class()
+      truck = truck_class()
+    finally:
+      self.python_message._field_layout = old_layout
+    self.assertTrue(isinstance(fleet._fields, self.python_message._SlotFields))
+    self.assertTrue(isinstance(truck._fields, self.python_message._SlotFields))
+
+    truck.year = 2000
+    self.assertTrue(truck.HasField('year'))
+    self.assertFalse(truck.HasField('model'))
+    truck.model = u'T'
+    truck.ClearField('year')
+    self.assertFalse(truck.HasField('year'))
+    self.assertEqual(u'T', truck.model)
+    self.assertEqual(['model'], [f.name for f, _ in truck.ListFields()])
+
+    fleet.flagship.year = 2001
+    fleet.trucks.add(year=2002, model=u'U')
+    fleet.trucks.add().MergeFrom(truck)
+    serialized = fleet.SerializeToString()
+    parsed = fleet_class.FromString(serialized)
+    self.assertEqual(fleet, parsed)
+    self.assertEqual(2002, parsed.trucks[0].year)
+    self.assertEqual(serialized, parsed.SerializeToString())
+    self.assertEqual(len(serialized), parsed.ByteSize())
+
+    copied = copy.deepcopy(parsed)
+    copied.trucks[1].year = 2003
+    self.assertEqual(serialized, parsed.SerializeToString())
+    merged = fleet_class()
+    merged.MergeFrom(copied)
+    merged.MergeFromString(serialized)
+    self.assertEqual(4, len(merged.trucks))
+    self.assertEqual(2003, merged.trucks[1].year)
+    parsed.Freeze()
+    self.assertEqual(fleet, parsed)
+    self.assertRaises(AttributeError, setattr, parsed.flagship, 'year', 1)
+    parsed = fleet_class.FromString(serialized)
+    parsed.Clear()
+    self.assertEqual(b'', parsed.SerializeToString())
+
+
+class FingerprintTest(unittest.TestCase):
+
+  def setUp(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Fingerprint() is only implemented in the pure Python '
+                    'implementation.')
+    self.proto = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(self.proto)
+    self.fingerprint = self.proto.Fingerprint()
+
+  def testStable(self):
+    # Fingerprints must not change from one process or release to the next.
+    self.assertEqual(0xf7c57f06a1d3ce117749fc98e2111668,
+                     unittest_pb2.TestAllTypes(optional_int32=1).Fingerprint())
+    self.assertTrue(0 <= self.fingerprint < 2**128)
+
+  def testEqualMessages(self):
+    parsed = unittest_pb2.TestAllTypes.FromString(
+        self.proto.SerializeToString())
+    self.assertEqual(self.fingerprint, parsed.Fingerprint())
+    self.assertEqual(self.fingerprint, parsed.Freeze().Fingerprint())
+
+    proto1 = unittest_pb2.TestAllTypes()
+    proto1.optional_string = u'\u1234'
+    proto1.optional_nested_message.bb = 1
+    proto2 = unittest_pb2.TestAllTypes()
+    proto2.optional_nested_message.bb = 1
+    proto2.optional_string = u'\u1234'
+    self.assertEqual(proto1.Fingerprint(), proto2.Fingerprint())
+
+    extendee1 = unittest_pb2.TestAllExtensions()
+    test_util.SetAllExtensions(extendee1)
+    extendee2 = unittest_pb2.TestAllExtensions()
+    extendee2.MergeFromString(extendee1.SerializeToString())
+    self.assertEqual(extendee1.Fingerprint(), extendee2.Fingerprint())
+
+  def testEqualMessagesWithUnknownFields(self):
+    message1 = unittest_pb2.TestEmptyMessage.FromString(b'\x08\x01\x10\x02')
+    message2 = unittest_pb2.TestEmptyMessage.FromString(b'\x10\x02\x08\x01')
+    self.assertEqual(message1, message2)
+    self.assertEqual(message1.Fingerprint(), message2.Fingerprint())
+    message1 = unittest_pb2.TestEmptyMessage.FromString(b'\x08\x01\x08\x02')
+    message2 = unittest_pb2.TestEmptyMessage.FromString(b'\x08\x02\x08\x01')
+    self.assertEqual(message1, message2)
+    self.assertEqual(message1.Fingerprint(), message2.Fingerprint())
+    self.assertNotEqual(
+        message1.Fingerprint(),
+        unittest_pb2.TestEmptyMessage.FromString(b'\x08\x01').Fingerprint())
+
+  def testDifferentMessages(self):
+    fingerprints = set([
+        unittest_pb2.TestAllTypes().Fingerprint(),
+        unittest_pb2.TestAllTypes(optional_int32=0).Fingerprint(),
+        unittest_pb2.TestAllTypes(optional_int64=0).Fingerprint(),
+        unittest_pb2.TestAllTypes(repeated_int32=[1, 2]).Fingerprint(),
+        unittest_pb2.TestAllTypes(repeated_int32=[2, 1]).Fingerprint(),
+        unittest_pb2.TestAllTypes.FromString(b'\x08\x01\xc0\x3e\x00')
+        .Fingerprint(),
+        self.fingerprint,
+    ])
+    self.assertEqual(7, len(fingerprints))
+
+  def testModifications(self):
+    proto = self.proto
+    proto.repeated_nested_message[0].bb += 1
+    changed = proto.Fingerprint()
+    self.assertNotEqual(self.fingerprint, changed)
+    proto.repeated_nested_message[0].bb -= 1
+    self.assertEqual(self.fingerprint, proto.Fingerprint())
+
+    # Changes are seen however they are made.
+    proto.repeated_nested_message.SwapElements(0, 1)
+    self.assertNotEqual(self.fingerprint, proto.Fingerprint())
+    proto.repeated_nested_message.SwapElements(0, 1)
+    proto.MergeFromString(b'\x08\x05')
+    self.assertNotEqual(self.fingerprint, proto.Fingerprint())
+    proto.Clear()
+    self.assertEqual(unittest_pb2.TestAllTypes().Fingerprint(),
+                     proto.Fingerprint())
+
+  def testOnlyModifiedMessagesAreHashedAgain(self):
+    proto = self.proto
+    untouched = proto.repeated_nested_message[1]
+    digest = untouched._fingerprint
+    self.assertTrue(digest is not None)
+    proto.repeated_nested_message[0].bb = 5
+    self.assertTrue(proto._fingerprint is None)
+    proto.Fingerprint()
+    self.assertTrue(untouched._fingerprint is digest)
+
+
 class SerializationTest(unittest.TestCase):
 
   def testSerializeEmtpyMessage(self):
@@ -2309,6 +3228,35 @@ class SerializationTest(unittest.TestCase):
 
     self.assertEqual(first_proto, second_proto)
 
+  def testSerializeVarintBoundaries(self):
+    # Small varints are encoded from a table, larger ones are computed.
+    values = []
+    for bits in range(7, 64, 7):
+      values.extend([(1 << bits) - 1, 1 << bits])
+    first_proto = unittest_pb2.TestAllTypes()
+    first_proto.repeated_uint64.extend(values)
+    first_proto.repeated_int64.extend(values[:-2] + [-1, -(1 << 63)])
+    first_proto.repeated_sint64.extend([-v for v in values[:-2]])
+    serialized = first_proto.SerializeToString()
+    self.assertEqual(first_proto.ByteSize(), len(serialized))
+    second_proto = unittest_pb2.TestAllTypes.FromString(serialized)
+    self.assertEqual(first_proto, second_proto)
+
+    # Tag 3 (optional_uint32), then 16383 and 16384.
+    first_proto.Clear()
+    first_proto.optional_uint32 = 16383
+    self.assertEqual(b'\x18\xff\x7f', first_proto.SerializeToString())
+    first_proto.optional_uint32 = 16384
+    self.assertEqual(b'\x18\x80\x80\x01', first_proto.SerializeToString())
+
+  def testVarintBytesRejectsNegativeValues(self):
+    # Negative indices would otherwise pick the wrong entries of the table.
+    self.assertEqual(b'\x00', encoder._VarintBytes(0))
+    for value in [-1, -(1 << 14), -(1 << 63)]:
+      self.assertRaises(ValueError, encoder._VarintBytes, value)
+    self.assertEqual(b'\xff\xff\xff\xff\xff\xff\xff\xff\xff\x01',
+                     encoder._SignedVarintBytes(-1))
+
   def testParseTruncated(self):
     # This test is only applicable for the Python implementation of the API.
     if api_implementation.Type() != 'python':
@@ -2602,6 +3550,46 @@ class SerializationTest(unittest.TestCase):
     proto.repeated_message[1].c = 3
     proto.SerializeToString()
 
+  def testSerializeUninitializedExtension(self):
+    proto = unittest_pb2.TestAllExtensions()
+    proto.Extensions[unittest_pb2.TestRequired.single].a = 1
+    self._CheckRaises(
+        message.EncodeError,
+        proto.SerializeToString,
+        'Message protobuf_unittest.TestAllExtensions '
+        'is missing required fields: '
+        '(protobuf_unittest.TestRequired.single).b,'
+        '(protobuf_unittest.TestRequired.single).c')
+
+    # The same holds once the message was parsed.
+    parsed = unittest_pb2.TestAllExtensions.FromString(
+        proto.SerializePartialToString())
+    self.assertRaises(message.EncodeError, parsed.SerializeToString)
+    parsed.Extensions[unittest_pb2.TestRequired.single].b = 2
+    parsed.Extensions[unittest_pb2.TestRequired.single].c = 3
+    self.assertEqual(parsed.SerializePartialToString(),
+                     parsed.SerializeToString())
+
+  def testCanHaveRequiredFields(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('Only the pure Python implementation keeps track of '
+                    'which message types can contain required fields.')
+    from google.protobuf.internal import python_message
+    can_have_required_fields = python_message._CanHaveRequiredFields
+    self.assertFalse(can_have_required_fields(unittest_pb2.TestAllTypes))
+    self.assertFalse(
+        can_have_required_fields(unittest_pb2.NestedTestAllTypes))
+    self.assertTrue(can_have_required_fields(unittest_pb2.TestRequired))
+    self.assertTrue(
+        can_have_required_fields(unittest_pb2.TestRequiredForeign))
+    # Any extension could be a message with required fields.
+    self.assertTrue(can_have_required_fields(unittest_pb2.TestAllExtensions))
+
+    proto = unittest_pb2.NestedTestAllTypes()
+    proto.child.child.payload.optional_int32 = 1
+    self.assertTrue(proto.IsInitialized())
+    self.assertEqual([], proto.FindInitializationErrors())
+
   def testSerializeAllPackedFields(self):
     first_proto = unittest_pb2.TestPackedTypes()
     second_proto = unittest_pb2.TestPackedTypes()
@@ -2621,6 +3609,27 @@ class SerializationTest(unittest.TestCase):
     self.assertEqual(second_proto.ByteSize(), bytes_read)
     self.assertEqual(first_proto, second_proto)
 
+  def testSerializePackedFieldsFromArrays(self):
+    doubles = [0.0, -1.5, 1e100, float('inf'), float('-inf')]
+    ints = [0, 1, -1, 1 << 20, -(1 << 31)]
+    from_lists = unittest_pb2.TestPackedTypes()
+    from_lists.packed_double.extend(doubles)
+    from_lists.packed_float.extend(doubles[:2])
+    from_lists.packed_int32.extend(ints)
+    from_lists.packed_sfixed32.extend(ints)
+    from_lists.packed_bool.extend([True, False])
+    from_arrays = unittest_pb2.TestPackedTypes()
+    from_arrays.packed_double.extend(array.array('d', doubles))
+    from_arrays.packed_float.extend(array.array('f', doubles[:2]))
+    from_arrays.packed_int32.extend(array.array('i', ints))
+    from_arrays.packed_sfixed32.extend(array.array('l', ints))
+    from_arrays.packed_bool.extend(array.array('b', [1, 0]))
+    self.assertEqual(from_lists, from_arrays)
+    self.assertEqual(from_lists.SerializeToString(),
+                     from_arrays.SerializeToString())
+    self.assertRaises(ValueError, from_arrays.packed_uint32.extend,
+                      array.array('i', [-1]))
+
   def testMergePackedFromStringWhenSomeFieldsAlreadySet(self):
     first_proto = unittest_pb2.TestPackedTypes()
     first_proto.packed_int32.extend([1, 2])
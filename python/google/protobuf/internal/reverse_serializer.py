@@ -0,0 +1,189 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Serializes messages back-to-front, without computing sizes beforehand.
+
+The encoders in encoder.py write a message front-to-back, so the length prefix
+of every sub-message has to be known before the sub-message itself is written.
+That is what the ByteSize() call in encoder.MessageEncoder is for, and on a
+freshly built message it is an extra traversal of the whole tree.
+
+The encoders here write into a ReverseBuffer, which fills a bytearray from the
+end towards the front.  Fields are visited in reverse order, and a sub-message
+is written before its tag and length:  once it is in the buffer, its length is
+simply the number of bytes that were added.  The resulting bytes are exactly
+the ones the forward encoders produce.
+
+Each encoder has the signature
+  encode(buffer, value)
+and is attached to its FieldDescriptor as _reverse_encoder, next to the forward
+_encoder.  Messages implement _InternalSerializeReversed(buffer).
+"""
+
+from google.protobuf.internal import encoder
+from google.protobuf.internal import wire_format
+from google.protobuf import descriptor as descriptor_mod
+
+_FieldDescriptor = descriptor_mod.FieldDescriptor
+
+_INITIAL_CAPACITY = 256
+
+
+class ReverseBuffer(object):
+
+  """A growable byte buffer which is filled from the end towards the front."""
+
+  __slots__ = ['_buffer', '_start']
+
+  def __init__(self, capacity=_INITIAL_CAPACITY):
+    self._buffer = bytearray(capacity)
+    self._start = capacity
+
+  def Prepend(self, data):
+    """Writes data in front of everything written so far."""
+    start = self._start - len(data)
+    if start < 0:
+      self._Grow(len(data))
+      start = self._start - len(data)
+    self._buffer[start:self._start] = data
+    self._start = start
+
+  def Size(self):
+    """Returns the number of bytes written so far."""
+    return len(self._buffer) - self._start
+
+  def getvalue(self):
+    """Returns everything written so far, as bytes."""
+    return bytes(self._buffer[self._start:])
+
+  def _Grow(self, needed):
+    used = len(self._buffer) - self._start
+    capacity = max(2 * len(self._buffer), used + needed)
+    buffer = bytearray(capacity)
+    buffer[capacity - used:] = self._buffer[self._start:]
+    self._buffer = buffer
+    self._start = capacity - used
+
+
+def MessageEncoder(field_number, is_repeated):
+  """Returns a reverse encoder for a message field."""
+
+  tag = encoder.TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
+  local_VarintBytes = encoder._VarintBytes
+  if is_repeated:
+    def EncodeRepeatedField(buffer, value):
+      for element in reversed(value):
+        end = buffer.Size()
+        element._InternalSerializeReversed(buffer)
+        buffer.Prepend(tag + local_VarintBytes(buffer.Size() - end))
+    return EncodeRepeatedField
+  else:
+    def EncodeField(buffer, value):
+      end = buffer.Size()
+      value._InternalSerializeReversed(buffer)
+      buffer.Prepend(tag + local_VarintBytes(buffer.Size() - end))
+    return EncodeField
+
+
+def GroupEncoder(field_number, is_repeated):
+  """Returns a reverse encoder for a group field."""
+
+  start_tag = encoder.TagBytes(field_number, wire_format.WIRETYPE_START_GROUP)
+  end_tag = encoder.TagBytes(field_number, wire_format.WIRETYPE_END_GROUP)
+  if is_repeated:
+    def EncodeRepeatedField(buffer, value):
+      for element in reversed(value):
+        buffer.Prepend(end_tag)
+        element._InternalSerializeReversed(buffer)
+        buffer.Prepend(start_tag)
+    return EncodeRepeatedField
+  else:
+    def EncodeField(buffer, value):
+      buffer.Prepend(end_tag)
+      value._InternalSerializeReversed(buffer)
+      buffer.Prepend(start_tag)
+    return EncodeField
+
+
+def MessageSetItemEncoder(field_number):
+  """Returns a reverse encoder for an extension of MessageSet.
+
+  See encoder.MessageSetItemEncoder() for the layout of an item.
+  """
+
+  start_bytes = b''.join([
+      encoder.TagBytes(1, wire_format.WIRETYPE_START_GROUP),
+      encoder.TagBytes(2, wire_format.WIRETYPE_VARINT),
+      encoder._VarintBytes(field_number),
+      encoder.TagBytes(3, wire_format.WIRETYPE_LENGTH_DELIMITED)])
+  end_bytes = encoder.TagBytes(1, wire_format.WIRETYPE_END_GROUP)
+  local_VarintBytes = encoder._VarintBytes
+
+  def EncodeField(buffer, value):
+    buffer.Prepend(end_bytes)
+    end = buffer.Size()
+    value._InternalSerializeReversed(buffer)
+    buffer.Prepend(start_bytes + local_VarintBytes(buffer.Size() - end))
+
+  return EncodeField
+
+
+def ScalarEncoder(field_encoder):
+  """Returns a reverse encoder for a field which holds no sub-messages.
+
+  Such fields never need a size pre-pass, so the forward encoder is reused:
+  its output is collected and prepended as a single chunk.
+
+  Args:
+    field_encoder: The forward encoder of the field, from encoder.py.
+  """
+
+  def EncodeField(buffer, value):
+    pieces = []
+    field_encoder(pieces.append, value)
+    buffer.Prepend(b''.join(pieces))
+
+  return EncodeField
+
+
+def FieldEncoder(field_descriptor, is_repeated, field_encoder):
+  """Returns the reverse encoder for a field.
+
+  Args:
+    field_descriptor: The FieldDescriptor of the field.
+    is_repeated: Whether the field is repeated.
+    field_encoder: The forward encoder of the field, from encoder.py.
+  """
+  if field_descriptor.type == _FieldDescriptor.TYPE_MESSAGE:
+    return MessageEncoder(field_descriptor.number, is_repeated)
+  elif field_descriptor.type == _FieldDescriptor.TYPE_GROUP:
+    return GroupEncoder(field_descriptor.number, is_repeated)
+  else:
+    return ScalarEncoder(field_encoder)
@@ -0,0 +1,181 @@
+#! /usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Tests for google.protobuf.internal.reverse_serializer."""
+
+import unittest
+
+from google.protobuf import unittest_mset_pb2
+from google.protobuf import unittest_pb2
+from google.protobuf import unittest_proto3_arena_pb2
+from google.protobuf.internal import api_implementation
+from google.protobuf.internal import test_util
+
+
+class ReverseBufferTest(unittest.TestCase):
+
+  def setUp(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('The reverse serializer only exists in the pure Python '
+                    'implementation.')
+    from google.protobuf.internal import reverse_serializer
+    self.reverse_serializer = reverse_serializer
+
+  def testPrepend(self):
+    buffer = self.reverse_serializer.ReverseBuffer()
+    self.assertEqual(0, buffer.Size())
+    self.assertEqual(b'', buffer.getvalue())
+    buffer.Prepend(b'world')
+    buffer.Prepend(b'')
+    buffer.Prepend(b'hello ')
+    self.assertEqual(11, buffer.Size())
+    self.assertEqual(b'hello world', buffer.getvalue())
+
+  def testGrow(self):
+    buffer = self.reverse_serializer.ReverseBuffer(capacity=2)
+    buffer.Prepend(b'c')
+    buffer.Prepend(b'ab')
+    buffer.Prepend(b'0123456789')
+    self.assertEqual(13, buffer.Size())
+    self.assertEqual(b'0123456789abc', buffer.getvalue())
+
+
+class ReverseSerializerTest(unittest.TestCase):
+
+  def setUp(self):
+    if api_implementation.Type() != 'python':
+      self.skipTest('The serialization strategy only exists in the pure '
+                    'Python implementation.')
+    from google.protobuf.internal import python_message
+    self.python_message = python_message
+    self.saved_strategy = python_message.GetSerializationStrategy()
+
+  def tearDown(self):
+    if api_implementation.Type() == 'python':
+      self.python_message.SetSerializationStrategy(self.saved_strategy)
+
+  def Serialize(self, message, strategy):
+    self.python_message.SetSerializationStrategy(strategy)
+    # A fresh copy, so that no byte sizes are cached yet.
+    copy = type(message)()
+    copy.MergeFrom(message)
+    return copy.SerializePartialToString()
+
+  def assertSameBytes(self, message):
+    generic = self.Serialize(message, 'generic')
+    reverse = self.Serialize(message, 'reverse')
+    self.assertEqual(generic, reverse)
+    return reverse
+
+  def testEmptyMessage(self):
+    self.assertEqual(b'', self.assertSameBytes(unittest_pb2.TestAllTypes()))
+
+  def testAllFields(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    self.assertEqual(
+        test_util.GoldenFileData('golden_message_oneof_implemented'),
+        self.assertSameBytes(message))
+
+  def testAllExtensions(self):
+    message = unittest_pb2.TestAllExtensions()
+    test_util.SetAllExtensions(message)
+    self.assertSameBytes(message)
+
+  def testPackedFields(self):
+    message = unittest_pb2.TestPackedTypes()
+    test_util.SetAllPackedFields(message)
+    self.assertEqual(test_util.GoldenFileData('golden_packed_fields_message'),
+                     self.assertSameBytes(message))
+
+  def testInterleavedExtensions(self):
+    message = unittest_pb2.TestFieldOrderings()
+    test_util.SetAllFieldsAndExtensions(message)
+    test_util.ExpectAllFieldsAndExtensionsInOrder(self.assertSameBytes(message))
+
+  def testDeeplyNestedMessages(self):
+    message = unittest_pb2.NestedTestAllTypes()
+    child = message
+    for i in range(100):
+      child.payload.repeated_string.append('x' * i)
+      child = child.child
+    self.assertSameBytes(message)
+
+  def testRepeatedMessagesAndGroups(self):
+    message = unittest_pb2.TestAllTypes()
+    for i in range(300):
+      message.repeated_nested_message.add().bb = i
+      message.repeatedgroup.add().a = i
+    self.assertSameBytes(message)
+
+  def testUnknownFields(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    empty = unittest_pb2.TestEmptyMessage()
+    empty.MergeFromString(message.SerializeToString())
+    self.assertEqual(message.SerializeToString(), self.assertSameBytes(empty))
+
+  def testMessageSet(self):
+    message = unittest_mset_pb2.TestMessageSet()
+    extension1 = (
+        unittest_mset_pb2.TestMessageSetExtension1.message_set_extension)
+    extension2 = (
+        unittest_mset_pb2.TestMessageSetExtension2.message_set_extension)
+    message.Extensions[extension1].i = 123
+    message.Extensions[extension2].str = 'foo'
+    self.assertSameBytes(message)
+
+  def testProto3(self):
+    message = unittest_proto3_arena_pb2.TestAllTypes()
+    message.optional_string = 'hello'
+    message.optional_nested_message.bb = 0
+    message.repeated_nested_message.add()
+    message.repeated_int32.extend([1, 2, 3])
+    self.assertSameBytes(message)
+
+  def testByteSizeIsCached(self):
+    self.python_message.SetSerializationStrategy('reverse')
+    message = unittest_pb2.TestAllTypes()
+    message.optional_nested_message.bb = 1
+    serialized = message.SerializeToString()
+    self.assertFalse(message._cached_byte_size_dirty)
+    self.assertFalse(message.optional_nested_message._cached_byte_size_dirty)
+    self.assertEqual(len(serialized), message.ByteSize())
+    # Modifications still invalidate the cached sizes.
+    message.optional_nested_message.bb = 1000
+    self.assertTrue(message._cached_byte_size_dirty)
+    self.assertEqual(len(message.SerializeToString()), message.ByteSize())
+
+
+if __name__ == '__main__':
+  unittest.main()
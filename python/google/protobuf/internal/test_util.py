@@ -40,7 +40,9 @@ import os.path
 
 from google.protobuf import unittest_import_pb2
 from google.protobuf import unittest_pb2
+from google.protobuf import descriptor
 from google.protobuf import descriptor_pb2
+from google.protobuf import reflection
 
 # Tests whether the given TestAllTypes message is proto2 or not.
 # This is used to gate several fields/features that only exist
@@ -676,3 +678,24 @@ def SetAllUnpackedFields(message):
   message.unpacked_bool.extend([True, False])
   message.unpacked_enum.extend([unittest_pb2.FOREIGN_BAR,
                                 unittest_pb2.FOREIGN_BAZ])
+
+
+def MakeMapClass():
+  """Returns a message class with a map<string, int32> field named counts."""
+  desc_proto = descriptor_pb2.DescriptorProto()
+  desc_proto.name = 'Counter'
+  entry_proto = desc_proto.nested_type.add()
+  entry_proto.name = 'CountsEntry'
+  entry_proto.options.map_entry = True
+  for name, number, field_type in [
+      ('key', 1, descriptor_pb2.FieldDescriptorProto.TYPE_STRING),
+      ('value', 2, descriptor_pb2.FieldDescriptorProto.TYPE_INT32)]:
+    field = entry_proto.field.add()
+    field.name, field.number, field.type = name, number, field_type
+    field.label = descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+  field = desc_proto.field.add()
+  field.name, field.number = 'counts', 1
+  field.type = descriptor_pb2.FieldDescriptorProto.TYPE_MESSAGE
+  field.type_name = 'CountsEntry'
+  field.label = descriptor_pb2.FieldDescriptorProto.LABEL_REPEATED
+  return reflection.MakeClass(descriptor.MakeDescriptor(desc_proto))
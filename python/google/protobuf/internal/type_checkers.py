@@ -62,6 +62,12 @@ _FieldDescriptor = descriptor.FieldDescriptor
 def SupportsOpenEnums(field_descriptor):
   return field_descriptor.containing_type.syntax == "proto3"
 
+def IsMapEntry(field):
+  """Returns whether field is a map, that is a repeated field of map entries."""
+  message_type = field.message_type
+  return (message_type is not None and message_type.has_options and
+          message_type.GetOptions().map_entry)
+
 def GetTypeChecker(field):
   """Returns a type checker for a message field of the specified types.
 
@@ -0,0 +1,596 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Converts protocol messages to and from JSON, following the proto3 mapping.
+
+Field names are printed in lowerCamelCase, 64-bit integers as strings, bytes
+in base64 and enum values by name.  Repeated fields become arrays and map
+fields objects.  Non-finite floats are printed as "NaN", "Infinity" and
+"-Infinity".  Extensions are keyed by their full name in square brackets.
+
+The code that prints or parses a message type is put together the first time
+that type is seen and kept, so that fields are not looked at again for every
+message.  Well-known types such as Timestamp or Any get no special treatment,
+and are converted like any other message.
+
+Simple usage example:
+
+  json_text = json_format.MessageToJson(my_message)
+  json_format.Parse(json_text, MyMessage())
+"""
+
+import base64
+import json
+
+from google.protobuf.internal import type_checkers
+from google.protobuf import descriptor
+
+__all__ = ['MessageToJson', 'PrintMessage', 'Parse']
+
+
+_FieldDescriptor = descriptor.FieldDescriptor
+
+_INT64_TYPES = frozenset([_FieldDescriptor.CPPTYPE_INT64,
+                          _FieldDescriptor.CPPTYPE_UINT64])
+_INT_TYPES = frozenset([_FieldDescriptor.CPPTYPE_INT32,
+                        _FieldDescriptor.CPPTYPE_UINT32,
+                        _FieldDescriptor.CPPTYPE_INT64,
+                        _FieldDescriptor.CPPTYPE_UINT64])
+_FLOAT_TYPES = frozenset([_FieldDescriptor.CPPTYPE_FLOAT,
+                          _FieldDescriptor.CPPTYPE_DOUBLE])
+
+_INFINITY = float('inf')
+
+# Escapes and quotes a string, in C when the json module has its speedups.
+_QuoteString = json.encoder.encode_basestring_ascii
+
+
+class Error(Exception):
+  """Top-level module error for json_format."""
+
+
+class ParseError(Error):
+  """Thrown in case of JSON parsing error."""
+
+
+def MessageToJson(message, including_default_value_fields=False,
+                  preserving_proto_field_name=False, indent=2):
+  """Converts a protocol message to JSON.
+
+  Args:
+    message: The protocol buffers message.
+    including_default_value_fields: If True, singular scalar fields and
+      repeated fields which are not set are printed with their default values.
+      Fields in a oneof and singular message fields are still left out.
+    preserving_proto_field_name: If True, use the field names as they appear
+      in the .proto file instead of converting them to lowerCamelCase.
+    indent: The number of spaces to indent nested objects and arrays by, as
+      for json.dumps().  None prints everything on one line without spaces.
+
+  Returns:
+    A string containing the JSON formatted message.
+  """
+  pieces = []
+  _GetMessagePrinter(message.DESCRIPTOR, including_default_value_fields,
+                     preserving_proto_field_name, indent)(
+                         message, pieces.append, _Newline(indent))
+  return ''.join(pieces)
+
+
+def PrintMessage(message, out, including_default_value_fields=False,
+                 preserving_proto_field_name=False, indent=2):
+  """Writes a protocol message as JSON to a file object.
+
+  Large messages are written piece by piece, without building the whole text
+  in memory first.  See MessageToJson() for the arguments.
+
+  Args:
+    message: The protocol buffers message.
+    out: A file object opened for writing text.
+  """
+  _GetMessagePrinter(message.DESCRIPTOR, including_default_value_fields,
+                     preserving_proto_field_name, indent)(
+                         message, out.write, _Newline(indent))
+
+
+def Parse(text, message, ignore_unknown_fields=False):
+  """Merges JSON text into a protocol message.
+
+  Both the lowerCamelCase names and the original names of fields are accepted.
+  Null values leave their field unset.
+
+  Args:
+    text: JSON text, as a string.
+    message: A protocol buffer message to merge into.
+    ignore_unknown_fields: If True, names which are not fields of the message
+      are skipped instead of raising ParseError.
+
+  Returns:
+    The same message passed as argument.
+
+  Raises:
+    ParseError: On JSON parsing problems.
+  """
+  if not isinstance(text, unicode):
+    text = text.decode('utf-8')
+  try:
+    value = json.loads(text)
+  except ValueError as e:
+    raise ParseError('Failed to load JSON: %s' % e)
+  _GetMessageParser(message.DESCRIPTOR, ignore_unknown_fields)(value, message)
+  return message
+
+
+def _JsonName(name):
+  """Returns the lowerCamelCase JSON name of a field named name."""
+  parts = name.split('_')
+  return parts[0] + ''.join(part[:1].upper() + part[1:] for part in parts[1:])
+
+
+def _Newline(indent):
+  """Returns what starts a line at the top level, or None if indent is."""
+  if indent is None:
+    return None
+  return '\n'
+
+
+# Printers, keyed by the message descriptor and every printing option.
+_message_printers = {}
+
+
+def _GetMessagePrinter(message_descriptor, including_default_value_fields,
+                       preserving_proto_field_name, indent):
+  key = (message_descriptor, including_default_value_fields,
+         preserving_proto_field_name, indent)
+  printer = _message_printers.get(key)
+  if printer is None:
+    printer = _MakeMessagePrinter(message_descriptor,
+                                  including_default_value_fields,
+                                  preserving_proto_field_name, indent)
+    _message_printers[key] = printer
+  return printer
+
+
+def _FormatFloat(value):
+  if value != value:
+    return '"NaN"'
+  if value == _INFINITY:
+    return '"Infinity"'
+  if value == -_INFINITY:
+    return '"-Infinity"'
+  return repr(value)
+
+
+def _FormatBool(value):
+  if value:
+    return 'true'
+  return 'false'
+
+
+def _FormatBytes(value):
+  return '"%s"' % base64.b64encode(value).decode('ascii')
+
+
+def _ScalarFormatter(field):
+  """Returns a function which formats one value of a non-message field."""
+  cpp_type = field.cpp_type
+  if cpp_type in _INT64_TYPES:
+    return '"%d"'.__mod__
+  elif cpp_type in _INT_TYPES:
+    return str
+  elif cpp_type in _FLOAT_TYPES:
+    return _FormatFloat
+  elif cpp_type == _FieldDescriptor.CPPTYPE_BOOL:
+    return _FormatBool
+  elif cpp_type == _FieldDescriptor.CPPTYPE_ENUM:
+    names = dict((number, '"%s"' % value.name) for number, value
+                 in field.enum_type.values_by_number.iteritems())
+    def FormatEnum(value):
+      name = names.get(value)
+      if name is None:
+        # Unknown values of open (proto3) enums are kept as numbers.
+        return str(value)
+      return name
+    return FormatEnum
+  elif field.type == _FieldDescriptor.TYPE_BYTES:
+    return _FormatBytes
+  else:
+    return _QuoteString
+
+
+def _MapKeyFormatter(field):
+  """Returns a function which formats a map key as a quoted JSON name."""
+  if field.cpp_type == _FieldDescriptor.CPPTYPE_STRING:
+    return _QuoteString
+  if field.cpp_type == _FieldDescriptor.CPPTYPE_BOOL:
+    return lambda value: _QuoteString(_FormatBool(value))
+  return lambda value: '"%d"' % value
+
+
+def _MakeMessagePrinter(message_descriptor, including_default_value_fields,
+                        preserving_proto_field_name, indent):
+  """Returns a function printing messages of one type.
+
+  The function takes (message, write, newline).  newline is '\\n' followed by
+  the indentation of the line the message starts on, or None if printing on
+  one line.
+  """
+  if indent is None:
+    colon = ':'
+    step = None
+  else:
+    colon = ': '
+    step = ' ' * indent
+  options = (including_default_value_fields, preserving_proto_field_name,
+             indent)
+
+  def Brackets(opening, closing, newline):
+    """Returns (newline, opening, separator, closing) for the values of an
+    object or array whose opening bracket is on the line started by newline.
+    """
+    if newline is None:
+      return None, opening, ',', closing
+    inner = newline + step
+    return inner, opening + inner, ',' + inner, newline + closing
+
+  def ValuePrinter(field):
+    """Returns a function printing the value of field, which is called with
+    (value, write, newline)."""
+    if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      message_type = field.message_type
+      if type_checkers.IsMapEntry(field):
+        key_format = _MapKeyFormatter(message_type.fields_by_name['key'])
+        value_field = message_type.fields_by_name['value']
+        print_map_value = ValuePrinter(value_field)
+        def PrintMap(value, write, newline):
+          if not value:
+            write('{}')
+            return
+          inner, separator, next_separator, closing = Brackets('{', '}',
+                                                               newline)
+          for entry in value:
+            write(separator)
+            separator = next_separator
+            write(key_format(entry.key))
+            write(colon)
+            print_map_value(entry.value, write, inner)
+          write(closing)
+        return PrintMap
+      # Looked up on first use, since message types can be recursive.
+      printer = []
+      def PrintSubMessage(value, write, newline):
+        if not printer:
+          printer.append(_GetMessagePrinter(message_type, *options))
+        printer[0](value, write, newline)
+      print_element = PrintSubMessage
+      if field.label != _FieldDescriptor.LABEL_REPEATED:
+        return print_element
+    else:
+      format_value = _ScalarFormatter(field)
+      if field.label != _FieldDescriptor.LABEL_REPEATED:
+        return lambda value, write, newline: write(format_value(value))
+      def PrintRepeatedScalar(value, write, newline):
+        if not value:
+          write('[]')
+          return
+        # All values are formatted and joined in one go.
+        _, opening, separator, closing = Brackets('[', ']', newline)
+        write(opening)
+        write(separator.join(map(format_value, value)))
+        write(closing)
+      return PrintRepeatedScalar
+
+    def PrintRepeatedMessage(value, write, newline):
+      if not value:
+        write('[]')
+        return
+      inner, separator, next_separator, closing = Brackets('[', ']', newline)
+      for element in value:
+        write(separator)
+        separator = next_separator
+        print_element(element, write, inner)
+      write(closing)
+    return PrintRepeatedMessage
+
+  def MakeEntry(field):
+    if field.is_extension:
+      name = '[%s]' % field.full_name
+    elif preserving_proto_field_name:
+      name = field.name
+    else:
+      name = _JsonName(field.name)
+    return _QuoteString(name) + colon, ValuePrinter(field)
+
+  # Entries for extensions are added the first time they are printed.
+  entries = dict((field, MakeEntry(field))
+                 for field in message_descriptor.fields)
+
+  if including_default_value_fields:
+    default_fields = [
+        field for field in message_descriptor.fields
+        if not field.containing_oneof and
+        (field.label == _FieldDescriptor.LABEL_REPEATED or
+         field.cpp_type != _FieldDescriptor.CPPTYPE_MESSAGE)]
+    def ListFields(message):
+      fields = message.ListFields()
+      present = set(field for field, _ in fields)
+      for field in default_fields:
+        if field not in present:
+          fields.append((field, getattr(message, field.name)))
+      fields.sort(key=lambda item: item[0].number)
+      return fields
+  else:
+    ListFields = lambda message: message.ListFields()
+
+  def PrintMessage(message, write, newline):
+    fields = ListFields(message)
+    if not fields:
+      write('{}')
+      return
+    inner, separator, next_separator, closing = Brackets('{', '}', newline)
+    for field, value in fields:
+      entry = entries.get(field)
+      if entry is None:
+        entry = entries.setdefault(field, MakeEntry(field))
+      write(separator)
+      separator = next_separator
+      write(entry[0])
+      entry[1](value, write, inner)
+    write(closing)
+  return PrintMessage
+
+
+# Parsers, keyed by the message descriptor and ignore_unknown_fields.
+_message_parsers = {}
+
+
+def _GetMessageParser(message_descriptor, ignore_unknown_fields):
+  key = (message_descriptor, ignore_unknown_fields)
+  parser = _message_parsers.get(key)
+  if parser is None:
+    parser = _MakeMessageParser(message_descriptor, ignore_unknown_fields)
+    _message_parsers[key] = parser
+  return parser
+
+
+def _ConvertInteger(value):
+  if isinstance(value, bool):
+    raise ParseError('Expected an integer, got %r.' % value)
+  if isinstance(value, (int, long)):
+    return value
+  if isinstance(value, float):
+    if value.is_integer():
+      return int(value)
+    raise ParseError('Couldn\'t parse integer: %r.' % value)
+  if isinstance(value, basestring):
+    try:
+      return int(value)
+    except ValueError:
+      raise ParseError('Couldn\'t parse integer: %r.' % value)
+  raise ParseError('Expected an integer, got %r.' % value)
+
+
+def _ConvertFloat(value):
+  if isinstance(value, bool):
+    raise ParseError('Expected a number, got %r.' % value)
+  if isinstance(value, (int, long, float)):
+    return float(value)
+  if value == 'NaN':
+    return float('nan')
+  if value == 'Infinity':
+    return _INFINITY
+  if value == '-Infinity':
+    return -_INFINITY
+  if isinstance(value, basestring):
+    try:
+      return float(value)
+    except ValueError:
+      pass
+  raise ParseError('Couldn\'t parse float: %r.' % value)
+
+
+def _ConvertBool(value):
+  if not isinstance(value, bool):
+    raise ParseError('Expected true or false, got %r.' % value)
+  return value
+
+
+def _ConvertString(value):
+  if not isinstance(value, basestring):
+    raise ParseError('Expected a string, got %r.' % value)
+  return value
+
+
+def _ConvertBytes(value):
+  if not isinstance(value, basestring):
+    raise ParseError('Expected a base64 string, got %r.' % value)
+  # Both the standard and the URL-safe alphabets are accepted, with or
+  # without padding.
+  value = value.replace('-', '+').replace('_', '/')
+  try:
+    return base64.b64decode(value + '=' * (-len(value) % 4))
+  except (TypeError, ValueError) as e:
+    raise ParseError('Couldn\'t parse base64 string %r: %s.' % (value, e))
+
+
+def _ScalarConverter(field):
+  """Returns a function which converts one JSON value for a non-message
+  field."""
+  cpp_type = field.cpp_type
+  if cpp_type in _INT_TYPES:
+    return _ConvertInteger
+  elif cpp_type in _FLOAT_TYPES:
+    return _ConvertFloat
+  elif cpp_type == _FieldDescriptor.CPPTYPE_BOOL:
+    return _ConvertBool
+  elif cpp_type == _FieldDescriptor.CPPTYPE_ENUM:
+    enum_type = field.enum_type
+    def ConvertEnum(value):
+      if isinstance(value, basestring):
+        enum_value = enum_type.values_by_name.get(value)
+        if enum_value is None:
+          raise ParseError('Enum type "%s" has no value named %s.' %
+                           (enum_type.full_name, value))
+        return enum_value.number
+      return _ConvertInteger(value)
+    return ConvertEnum
+  elif field.type == _FieldDescriptor.TYPE_BYTES:
+    return _ConvertBytes
+  else:
+    return _ConvertString
+
+
+def _MapKeyConverter(field):
+  """Returns a function which converts a JSON name to a map key."""
+  if field.cpp_type == _FieldDescriptor.CPPTYPE_BOOL:
+    def ConvertBoolKey(value):
+      if value not in ('true', 'false'):
+        raise ParseError('Expected "true" or "false", got %r.' % value)
+      return value == 'true'
+    return ConvertBoolKey
+  if field.cpp_type == _FieldDescriptor.CPPTYPE_STRING:
+    return _ConvertString
+  return _ConvertInteger
+
+
+def _FieldAccessors(field):
+  """Returns (get, set) functions for field of a message."""
+  if field.is_extension:
+    def GetExtension(message):
+      return message.Extensions[field]
+    def SetExtension(message, value):
+      message.Extensions[field] = value
+    return GetExtension, SetExtension
+  name = field.name
+  return (lambda message: getattr(message, name),
+          lambda message, value: setattr(message, name, value))
+
+
+def _MakeMessageParser(message_descriptor, ignore_unknown_fields):
+  """Returns a function merging a loaded JSON value into a message of one
+  type, which is called with (value, message)."""
+
+  def MessageMerger(message_type):
+    """Returns a function merging a JSON value into a message of type
+    message_type, which is called with (value, message)."""
+    # Looked up on first use, since message types can be recursive.
+    parser = []
+    def MergeMessage(value, message):
+      if not parser:
+        parser.append(_GetMessageParser(message_type, ignore_unknown_fields))
+      parser[0](value, message)
+    return MergeMessage
+
+  def FieldParser(field):
+    """Returns a function merging the JSON value of field into a message."""
+    get, set_value = _FieldAccessors(field)
+    repeated = field.label == _FieldDescriptor.LABEL_REPEATED
+
+    if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      if type_checkers.IsMapEntry(field):
+        entry_type = field.message_type
+        convert_key = _MapKeyConverter(entry_type.fields_by_name['key'])
+        value_field = entry_type.fields_by_name['value']
+        if value_field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+          MergeMessage = MessageMerger(value_field.message_type)
+          def SetMapValue(entry, value):
+            MergeMessage(value, entry.value)
+            entry.value.SetInParent()
+        else:
+          convert_value = _ScalarConverter(value_field)
+          def SetMapValue(entry, value):
+            entry.value = convert_value(value)
+        def ParseMap(message, value):
+          if not isinstance(value, dict):
+            raise ParseError('Expected an object, got %r.' % value)
+          container = get(message)
+          for key, map_value in value.iteritems():
+            entry = container.add()
+            entry.key = convert_key(key)
+            SetMapValue(entry, map_value)
+        return ParseMap
+      MergeMessage = MessageMerger(field.message_type)
+      if repeated:
+        def ParseRepeatedMessage(message, value):
+          if not isinstance(value, list):
+            raise ParseError('Expected an array, got %r.' % value)
+          container = get(message)
+          for element in value:
+            MergeMessage(element, container.add())
+        return ParseRepeatedMessage
+      def ParseSubMessage(message, value):
+        sub_message = get(message)
+        sub_message.SetInParent()
+        MergeMessage(value, sub_message)
+      return ParseSubMessage
+
+    convert = _ScalarConverter(field)
+    if repeated:
+      def ParseRepeatedScalar(message, value):
+        if not isinstance(value, list):
+          raise ParseError('Expected an array, got %r.' % value)
+        get(message).extend([convert(element) for element in value])
+      return ParseRepeatedScalar
+    return lambda message, value: set_value(message, convert(value))
+
+  parsers = {}
+  for field in message_descriptor.fields:
+    field_parser = (field, FieldParser(field))
+    parsers[_JsonName(field.name)] = field_parser
+    parsers[field.name] = field_parser
+
+  def ParseMessage(value, message):
+    if not isinstance(value, dict):
+      raise ParseError('Expected an object for message "%s", got %r.' %
+                       (message_descriptor.full_name, value))
+    for name, field_value in value.iteritems():
+      field_parser = parsers.get(name)
+      if field_parser is None:
+        if (message_descriptor.is_extendable and
+            name.startswith('[') and name.endswith(']')):
+          # pylint: disable=protected-access
+          extension = message.Extensions._FindExtensionByName(name[1:-1])
+          if extension is not None:
+            field_parser = parsers.setdefault(
+                name, (extension, FieldParser(extension)))
+        if field_parser is None:
+          if ignore_unknown_fields:
+            continue
+          raise ParseError('Message type "%s" has no field named "%s".' %
+                           (message_descriptor.full_name, name))
+      if field_value is None:
+        continue
+      try:
+        field_parser[1](message, field_value)
+      except ParseError as e:
+        raise ParseError('Failed to parse %s field: %s' % (name, e))
+      except (TypeError, ValueError) as e:
+        raise ParseError('Failed to parse %s field: %s.' % (name, e))
+  return ParseMessage
@@ -117,6 +117,33 @@ class Message(object):
     self.Clear()
     self.MergeFrom(other_msg)
 
+  def Freeze(self):
+    """Makes the message, and every message and repeated field in it, immutable.
+
+    Any later attempt to modify them raises AttributeError.  A frozen message
+    is hashable, keeps its serialized form, and is shared rather than copied
+    by copy.deepcopy().
+
+    Returns:
+      The message itself.
+    """
+    raise NotImplementedError
+
+  def Fingerprint(self):
+    """Returns a 128-bit fingerprint of the contents of the message.
+
+    Messages of the same type with the same fields and unknown fields have the
+    same fingerprint, in any process and whatever the order in which the fields
+    were set or the unknown fields were parsed, so that it can be used as a
+    cache key.  Fingerprints are cached
+    in each sub-message, and only the sub-messages modified since the last call
+    are hashed again.
+
+    Returns:
+      A non-negative integer below 2**128.
+    """
+    raise NotImplementedError
+
   def Clear(self):
     """Clears all data that was set in the message."""
     raise NotImplementedError
@@ -184,9 +211,14 @@ class Message(object):
     self.Clear()
     self.MergeFromString(serialized)
 
-  def SerializeToString(self):
+  def SerializeToString(self, deterministic=False):
     """Serializes the protocol message to a binary string.
 
+    Args:
+      deterministic: If true, fields, extensions and unknown fields are all
+        written in field number order, in sub-messages too, so that equal
+        messages serialize to the same bytes however they were built.
+
     Returns:
       A binary string representation of the message if all of the required
       fields in the message are set (i.e. the message is initialized).
@@ -196,12 +228,15 @@ class Message(object):
     """
     raise NotImplementedError
 
-  def SerializePartialToString(self):
+  def SerializePartialToString(self, deterministic=False):
     """Serializes the protocol message to a binary string.
 
     This method is similar to SerializeToString but doesn't check if the
     message is initialized.
 
+    Args:
+      deterministic: See SerializeToString().
+
     Returns:
       A string representation of the partial message.
     """
@@ -243,6 +278,14 @@ class Message(object):
     ValueError is raised."""
     raise NotImplementedError
 
+  def ReleaseField(self, field_name):
+    """Clears a singular message field and returns the sub-message it held,
+    or None if the field was not set.  The sub-message is not copied, and no
+    longer belongs to this message, so that it can be added to another one
+    with AddAllocated().  ValueError is raised if the name does not refer to
+    a singular message field."""
+    raise NotImplementedError
+
   def WhichOneof(self, oneof_group):
     """Returns the name of the field that is set inside a oneof group, or
     None if no field is set.  If no group with the given name exists, ValueError
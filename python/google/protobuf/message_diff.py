@@ -0,0 +1,357 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# https://developers.google.com/protocol-buffers/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Computes and applies field-level differences between messages.
+
+Diff() compares two messages of the same type and returns a MessagePatch
+holding the operations that turn the first into the second;  ApplyPatch()
+carries them out.  A MessagePatch is itself a protocol message, so it can be
+sent instead of the whole new message when only part of it changed.
+
+Each operation names a field by its path from the message:  the numbers of
+the fields leading to it, with the number of a repeated field followed by the
+index of the element the path goes through.  The operations are:
+  SET:  the field is cleared, then value, the field as serialized in its
+    message, is merged into the message.
+  CLEAR:  the field is cleared.
+  SPLICE:  count elements of the repeated field are replaced, from index
+    start, by the elements serialized in value.
+Sub-messages present in both messages are compared field by field, and so are
+elements of repeated message fields when only some of them changed.  Unknown
+fields are not compared.
+
+With the pure Python implementation, unchanged sub-messages are recognized by
+their Fingerprint(), which is cached, so that diffing a large message against
+a copy with a few changes only looks at the changed paths.
+"""
+
+import struct
+
+from google.protobuf.internal import api_implementation
+from google.protobuf import descriptor
+from google.protobuf import descriptor_pb2
+from google.protobuf import message_factory
+
+__all__ = ['MessagePatch', 'Diff', 'ApplyPatch']
+
+_FieldDescriptor = descriptor.FieldDescriptor
+
+# Fingerprint() and _ListFields() only exist in the pure Python implementation.
+_PURE_PYTHON = api_implementation.Type() != 'cpp'
+
+
+def _MakeMessagePatchClass():
+  """Returns the class of MessagePatch, built from its descriptor."""
+  file_proto = descriptor_pb2.FileDescriptorProto()
+  file_proto.name = 'google/protobuf/message_patch.proto'
+  file_proto.package = 'google.protobuf'
+  patch_proto = file_proto.message_type.add()
+  patch_proto.name = 'MessagePatch'
+  operation_field = patch_proto.field.add()
+  operation_field.name = 'operation'
+  operation_field.number = 1
+  operation_field.label = _FieldDescriptor.LABEL_REPEATED
+  operation_field.type = _FieldDescriptor.TYPE_MESSAGE
+  operation_field.type_name = '.google.protobuf.MessagePatch.Operation'
+
+  operation_proto = patch_proto.nested_type.add()
+  operation_proto.name = 'Operation'
+  kind_proto = operation_proto.enum_type.add()
+  kind_proto.name = 'Kind'
+  for number, name in enumerate(['SET', 'CLEAR', 'SPLICE']):
+    kind_proto.value.add(name=name, number=number)
+  path_proto = operation_proto.field.add(
+      name='path', number=1, label=_FieldDescriptor.LABEL_REPEATED,
+      type=_FieldDescriptor.TYPE_INT32)
+  path_proto.options.packed = True
+  # The default values are spelled out, since DescriptorPool does not give
+  # fields without one the default value of their type.
+  for number, (name, field_type, default_value) in enumerate([
+      ('kind', _FieldDescriptor.TYPE_ENUM, 'SET'),
+      ('value', _FieldDescriptor.TYPE_BYTES, ''),
+      ('start', _FieldDescriptor.TYPE_INT32, '0'),
+      ('count', _FieldDescriptor.TYPE_INT32, '0'),
+      ], 2):
+    field_proto = operation_proto.field.add(
+        name=name, number=number, label=_FieldDescriptor.LABEL_OPTIONAL,
+        type=field_type, default_value=default_value)
+    if field_type == _FieldDescriptor.TYPE_ENUM:
+      field_proto.type_name = '.google.protobuf.MessagePatch.Operation.Kind'
+
+  factory = message_factory.MessageFactory()
+  factory.pool.Add(file_proto)
+  patch_class = factory.GetPrototype(
+      factory.pool.FindMessageTypeByName('google.protobuf.MessagePatch'))
+  # Like in generated code, nested types are attributes of their parent.
+  patch_class.Operation = factory.GetPrototype(
+      patch_class.DESCRIPTOR.nested_types_by_name['Operation'])
+  return patch_class
+
+
+MessagePatch = _MakeMessagePatchClass()
+_Operation = MessagePatch.Operation
+
+
+def Diff(old, new):
+  """Returns the changes that turn one message into another.
+
+  Args:
+    old: The message to start from.
+    new: A message of the same type.
+
+  Returns:
+    A MessagePatch which, given to ApplyPatch() with a message equal to old,
+    makes it equal to new.  It has no operations if the messages are equal.
+
+  Raises:
+    TypeError: if the messages are not of the same type.
+  """
+  if old.DESCRIPTOR is not new.DESCRIPTOR:
+    raise TypeError('Cannot diff a %s message against a %s message.' %
+                    (old.DESCRIPTOR.full_name, new.DESCRIPTOR.full_name))
+  patch = MessagePatch()
+  if not _SameMessages(old, new):
+    _DiffMessages(old, new, [], patch.operation)
+  return patch
+
+
+def ApplyPatch(message, patch):
+  """Applies the changes of a patch returned by Diff() to a message.
+
+  Args:
+    message: The message to change, of the type the patch was made for.
+    patch: A MessagePatch.
+
+  Returns:
+    The message.
+
+  Raises:
+    ValueError: if a path does not lead to a field of the message.
+  """
+  for operation in patch.operation:
+    parent, field = _FindField(message, operation.path)
+    if operation.kind == _Operation.SPLICE:
+      if field.label != _FieldDescriptor.LABEL_REPEATED:
+        raise ValueError('Cannot splice non-repeated field %s.' %
+                         field.full_name)
+      source = parent.__class__()
+      source.MergeFromString(operation.value)
+      _Splice(field, _GetField(parent, field), operation.start,
+              operation.count, _GetField(source, field))
+    else:
+      if field.is_extension:
+        parent.ClearExtension(field)
+      else:
+        parent.ClearField(field.name)
+      if operation.kind == _Operation.SET:
+        parent.MergeFromString(operation.value)
+  return message
+
+
+def _GetField(message, field):
+  if field.is_extension:
+    return message.Extensions[field]
+  return getattr(message, field.name)
+
+
+def _ListFields(message):
+  """Returns ListFields() of message, as a list which must not be modified.
+
+  In the pure Python implementation, ListFields() on a copy of a message first
+  replaces the values it shares with that message by values of its own, see
+  python_message._SharedFields.  Diffing only reads them, so it leaves them
+  shared, and values which are still the same objects are not looked into.
+  """
+  if _PURE_PYTHON:
+    return message._ListFields()
+  return message.ListFields()
+
+
+def _SameMessages(old, new):
+  if old is new:
+    return True
+  if _PURE_PYTHON:
+    return old.Fingerprint() == new.Fingerprint()
+  return old == new
+
+
+def _SameValues(old, new):
+  return old == new
+
+
+def _SameFloats(old, new):
+  # Unlike ==, tells 0.0 from -0.0, and NaN from any other value.
+  return struct.pack('<d', old) == struct.pack('<d', new)
+
+
+def _SameFunction(field):
+  """Returns the function that tells whether two values of field are equal."""
+  if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+    return _SameMessages
+  if field.cpp_type in (_FieldDescriptor.CPPTYPE_FLOAT,
+                        _FieldDescriptor.CPPTYPE_DOUBLE):
+    return _SameFloats
+  return _SameValues
+
+
+def _EncodeField(message_class, field, value):
+  """Returns the serialization of a message holding only value in field."""
+  message = message_class()
+  if field.label == _FieldDescriptor.LABEL_REPEATED:
+    _GetField(message, field).extend(value)
+  elif field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+    sub_message = _GetField(message, field)
+    sub_message.SetInParent()
+    sub_message.MergeFrom(value)
+  elif field.is_extension:
+    message.Extensions[field] = value
+  else:
+    setattr(message, field.name, value)
+  return message.SerializePartialToString()
+
+
+def _DiffMessages(old, new, path, operations):
+  """Adds the operations that turn old into new to operations.
+
+  Args:
+    old: A message.
+    new: A message of the same type which is not equal to old.
+    path: The path of old and new from the messages given to Diff().
+    operations: The operation field of the MessagePatch being built.
+  """
+  old_fields = dict(_ListFields(old))
+  new_fields = _ListFields(new)
+  # Clearing fields first keeps them from clearing a member of the same oneof
+  # that is set afterwards.
+  new_field_set = set(field for field, _ in new_fields)
+  for field, _ in _ListFields(old):
+    if field not in new_field_set:
+      operations.add(path=path + [field.number], kind=_Operation.CLEAR)
+
+  for field, new_value in new_fields:
+    field_path = path + [field.number]
+    if field not in old_fields:
+      if field.label == _FieldDescriptor.LABEL_REPEATED:
+        operations.add(path=field_path, kind=_Operation.SPLICE,
+                       value=_EncodeField(new.__class__, field, new_value))
+      else:
+        operations.add(path=field_path, kind=_Operation.SET,
+                       value=_EncodeField(new.__class__, field, new_value))
+      continue
+    old_value = old_fields[field]
+    same = _SameFunction(field)
+    if field.label == _FieldDescriptor.LABEL_REPEATED:
+      _DiffRepeated(old_value, new_value, new.__class__, field, same,
+                    field_path, operations)
+    elif same(old_value, new_value):
+      continue
+    elif field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      _DiffMessages(old_value, new_value, field_path, operations)
+    else:
+      operations.add(path=field_path, kind=_Operation.SET,
+                     value=_EncodeField(new.__class__, field, new_value))
+
+
+def _DiffRepeated(old, new, message_class, field, same, path, operations):
+  """Like _DiffMessages(), for the values of repeated field."""
+  old_len = len(old)
+  new_len = len(new)
+  common_len = min(old_len, new_len)
+  prefix_len = 0
+  while prefix_len < common_len and same(old[prefix_len], new[prefix_len]):
+    prefix_len += 1
+  suffix_len = 0
+  while (suffix_len < common_len - prefix_len and
+         same(old[old_len - suffix_len - 1], new[new_len - suffix_len - 1])):
+    suffix_len += 1
+  old_end = old_len - suffix_len
+  new_end = new_len - suffix_len
+  if (field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE and
+      old_end == new_end):
+    # The same number of elements changed in place, which are diffed in turn
+    # rather than sent whole.
+    for index in range(prefix_len, old_end):
+      if not same(old[index], new[index]):
+        _DiffMessages(old[index], new[index], path + [index], operations)
+  elif prefix_len < old_end or prefix_len < new_end:
+    operations.add(
+        path=path, kind=_Operation.SPLICE, start=prefix_len,
+        count=old_end - prefix_len,
+        value=_EncodeField(message_class, field, new[prefix_len:new_end]))
+
+
+def _FindField(message, path):
+  """Returns the message holding the field a path leads to, and the field."""
+  if not path:
+    raise ValueError('Empty path in patch.')
+  index = 0
+  while True:
+    number = path[index]
+    field = (message.DESCRIPTOR.fields_by_number.get(number) or
+             message._extensions_by_number.get(number))
+    if field is None:
+      raise ValueError('Protocol message %s has no field number %d.' %
+                       (message.DESCRIPTOR.full_name, number))
+    index += 1
+    if index == len(path):
+      return message, field
+    if field.cpp_type != _FieldDescriptor.CPPTYPE_MESSAGE:
+      raise ValueError('Path goes through field %s, which is not a message.' %
+                       field.full_name)
+    value = _GetField(message, field)
+    if field.label == _FieldDescriptor.LABEL_REPEATED:
+      element = path[index]
+      if not 0 <= element < len(value):
+        raise ValueError('Path goes through element %d of field %s, which '
+                         'has %d.' % (element, field.full_name, len(value)))
+      value = value[element]
+      index += 1
+      if index == len(path):
+        raise ValueError('Path ends with an element of field %s.' %
+                         field.full_name)
+    message = value
+
+
+def _Splice(field, values, start, count, new_values):
+  """Replaces count elements of repeated field values from start by
+  new_values, the same field of another message.
+  """
+  if not 0 <= start <= start + count <= len(values):
+    raise ValueError('Cannot splice %d elements from %d in a field of %d.' %
+                     (count, start, len(values)))
+  if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+    # Repeated message fields cannot insert elements in the middle, so the
+    # elements after the spliced ones are added again.
+    kept = values[start + count:]
+    del values[start:]
+    values.MergeFrom(new_values)
+    values.extend(kept)
+  else:
+    values[start:start + count] = new_values
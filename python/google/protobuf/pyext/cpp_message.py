@@ -55,3 +55,9 @@ def NewMessage(bases, message_descriptor, dictionary):
 def InitMessage(message_descriptor, cls):
   """Finalizes the creation of a message class."""
   cls.AddDescriptors(message_descriptor)
+
+
+def GetLazyAttribute(cls, name):
+  """Classes are complete once InitMessage() returns, so name is missing."""
+  raise AttributeError(
+      'type object %r has no attribute %r' % (cls.__name__, name))
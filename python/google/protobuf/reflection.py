@@ -62,6 +62,7 @@ else:
 
 _NewMessage = message_impl.NewMessage
 _InitMessage = message_impl.InitMessage
+_GetLazyAttribute = message_impl.GetLazyAttribute
 
 
 class GeneratedProtocolMessageType(type):
@@ -146,6 +147,14 @@ class GeneratedProtocolMessageType(type):
     superclass.__init__(name, bases, dictionary)
     setattr(descriptor, '_concrete_class', cls)
 
+  def __getattr__(cls, name):
+    """Looks up an attribute cls does not have.
+
+    The implementation can put off adding some attributes until the class is
+    used, see python_message.InitMessage().  Those are added now.
+    """
+    return _GetLazyAttribute(cls, name)
+
 
 def ParseMessage(descriptor, byte_str):
   """Generate a new Message instance from this Descriptor and a byte string.